@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# Сквозной замер рассылки: уведомления добавляются во временную базу, бот
+# (create_updater и поток рассылки) отправляет их в FakeBotApi, после чего
+# имитируются нажатия кнопок пагинации группы.
+# Замеряется:
+#  * задержка от вставки уведомления до получения sendMessage (p50/p90/p99)
+#  * сообщений в секунду от первой вставки до последней доставки
+#  * задержка от callback'а до editMessageText
+#
+# Ошибки Bot API включаются через --retry-after-rate, --server-error-rate
+# и --not-modified-rate. Ограничения скорости отправки отключаются через
+# --no-rate-limit, чтобы замерять накладные расходы самого бота.
+#
+# Запуск: TOKEN=123:fake python e2e.py [--number 1000] [--chats 10] [--latency 0.05]
+
+
+import argparse
+import re
+import tempfile
+import time
+
+from pathlib import Path
+from threading import Thread
+
+from telegram_notifications_bot.db import Notification, NotificationGroup
+from telegram_notifications_bot.bot import main as bot_main
+from telegram_notifications_bot.bot.rate_limiter import RateLimiter
+from telegram_notifications_bot.bot.regexp_patterns import (
+    PATTERN_NOTIFICATION_PAGE,
+    fill_string_pattern,
+)
+from telegram_notifications_bot.tools.fake_bot_api import FakeBotApi
+
+from utils import bind_temp_db, percentile
+
+
+PATTERN_NAME = re.compile(r"e2e #(\d+)")
+
+GROUP_SIZE: int = 5
+TIMEOUT_SECONDS: float = 300
+
+
+def get_delivered(server: FakeBotApi) -> dict[int, float]:
+    """
+    Функция возвращает время первой успешной доставки по номеру уведомления
+    """
+
+    delivered = dict()
+    for request in server.get_requests("sendMessage"):
+        if request.status != 200:
+            continue
+
+        m = PATTERN_NAME.search(request.params.get("text", ""))
+        if m:
+            delivered.setdefault(int(m.group(1)), request.time)
+
+    return delivered
+
+
+def measure_delivery(
+    server: FakeBotApi,
+    number: int,
+    chats: int,
+    rate: float,
+) -> None:
+    inserted = dict()
+    for i in range(number):
+        inserted[i] = time.perf_counter()
+        Notification.add(chat_id=1000 + i % chats, name=f"e2e #{i}", message="e2e")
+
+        if rate:
+            time.sleep(1 / rate)
+
+    deadline = time.monotonic() + TIMEOUT_SECONDS
+    while True:
+        delivered = get_delivered(server)
+        if len(delivered) >= number or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+
+    print(f"Доставлено: {len(delivered)} из {number}")
+    if not delivered:
+        return
+
+    latencies = [
+        (delivered[i] - t) * 1000 for i, t in inserted.items() if i in delivered
+    ]
+    elapsed = max(delivered.values()) - min(inserted.values())
+
+    print(
+        f"    Задержка: p50={percentile(latencies, 50):.1f}ms, "
+        f"p90={percentile(latencies, 90):.1f}ms, "
+        f"p99={percentile(latencies, 99):.1f}ms"
+    )
+    print(f"    Сообщений в секунду: {len(delivered) / elapsed:.1f}")
+
+
+def measure_callbacks(server: FakeBotApi, number: int) -> None:
+    group = NotificationGroup.create(name="e2e group", max_number=GROUP_SIZE)
+    for i in range(GROUP_SIZE):
+        Notification.add(
+            chat_id=1, name=f"e2e group {i + 1}", message="e2e", group=group
+        )
+
+    # Первое уведомление группы с пагинацией
+    deadline = time.monotonic() + TIMEOUT_SECONDS
+    while True:
+        message = next(
+            (
+                r.result
+                for r in server.get_requests("sendMessage")
+                if r.result and "e2e group" in r.result["text"]
+            ),
+            None,
+        )
+        if message or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+
+    if not message:
+        print("Группа не доставлена")
+        return
+
+    latencies = []
+    for i in range(number):
+        # Страницы перебираются по кругу, начиная со второй
+        page = (i + 1) % GROUP_SIZE + 1
+        edits = len(server.get_requests("editMessageText"))
+
+        t = time.perf_counter()
+        server.put_update(
+            {
+                "callback_query": {
+                    "id": str(i),
+                    "from": {"id": 1, "is_bot": False, "first_name": "User"},
+                    "chat_instance": "1",
+                    "message": message,
+                    "data": fill_string_pattern(
+                        PATTERN_NOTIFICATION_PAGE, page, group.id
+                    ),
+                }
+            }
+        )
+        requests = server.wait_requests("editMessageText", edits + 1, timeout=10)
+        if len(requests) > edits:
+            latencies.append((requests[edits].time - t) * 1000)
+
+    print(f"Callback'ов: {len(latencies)} из {number}")
+    print(
+        f"    Задержка: p50={percentile(latencies, 50):.1f}ms, "
+        f"p90={percentile(latencies, 90):.1f}ms, "
+        f"p99={percentile(latencies, 99):.1f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Уведомлений в секунду, 0 - без пауз"
+    )
+    parser.add_argument("--callbacks", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="В секундах")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--not-modified-rate", type=float, default=0.0)
+    parser.add_argument("--no-rate-limit", action="store_true")
+    args = parser.parse_args()
+
+    if args.no_rate_limit:
+        bot_main.RATE_LIMITER = RateLimiter(
+            global_rate=1_000_000,
+            global_burst=1_000_000,
+            chat_rate=1_000_000,
+            chat_burst=1_000_000,
+            log=bot_main.log,
+        )
+
+    server = FakeBotApi(
+        latency=args.latency,
+        retry_after_rate=args.retry_after_rate,
+        server_error_rate=args.server_error_rate,
+        not_modified_rate=args.not_modified_rate,
+        seed=42,
+    )
+
+    with server, tempfile.TemporaryDirectory() as temp_dir:
+        bind_temp_db(Path(temp_dir) / "database.sqlite")
+
+        updater = bot_main.create_updater(base_url=server.base_url)
+        updater.start_polling(poll_interval=0, timeout=1)
+        Thread(target=bot_main.sending_notifications, daemon=True).start()
+
+        try:
+            measure_delivery(server, args.number, args.chats, args.rate)
+            measure_callbacks(server, args.callbacks)
+        finally:
+            updater.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# Стоимость построения клавиатуры пагинации на один callback:
+#  * paginator - новый InlineKeyboardPaginator на каждый callback (как раньше)
+#  * cached - get_paginator_markup с кэшем разметки
+#
+# Callback'и имитируют листание: случайные страницы групп и поисков разного размера.
+#
+# Запуск: TOKEN=... python paginator.py
+
+
+import random
+import timeit
+
+from telegram import InlineKeyboardButton
+
+from telegram_notifications_bot.bot.markup import (
+    get_paginator_markup,
+    _get_paginator_markup,
+)
+from telegram_notifications_bot.third_party.telegram_bot_pagination import (
+    InlineKeyboardPaginator,
+)
+
+
+NUMBER: int = 100_000
+
+BUTTONS: list[InlineKeyboardButton] = [
+    InlineKeyboardButton("🔗 Открыть ссылку", url="https://example.com"),
+    InlineKeyboardButton("❌ Удалить", callback_data="delete_message"),
+]
+
+
+def generate_callbacks(number: int) -> list[tuple[int, int, str]]:
+    rnd = random.Random(42)
+
+    callbacks = []
+    for _ in range(number):
+        # 20 групп/поисков от 2 до 40 уведомлений
+        idx = rnd.randrange(20)
+        page_count = 2 + idx * 2
+        current_page = rnd.randint(1, page_count)
+        callbacks.append((page_count, current_page, f"page={{page}}, group={idx}"))
+
+    return callbacks
+
+
+def build_paginator(page_count: int, current_page: int, data_pattern: str) -> str:
+    paginator = InlineKeyboardPaginator(
+        page_count=page_count,
+        current_page=current_page,
+        data_pattern=data_pattern,
+    )
+    paginator.add_before(*BUTTONS)
+    return paginator.markup
+
+
+def build_cached(page_count: int, current_page: int, data_pattern: str) -> str:
+    return get_paginator_markup(
+        page_count=page_count,
+        current_page=current_page,
+        data_pattern=data_pattern,
+        buttons=BUTTONS,
+    )
+
+
+def main() -> None:
+    callbacks = generate_callbacks(NUMBER)
+
+    print(f"Callback'ов: {NUMBER}")
+    for name, func in [("paginator", build_paginator), ("cached", build_cached)]:
+        elapsed = timeit.timeit(
+            lambda: [func(*callback) for callback in callbacks],
+            number=1,
+        )
+        print(f"    {name}: {elapsed / NUMBER * 1_000_000:.2f}us на callback")
+
+    info = _get_paginator_markup.cache_info()
+    print(f"Попаданий в кэш: {info.hits / (info.hits + info.misses):.1%}")
+
+
+if __name__ == "__main__":
+    main()
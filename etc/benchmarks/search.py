@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# Сравнение поиска уведомлений:
+#  * scan - проверка каждой записи функцией REGEXP (как раньше для любого запроса)
+#  * search - Notification.search: обычный текст ищется через полнотекстовый
+#    индекс FTS5 (токенизатор trigram), а у регулярных выражений сначала
+#    проверяются обязательные подстроки и только затем REGEXP
+#
+# Для каждого режима выводится время поиска и количество вызовов REGEXP.
+#
+# Запуск: TOKEN=... python search.py [--rows 100000 1000000]
+
+
+import argparse
+import random
+import string
+import tempfile
+
+from pathlib import Path
+
+from peewee import chunked
+
+from telegram_notifications_bot.db import Notification, FTS_IS_AVAILABLE, regexp
+
+from utils import bind_temp_db, timer
+
+
+QUERIES: list[str] = [
+    "ошибка",
+    "timeout",
+    "Backup 2024-05",
+    "not-existing-text",
+    r"backup\s+2024-0[1-5]",
+    r"сервер \d+",
+    r"(deploy|release) 2025",
+]
+NUMBER: int = 5
+
+WORDS: list[str] = [
+    "ошибка",
+    "успешно",
+    "сборка",
+    "backup",
+    "deploy",
+    "timeout",
+    "сервер",
+    "проверка",
+    "release",
+    "уведомление",
+]
+
+
+def generate_rows(number: int) -> list[dict]:
+    rnd = random.Random(42)
+
+    def get_text(words: int) -> str:
+        items = rnd.choices(WORDS, k=words)
+        items.append("".join(rnd.choices(string.ascii_letters, k=8)))
+        items.append(f"{rnd.randint(2020, 2025)}-{rnd.randint(1, 12):02}")
+        rnd.shuffle(items)
+        return " ".join(items)
+
+    return [
+        dict(chat_id=1, name=get_text(2), message=get_text(15))
+        for _ in range(number)
+    ]
+
+
+def fill(number: int) -> None:
+    database = Notification._meta.database
+    with database.atomic():
+        for batch in chunked(generate_rows(number), 1000):
+            Notification.insert_many(batch).execute()
+
+
+def scan(regex: str) -> list[int]:
+    expr = (Notification.name + " " + Notification.message).regexp(f"(?i){regex}")
+    query = Notification.select(Notification.id).where(expr).order_by(Notification.id)
+    return [obj.id for obj in query]
+
+
+def search(regex: str) -> list[int]:
+    _, ids = Notification.search(regex)
+    return ids
+
+
+def run(rows: int) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        test_db = bind_temp_db(Path(temp_dir) / "database.sqlite")
+
+        number_of_calls = 0
+
+        def regexp_with_counter(pattern: str, value: str) -> bool:
+            nonlocal number_of_calls
+            number_of_calls += 1
+            return regexp(pattern, value)
+
+        test_db.register_function(regexp_with_counter, "regexp", 2)
+
+        with timer() as t:
+            fill(rows)
+        print(f"Записей: {rows}, заполнение: {t['elapsed']:.1f}s")
+
+        for query in QUERIES:
+            results = dict()
+            for name, func in [("scan", scan), ("search", search)]:
+                number_of_calls = 0
+                with timer() as t:
+                    for _ in range(NUMBER):
+                        ids = func(query)
+                results[name] = (t["elapsed"] / NUMBER, number_of_calls // NUMBER, ids)
+
+            scan_elapsed, scan_calls, scan_ids = results["scan"]
+            search_elapsed, search_calls, search_ids = results["search"]
+            assert scan_ids == search_ids
+
+            print(
+                f"    {query!r} (найдено {len(search_ids)}): "
+                f"scan={scan_elapsed * 1000:.1f}ms ({scan_calls} REGEXP), "
+                f"search={search_elapsed * 1000:.1f}ms ({search_calls} REGEXP), "
+                f"x{scan_elapsed / search_elapsed:.1f}"
+            )
+        print()
+
+
+def main() -> None:
+    if not FTS_IS_AVAILABLE:
+        print("SQLite не поддерживает FTS5 с токенизатором trigram")
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        run(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# Сравнение ожидания новых уведомлений в потоке рассылки:
+#  * spin 1ms - старый цикл ожидания бота и паузы (time.sleep(0.001))
+#  * poll 1s - старый цикл рассылки (get_unsent раз в секунду)
+#  * watcher - ожидание через DataChangeWatcher (PRAGMA data_version)
+#
+# Замеряется нагрузка на процессор в простое и задержка от вставки до
+# обнаружения уведомления, вставка выполняется из отдельного процесса.
+#
+# Запуск: TOKEN=... python sender_wakeup.py
+
+
+import argparse
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from threading import Thread
+from typing import Callable
+
+from telegram_notifications_bot.db import Notification, DataChangeWatcher
+
+from utils import bind_temp_db, percentile
+
+
+IDLE_SECONDS: float = 3.0
+NUMBER: int = 20
+
+
+def measure_idle_cpu(wait_func: Callable[[], None], seconds: float) -> float:
+    """
+    Функция возвращает долю процессорного времени, потраченного потоком в простое
+    """
+
+    result = dict()
+
+    def run() -> None:
+        started = time.monotonic()
+        cpu_started = time.thread_time()
+        while time.monotonic() - started < seconds:
+            wait_func()
+        result["cpu"] = time.thread_time() - cpu_started
+
+    thread = Thread(target=run)
+    thread.start()
+    thread.join()
+
+    return result["cpu"] / seconds
+
+
+def produce(db_path: str, number: int) -> None:
+    bind_temp_db(db_path)
+
+    for _ in range(number):
+        time.sleep(random.uniform(0.05, 0.2))
+        Notification.add(chat_id=1, name="bench", message=repr(time.time()))
+
+
+def consume(wait_func: Callable[[], None], number: int) -> list[float]:
+    latencies = []
+    while len(latencies) < number:
+        wait_func()
+
+        for notify in Notification.get_unsent():
+            latencies.append(time.time() - float(notify.message))
+            Notification.update(sending_datetime=notify.append_datetime).where(
+                Notification.id == notify.id
+            ).execute()
+
+    return latencies
+
+
+def run_latency(db_path: str, wait_func: Callable[[], None]) -> list[float]:
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--produce", db_path, str(NUMBER)]
+    )
+    try:
+        return consume(wait_func, NUMBER)
+    finally:
+        process.wait()
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = str(Path(temp_dir) / "database.sqlite")
+        bind_temp_db(db_path)
+
+        def poll() -> None:
+            time.sleep(1)
+            Notification.get_unsent()
+
+        watcher = DataChangeWatcher(Notification)
+
+        print("Idle CPU (доля процессорного времени одного ядра):")
+        print(f"    spin 1ms: {measure_idle_cpu(lambda: time.sleep(0.001), IDLE_SECONDS):.2%}")
+        print(f"    poll 1s: {measure_idle_cpu(poll, IDLE_SECONDS):.2%}")
+        print(
+            f"    watcher: {measure_idle_cpu(lambda: watcher.wait(timeout=1), IDLE_SECONDS):.2%}"
+        )
+        print()
+
+        print(f"Задержка от вставки до обнаружения ({NUMBER} уведомлений):")
+        for name, wait_func in [
+            ("poll 1s", lambda: time.sleep(1)),
+            ("watcher", watcher.wait),
+        ]:
+            latencies = run_latency(db_path, wait_func)
+            print(
+                f"    {name}: "
+                f"p50={percentile(latencies, 50) * 1000:.1f}ms, "
+                f"p99={percentile(latencies, 99) * 1000:.1f}ms, "
+                f"max={max(latencies) * 1000:.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--produce", nargs=2, metavar=("DB_PATH", "NUMBER"))
+    args = parser.parse_args()
+
+    if args.produce:
+        db_path, number = args.produce
+        produce(db_path, int(number))
+        sys.exit()
+
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# Набор замеров горячих путей хранения и отрисовки на временной базе
+# с 10k, 100k и 1M уведомлений:
+#  * add, add_to_group - Notification.add
+#  * get_unsent - выборка неотправленных (1% базы)
+#  * search - Notification.search по обычному тексту и регулярным выражениям
+#  * get_by_search - страница сохраненного поиска
+#  * get_html_cold, get_html_warm - отрисовка HTML без кэша и с кэшем
+#  * group_is_complete - проверка заполненности группы
+#  * paginator_markup - InlineKeyboardPaginator.markup и get_paginator_markup
+#
+# Результаты (время одного вызова в микросекундах) сохраняются в JSON, чтобы
+# сравнивать их между коммитами: с --compare выводится отношение к прошлому замеру.
+#
+# Запуск: TOKEN=... python suite.py [--rows 10000 100000] [--output result.json]
+#   [--compare old.json]
+
+
+import argparse
+import datetime as dt
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Any, Callable
+
+from peewee import chunked
+
+from telegram import InlineKeyboardButton
+
+from telegram_notifications_bot import db
+from telegram_notifications_bot.db import Notification, NotificationGroup
+from telegram_notifications_bot.bot.markup import get_paginator_markup
+from telegram_notifications_bot.third_party.telegram_bot_pagination import (
+    InlineKeyboardPaginator,
+)
+
+from search import QUERIES, generate_rows
+from utils import bind_temp_db, percentile, timer
+
+
+ROWS: list[int] = [10_000, 100_000, 1_000_000]
+
+# Каждое GROUP_STEP-е уведомление попадает в группу из GROUP_SIZE уведомлений
+GROUP_STEP: int = 100
+GROUP_SIZE: int = 5
+
+# Доля неотправленных уведомлений
+UNSENT_STEP: int = 100
+
+# Порог замедления относительно прошлого замера, после которого оно выделяется
+REGRESSION_RATIO: float = 1.2
+
+BUTTONS: list[InlineKeyboardButton] = [
+    InlineKeyboardButton("🔗 Открыть ссылку", url="https://example.com"),
+    InlineKeyboardButton("❌ Удалить", callback_data="delete_message"),
+]
+
+
+def measure(func: Callable[[], Any], number: int) -> dict[str, float]:
+    """
+    Функция вызывает func number раз и возвращает статистику времени вызова в мкс
+    """
+
+    times = []
+    for _ in range(number):
+        t = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t) * 1_000_000)
+
+    return {
+        "number": number,
+        "mean_us": statistics.fmean(times),
+        "median_us": statistics.median(times),
+        "p95_us": percentile(times, 95),
+    }
+
+
+def fill(rows: int) -> list[NotificationGroup]:
+    """
+    Функция заполняет базу: почти все уведомления отправлены,
+    часть уведомлений объединена в отправленные группы
+    """
+
+    sending_datetime = dt.datetime.now()
+    groups = []
+
+    database = Notification._meta.database
+    with database.atomic():
+        # У всех строк должны быть одинаковые поля, т.к. insert_many берет их из первой
+        items = generate_rows(rows)
+        for i, item in enumerate(items):
+            item["sending_datetime"] = sending_datetime if i % UNSENT_STEP else None
+            item["group"] = None
+
+        for i in range(0, len(items), GROUP_STEP):
+            group = NotificationGroup.create(name=f"group {i}", max_number=GROUP_SIZE)
+            groups.append(group)
+
+            for item in items[i : i + GROUP_SIZE]:
+                item["group"] = group.id
+
+        for batch in chunked(items, 1000):
+            Notification.insert_many(batch).execute()
+
+    return groups
+
+
+def run(rows: int) -> dict[str, dict[str, float]]:
+    rnd = random.Random(42)
+    results = dict()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bind_temp_db(Path(temp_dir) / "database.sqlite")
+
+        with timer() as t:
+            groups = fill(rows)
+        print(f"Записей: {rows}, заполнение: {t['elapsed']:.1f}s")
+
+        ids = [rnd.randint(1, rows) for _ in range(1000)]
+
+        results["add"] = measure(
+            lambda: Notification.add(chat_id=1, name="bench", message="message"),
+            number=1000,
+        )
+
+        new_groups = iter(
+            [
+                NotificationGroup.create(name=f"bench {i}", max_number=GROUP_SIZE)
+                for i in range(1000)
+            ]
+        )
+        results["add_to_group"] = measure(
+            lambda: Notification.add(
+                chat_id=1, name="bench", message="message", group=next(new_groups)
+            ),
+            number=1000,
+        )
+
+        results["get_unsent"] = measure(Notification.get_unsent, number=5)
+
+        searches = []
+        for query in QUERIES:
+            results[f"search {query!r}"] = measure(
+                lambda: Notification.search(query), number=5
+            )
+
+            search, search_ids = Notification.search(query)
+            if search:
+                searches.append((search, len(search_ids)))
+
+        def get_by_search() -> None:
+            search, total = rnd.choice(searches)
+            Notification.get_by_search(search, page=rnd.randint(1, total))
+
+        results["get_by_search"] = measure(get_by_search, number=1000)
+
+        notifications = [Notification.get_with_group(id) for id in ids]
+
+        def get_html_cold() -> None:
+            notify = rnd.choice(notifications)
+            db.HTML_CACHE.pop(notify.id)
+            notify.get_html()
+
+        results["get_html_cold"] = measure(get_html_cold, number=10_000)
+
+        for notify in notifications:
+            notify.get_html()
+        results["get_html_warm"] = measure(
+            lambda: rnd.choice(notifications).get_html(), number=10_000
+        )
+
+        results["group_is_complete"] = measure(
+            lambda: rnd.choice(groups).is_complete(), number=1000
+        )
+
+    def get_page_args() -> tuple[int, int, str]:
+        idx = rnd.randrange(20)
+        page_count = 2 + idx * 2
+        return page_count, rnd.randint(1, page_count), f"page={{page}}, group={idx}"
+
+    def paginator_markup() -> None:
+        page_count, current_page, data_pattern = get_page_args()
+        paginator = InlineKeyboardPaginator(
+            page_count=page_count,
+            current_page=current_page,
+            data_pattern=data_pattern,
+        )
+        paginator.add_before(*BUTTONS)
+        paginator.markup
+
+    results["paginator_markup"] = measure(paginator_markup, number=10_000)
+
+    def paginator_markup_cached() -> None:
+        page_count, current_page, data_pattern = get_page_args()
+        get_paginator_markup(
+            page_count=page_count,
+            current_page=current_page,
+            data_pattern=data_pattern,
+            buttons=BUTTONS,
+        )
+
+    results["paginator_markup_cached"] = measure(
+        paginator_markup_cached, number=10_000
+    )
+
+    for name, value in results.items():
+        print(
+            f"    {name}: median={value['median_us']:.1f}us, "
+            f"p95={value['p95_us']:.1f}us"
+        )
+    print()
+
+    return results
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except Exception:
+        return
+
+
+def compare(results: dict[str, Any], old_results: dict[str, Any]) -> None:
+    print(f"Сравнение с {old_results.get('commit')} (median, новое / старое):")
+
+    for rows, items in results["results"].items():
+        old_items = old_results["results"].get(rows)
+        if not old_items:
+            continue
+
+        print(f"    Записей: {rows}")
+        for name, value in items.items():
+            old_value = old_items.get(name)
+            if not old_value:
+                continue
+
+            ratio = value["median_us"] / old_value["median_us"]
+            mark = " (замедление)" if ratio > REGRESSION_RATIO else ""
+            print(
+                f"        {name}: {old_value['median_us']:.1f}us -> "
+                f"{value['median_us']:.1f}us, x{ratio:.2f}{mark}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS)
+    parser.add_argument("--output", type=Path, help="Файл для результатов в JSON")
+    parser.add_argument("--compare", type=Path, help="Файл с прошлыми результатами")
+    args = parser.parse_args()
+
+    commit = get_commit()
+    results = {
+        "commit": commit,
+        "datetime": dt.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "fts": db.FTS_IS_AVAILABLE,
+        "results": {str(rows): run(rows) for rows in args.rows},
+    }
+
+    output = args.output or Path(f"suite_{commit or 'unknown'}.json")
+    output.write_text(json.dumps(results, indent=4, ensure_ascii=False), "utf-8")
+    print(f"Результаты сохранены в {output}")
+
+    if args.compare:
+        old_results = json.loads(args.compare.read_text("utf-8"))
+        compare(results, old_results)
+
+
+if __name__ == "__main__":
+    main()
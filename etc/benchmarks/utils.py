@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from playhouse.sqlite_ext import SqliteExtDatabase
+
+from telegram_notifications_bot import db
+
+
+def bind_temp_db(path: Path | str) -> SqliteExtDatabase:
+    """
+    Функция подключает модели к отдельной базе, чтобы не трогать рабочую
+    """
+
+    models = db.BaseModel.get_inherited_models()
+
+    test_db = SqliteExtDatabase(
+        str(path),
+        pragmas={
+            "foreign_keys": 1,
+            "journal_mode": "wal",
+            "cache_size": -1024 * 64,
+        },
+    )
+    test_db.register_function(db.regexp, "regexp", 2)
+    test_db.bind(models, bind_refs=False, bind_backrefs=False)
+    test_db.connect()
+    test_db.create_tables(models)
+
+    return test_db
+
+
+@contextmanager
+def timer() -> Iterator[dict[str, float]]:
+    result = dict()
+    t = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["elapsed"] = time.perf_counter() - t
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    idx = min(len(values) - 1, round(p / 100 * (len(values) - 1)))
+    return values[idx]
@@ -4,14 +4,16 @@
 __author__ = "ipetrash"
 
 
+import io
 import os
 import time
 import re
 
 from datetime import datetime
-from threading import Thread
+from threading import Thread, Event
 
-from peewee import fn, SQL
+# pip install aiohttp
+from aiohttp import web
 
 # pip install python-telegram-bot
 from telegram import Update, Bot, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup
@@ -30,12 +32,29 @@ from telegram_notifications_bot import db
 
 from telegram_notifications_bot.config import (
     MESS_MAX_LENGTH,
+    MESSAGE_STATES_MAX_SIZE,
     INLINE_BUTTON_TEXT_URL,
     INLINE_BUTTON_TEXT_DELETE,
     MESSAGE_ACCESS_DENIED,
     MESSAGE_UNKNOWN_COMMAND,
     USER_ID,
     TOKEN,
+    RATE_LIMIT_GLOBAL_PER_SECOND,
+    RATE_LIMIT_GLOBAL_BURST,
+    RATE_LIMIT_CHAT_PER_SECOND,
+    RATE_LIMIT_CHAT_BURST,
+    SENDING_WORKERS,
+    SENDING_CHAT_MAX_PENDING,
+    SENDING_SCAN_MAX_NUMBER,
+    ARCHIVE_INTERVAL_SECONDS,
+    TIMINGS_MAX_SIZE,
+    PROFILE_DEFAULT_SECONDS,
+    PROFILE_MAX_SECONDS,
+    PROFILE_INTERVAL_SECONDS,
+    PROFILE_TOP_NUMBER,
+    HOST,
+    PORT,
+    WEBHOOK_URL,
 )
 from telegram_notifications_bot.common import (
     get_logger,
@@ -46,6 +65,12 @@ from telegram_notifications_bot.common import (
     get_user_id,
     is_admin,
 )
+from telegram_notifications_bot.metrics import Counter, Gauge, Histogram
+from telegram_notifications_bot.bot.rate_limiter import RateLimiter
+from telegram_notifications_bot.bot.workers import ChatWorkerPool
+from telegram_notifications_bot.bot.markup import get_paginator_markup
+from telegram_notifications_bot.bot.message_states import MessageStates
+from telegram_notifications_bot.bot.profiling import Timings, SamplingProfiler
 from telegram_notifications_bot.bot.regexp_patterns import (
     fill_string_pattern,
     PATTERN_NOTIFICATION_PAGE,
@@ -53,6 +78,7 @@ from telegram_notifications_bot.bot.regexp_patterns import (
     COMMAND_START,
     COMMAND_HELP,
     COMMAND_STATS,
+    COMMAND_PROFILE,
     COMMAND_START_NOTIFICATION,
     COMMAND_STOP_NOTIFICATION,
     COMMAND_SEARCH,
@@ -61,12 +87,10 @@ from telegram_notifications_bot.bot.regexp_patterns import (
     COMMAND_FIND,
     PATTERN_REPLY_FIND,
 )
-from telegram_notifications_bot.third_party.telegram_bot_pagination import (
-    InlineKeyboardPaginator,
-)
 from telegram_notifications_bot.third_party.is_equal_inline_keyboards import (
     is_equal_inline_keyboards,
 )
+from telegram_notifications_bot.web_api.main import create_app, get_webhook_path
 
 
 def datetime_to_str(dt: datetime) -> str:
@@ -85,6 +109,15 @@ DATA = {
     "IS_WORKING": True,
 }
 
+# События для ожидания в потоке рассылки без активного опроса
+EVENT_BOT_IS_READY = Event()
+EVENT_IS_WORKING = Event()
+EVENT_IS_WORKING.set()
+
+# Поток рассылки спит, пока в базе не появятся изменения, в том числе от других процессов.
+# Ожидание (wait) вызывается только из потока рассылки
+SENDING_WATCHER = db.DataChangeWatcher(db.Notification)
+
 INLINE_BUTTON_DELETE = InlineKeyboardButton(
     INLINE_BUTTON_TEXT_DELETE, callback_data=PATTERN_DELETE_MESSAGE
 )
@@ -92,6 +125,61 @@ INLINE_BUTTON_DELETE = InlineKeyboardButton(
 
 log = get_logger(__file__)
 
+RATE_LIMITER = RateLimiter(
+    global_rate=RATE_LIMIT_GLOBAL_PER_SECOND,
+    global_burst=RATE_LIMIT_GLOBAL_BURST,
+    chat_rate=RATE_LIMIT_CHAT_PER_SECOND,
+    chat_burst=RATE_LIMIT_CHAT_BURST,
+    log=log,
+)
+
+METRIC_SENT = Counter(
+    "notify_sent_total",
+    "Количество отправленных уведомлений",
+)
+METRIC_SEND_DURATION = Histogram(
+    "notify_send_duration_seconds",
+    "Время отправки уведомления с учетом ожидания лимитов",
+)
+METRIC_SEND_ERRORS = Counter(
+    "notify_send_errors_total",
+    "Количество ошибок при отправке уведомлений",
+    label_names=("type",),
+)
+METRIC_IS_WORKING = Gauge(
+    "notify_sending_is_working",
+    "Рассылка включена (1) или приостановлена (0)",
+    func=lambda: int(DATA["IS_WORKING"]),
+)
+
+# Статистика уже ведется в RATE_LIMITER и читается при запросе метрик
+METRIC_RATE_LIMIT_WAITS = Counter(
+    "notify_rate_limit_waits_total",
+    "Количество ожиданий из-за ограничения частоты запросов",
+    func=lambda: RATE_LIMITER.get_stats()["waits"],
+)
+METRIC_RATE_LIMIT_WAIT_SECONDS = Counter(
+    "notify_rate_limit_wait_seconds_total",
+    "Суммарное время ожидания из-за ограничения частоты запросов",
+    func=lambda: RATE_LIMITER.get_stats()["wait_seconds"],
+)
+METRIC_RATE_LIMIT_RETRY_AFTER = Counter(
+    "notify_rate_limit_retry_after_total",
+    "Количество ответов RetryAfter от Telegram",
+    func=lambda: RATE_LIMITER.get_stats()["retry_after"],
+)
+
+# Длительности этапов рассылки и обработки callback'ов
+TIMINGS = Timings(TIMINGS_MAX_SIZE)
+
+PROFILER = SamplingProfiler(
+    interval=PROFILE_INTERVAL_SECONDS,
+    top_number=PROFILE_TOP_NUMBER,
+)
+
+# Последнее отправленное содержимое сообщений, чтобы не изменять сообщение тем же содержимым
+MESSAGE_STATES = MessageStates(MESSAGE_STATES_MAX_SIZE)
+
 
 def get_buttons_for_notify(
     notify: db.Notification,
@@ -106,42 +194,36 @@ def get_buttons_for_notify(
     return buttons
 
 
-def get_paginator_for_notify(
+def get_markup_for_notify(
     notify: db.Notification,
     buttons: list[InlineKeyboardButton],
-) -> InlineKeyboardPaginator:
+) -> str | None:
     page = notify.get_index_in_group() + 1
     total = notify.group.get_total_notifications()
     pattern = PATTERN_NOTIFICATION_PAGE
 
-    paginator = InlineKeyboardPaginator(
+    return get_paginator_markup(
         page_count=total,
         current_page=page,
         data_pattern=fill_string_pattern(pattern, "{page}", notify.group.id),
+        buttons=buttons,
     )
-    if buttons:
-        paginator.add_before(*buttons)
 
-    return paginator
 
-
-def get_paginator_for_search(
+def get_markup_for_search(
     page: int,
     total: int,
     search: db.Search,
     buttons: list[InlineKeyboardButton],
-) -> InlineKeyboardPaginator:
+) -> str | None:
     pattern = PATTERN_SEARCH_PAGE
 
-    paginator = InlineKeyboardPaginator(
+    return get_paginator_markup(
         page_count=total,
         current_page=page,
         data_pattern=fill_string_pattern(pattern, search.id, "{page}"),
+        buttons=buttons,
     )
-    if buttons:
-        paginator.add_before(*buttons)
-
-    return paginator
 
 
 def get_context_value(context: CallbackContext) -> str | None:
@@ -169,7 +251,8 @@ def send_notify(
     reply_to_message_id: int = None,
     add_sending_datetime: bool = False,
 ) -> None:
-    text = notify.get_html()
+    with TIMINGS.span("get_html"):
+        text = notify.get_html()
 
     if add_sending_datetime and notify.sending_datetime:
         text += f"\n\n{datetime_to_str(notify.sending_datetime)}"
@@ -180,67 +263,96 @@ def send_notify(
     parse_mode = ParseMode.HTML
 
     if as_new_message:
-        bot.send_message(
+        message = RATE_LIMITER.call(
+            chat_id,
+            TIMINGS.wrap("telegram.send_message", bot.send_message),
             chat_id=chat_id,
             text=text,
             parse_mode=parse_mode,
             reply_markup=reply_markup,
             reply_to_message_id=reply_to_message_id,
         )
+        MESSAGE_STATES.set(chat_id, message.message_id, text, reply_markup)
     else:
-        bot.edit_message_text(
+        # Содержимое не изменилось - запрос к Telegram не нужен
+        if not MESSAGE_STATES.is_changed(chat_id, message_id, text, reply_markup):
+            return
+
+        RATE_LIMITER.call(
+            chat_id,
+            TIMINGS.wrap("telegram.edit_message_text", bot.edit_message_text),
             chat_id=chat_id,
             message_id=message_id,
             text=text,
             parse_mode=parse_mode,
             reply_markup=reply_markup,
         )
+        MESSAGE_STATES.set(chat_id, message_id, text, reply_markup)
 
 
-def sending_notifications() -> None:
+def set_is_working(value: bool) -> None:
+    DATA["IS_WORKING"] = value
+    if value:
+        EVENT_IS_WORKING.set()
+    else:
+        EVENT_IS_WORKING.clear()
+
+
+def send_notification(notify: db.Notification) -> None:
+    """
+    Функция отправки уведомления, выполняется в потоке пула рассылки.
+    При ошибке (в том числе при работе с базой) попытка повторяется после паузы,
+    чтобы уведомление не потерялось и более новые уведомления чата не обогнали его.
+    Если сообщение уже отправлено, то повторяется только отметка об отправке.
+    Ошибка задерживает только очередь, в которой находится чат уведомления
+    """
+
+    bot: Bot = DATA["BOT"]
+
+    is_sent = False
     while True:
-        bot: Bot | None = DATA["BOT"]
-        if not bot or not USER_ID:
-            time.sleep(0.001)
-            continue
+        # Пауза, если IS_WORKING = False
+        EVENT_IS_WORKING.wait()
 
         try:
-            for notify in db.Notification.get_unsent():
-                # Пауза, если IS_WORKING = False
-                while not DATA["IS_WORKING"]:
-                    time.sleep(0.001)
-                    continue
+            if not is_sent:
+                # Проход по базе мог прочитать уведомление до того, как стала видна
+                # отметка об отправке, поэтому перед отправкой состояние
+                # проверяется по базе
+                if db.Notification.is_sent(notify.id):
+                    return
+
+                t = time.perf_counter()
 
                 buttons = get_buttons_for_notify(notify)
 
-                # Если уведомление находится в группе
-                # Нужно вернуть только первое уведомление с пагинацией
+                # Если уведомление находится в группе, то отправляется первое уведомление с пагинацией
                 if notify.group:
-                    # Если на текущий момент не все уведомления из группы находятся в базе
-                    if not notify.group.is_complete():
-                        continue
+                    with TIMINGS.span("sender.paginator_markup"):
+                        reply_markup = get_markup_for_notify(notify, buttons)
+                elif buttons:
+                    reply_markup = InlineKeyboardMarkup.from_row(buttons)
+                else:
+                    reply_markup = None
 
-                    # Если уведомление не первое в группе, то не возвращаем его
-                    # Но помечаем как отправленное
-                    if not notify.is_first_in_group():
-                        notify.set_as_send()
-                        continue
+                send_notify(bot, notify, reply_markup, chat_id=notify.chat_id)
+                is_sent = True
 
-                    paginator = get_paginator_for_notify(notify, buttons)
-                    reply_markup = paginator.markup
+                METRIC_SEND_DURATION.observe(time.perf_counter() - t)
+                METRIC_SENT.inc()
 
+            with TIMINGS.span("sender.set_as_send"):
+                if notify.group:
+                    # Все уведомления группы помечаются одним запросом
+                    notify.group.set_as_send()
                 else:
-                    reply_markup = (
-                        InlineKeyboardMarkup.from_row(buttons) if buttons else None
-                    )
+                    notify.set_as_send()
 
-                send_notify(bot, notify, reply_markup)
-                notify.set_as_send()
-
-                time.sleep(1)
+            return
 
         except Exception as e:
             log.exception("")
+            METRIC_SEND_ERRORS.inc(labels=(type(e).__name__,))
 
             if USER_ID:
                 text = f"⚠ При отправке уведомления возникла ошибка: {e}"
@@ -250,10 +362,143 @@ def sending_notifications() -> None:
                 except Exception:
                     log.exception("Ошибка при отправке уведомления об ошибке")
 
-                time.sleep(60)
+            time.sleep(60)
+
+
+SENDING_POOL = ChatWorkerPool(
+    workers=SENDING_WORKERS,
+    process=send_notification,
+    max_pending_per_chat=SENDING_CHAT_MAX_PENDING,
+    log=log,
+)
+
+
+class UnsentScanner:
+    """
+    Проход по неотправленным уведомлениям для постановки в очереди рассылки.
+    Следующий проход продолжается после последнего просмотренного id, а не с начала
+    базы, и за один проход просматривается не больше max_number уведомлений.
+    Пропущенные уведомления (группа еще не заполнена, очередь чата заполнена)
+    запоминаются: когда проход дойдет до конца, следующий начнется с первого из них
+    """
+
+    def __init__(self, pool: ChatWorkerPool, max_number: int) -> None:
+        self.pool: ChatWorkerPool = pool
+        self.max_number: int = max_number
+
+        self.after_id: int = 0
+        self.first_skipped_id: int | None = None
+
+    def _submit(
+        self,
+        notify: db.Notification,
+        checked_group_ids: set[int],
+        full_chat_ids: set[int],
+    ) -> bool:
+        """
+        Функция ставит уведомление в очередь, если его нужно отправлять.
+        Возвращает False, если уведомление нужно проверить в следующих проходах
+        """
+
+        # После первого пропуска из-за заполненной очереди остальные уведомления
+        # чата тоже пропускаются, чтобы они не обогнали пропущенное
+        if notify.chat_id in full_chat_ids or self.pool.is_full(notify.chat_id):
+            full_chat_ids.add(notify.chat_id)
+            return False
+
+        # Если уведомление находится в группе
+        # Нужно вернуть только первое уведомление с пагинацией
+        if notify.group:
+            with TIMINGS.span("sender.group_check"):
+                # Если на текущий момент не все уведомления из группы находятся в базе
+                if not notify.group.is_complete():
+                    return False
+
+                # Если уведомление не первое в группе, то не возвращаем его.
+                # Уведомления группы помечаются как отправленные вместе с первым,
+                # но если первое уже отправлено раньше, то группа помечается здесь
+                if not notify.is_first_in_group():
+                    if notify.group_id not in checked_group_ids:
+                        checked_group_ids.add(notify.group_id)
+
+                        first = notify.group.get_notification(0)
+                        if not first or first.sending_datetime:
+                            notify.group.set_as_send()
+                    return True
+
+        # Повторно не добавится, если уведомление уже в очереди на отправку
+        self.pool.submit(notify.chat_id, notify.id, notify)
+        return True
+
+    def scan(self) -> bool:
+        """
+        Функция выполняет один проход. Возвращает True, если проход остановился
+        на ограничении max_number и его нужно продолжить
+        """
+
+        # Группы, которые уже были проверены за этот проход
+        checked_group_ids: set[int] = set()
+        full_chat_ids: set[int] = set()
+
+        number = 0
+        for notify in db.Notification.iter_unsent(after_id=self.after_id):
+            if not self._submit(notify, checked_group_ids, full_chat_ids):
+                if self.first_skipped_id is None:
+                    self.first_skipped_id = notify.id
+
+            self.after_id = notify.id
+
+            number += 1
+            if number >= self.max_number:
+                return True
+
+        # Проход дошел до конца: следующий начнется с первого пропущенного
+        if self.first_skipped_id is not None:
+            self.after_id = self.first_skipped_id - 1
+            self.first_skipped_id = None
+
+        return False
+
+
+SENDING_SCANNER = UnsentScanner(SENDING_POOL, max_number=SENDING_SCAN_MAX_NUMBER)
+
+
+def sending_notifications() -> None:
+    EVENT_BOT_IS_READY.wait()
+
+    SENDING_POOL.start()
+
+    while True:
+        SENDING_WATCHER.wait()
+
+        # Пауза, если IS_WORKING = False
+        EVENT_IS_WORKING.wait()
+
+        try:
+            with TIMINGS.span("sender.scan_unsent"):
+                has_more = SENDING_SCANNER.scan()
+
+            if has_more:
+                SENDING_WATCHER.notify()
+
+        except Exception:
+            log.exception("")
+            time.sleep(60)
+
+            # Повторная попытка сразу после паузы, не дожидаясь изменений в базе
+            SENDING_WATCHER.notify()
+
+
+def archiving_notifications() -> None:
+    while True:
+        try:
+            number = db.NotificationArchive.archive()
+            if number:
+                log.info(f"Перенесено в архив уведомлений: {number}")
+        except Exception:
+            log.exception("")
 
-        finally:
-            time.sleep(1)
+        time.sleep(ARCHIVE_INTERVAL_SECONDS)
 
 
 def reply_sending_notification_status(update: Update) -> None:
@@ -275,6 +520,10 @@ def on_start(update: Update, _: CallbackContext) -> None:
         lines = (
             "Команды:",
             f" * /{COMMAND_STATS} для просмотра статистики",
+            (
+                f" * /{COMMAND_PROFILE} [секунды] для профилирования бота "
+                f"(по умолчанию {PROFILE_DEFAULT_SECONDS} сек.)"
+            ),
             f" * /{COMMAND_STOP_NOTIFICATION} для остановки рассылки уведомлений",
             f" * /{COMMAND_START_NOTIFICATION} для возобновления рассылки уведомлений",
             (
@@ -296,42 +545,34 @@ def on_stats(update: Update, _: CallbackContext) -> None:
     message = update.effective_message
     chat_id = get_user_id(update)
 
-    filters = [db.Notification.chat_id == chat_id]
-    count: int = db.Notification.select().where(*filters).count()
-    first_append_datetime: datetime = (
-        db.Notification.select(db.Notification.append_datetime)
-        .where(*filters)
-        .order_by(db.Notification.append_datetime)
-        .first()
-        .append_datetime
-    )
-    last_append_datetime: datetime = (
-        db.Notification.select(db.Notification.append_datetime)
-        .where(*filters)
-        .order_by(db.Notification.append_datetime.desc())
-        .first()
-        .append_datetime
+    # Статистика берется из таблицы, которую обновляют триггеры, и из индекса,
+    # поэтому время ответа не зависит от количества уведомлений
+    number_by_year: dict[int, int] = db.NotificationStats.get_number_by_year(chat_id)
+    count: int = sum(number_by_year.values())
+    years_info: str = "\n".join(
+        f"    <b>{year}</b>: {number}" for year, number in number_by_year.items()
     )
 
-    query_year_by_number = (
-        db.Notification.select(
-            fn.STRFTIME("%Y", db.Notification.append_datetime).alias("year"),
-            fn.COUNT(db.Notification.id),
-        )
-        .where(*filters)
-        .group_by(SQL("year"))
-        .order_by(SQL("year").desc())
+    first_append_datetime, last_append_datetime = (
+        datetime_to_str(value) if value else "-"
+        for value in db.Notification.get_first_and_last_append_datetime(chat_id)
     )
-    years_info: str = "\n".join(
-        f"    <b>{year}</b>: {number}" for year, number in query_year_by_number.tuples()
+
+    rate_limit = RATE_LIMITER.get_stats(chat_id)
+    rate_limit_info: str = (
+        f"{rate_limit['global_allowance']:.1f}/{rate_limit['global_capacity']} всего, "
+        f"{rate_limit['chat_allowance']:.1f}/{rate_limit['chat_capacity']} в чат, "
+        f"ожиданий {rate_limit['waits']} ({rate_limit['wait_seconds']:.1f} сек.), "
+        f"RetryAfter {rate_limit['retry_after']}"
     )
 
     text = f"""
 {TypeEnum.INFO.emoji} <b>Статистика уведомлений</b>
 <b>Отправлено</b>: {count}
 {years_info}
-<b>Первое</b>: {datetime_to_str(first_append_datetime)}
-<b>Последнее</b>: {datetime_to_str(last_append_datetime)}
+<b>Первое</b>: {first_append_datetime}
+<b>Последнее</b>: {last_append_datetime}
+<b>Лимит отправки</b>: {rate_limit_info}
     """.strip()
 
     message.reply_text(
@@ -341,17 +582,51 @@ def on_stats(update: Update, _: CallbackContext) -> None:
     )
 
 
+@log_func(log)
+@access_check(log)
+def on_profile(update: Update, context: CallbackContext) -> None:
+    message = update.effective_message
+
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        seconds = PROFILE_DEFAULT_SECONDS
+    seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+
+    message.reply_text(f"Профилирование {seconds} сек...", quote=True)
+
+    # Обработчики выполняются в потоках диспетчера (run_async), поэтому
+    # ожидание не задерживает бота
+    report = PROFILER.run(seconds)
+    if report is None:
+        message.reply_text("Профилирование уже выполняется", quote=True)
+        return
+
+    text = "\n\n".join(
+        [
+            report,
+            f"Этапы за последние {seconds} сек.:",
+            TIMINGS.format_stats(seconds),
+        ]
+    )
+    message.reply_document(
+        document=io.BytesIO(text.encode("utf-8")),
+        filename=f"profile_{datetime.now():%Y-%m-%d_%H%M%S}.txt",
+        quote=True,
+    )
+
+
 @log_func(log)
 @access_check(log)
 def on_start_notification(update: Update, _: CallbackContext) -> None:
-    DATA["IS_WORKING"] = True
+    set_is_working(True)
     reply_sending_notification_status(update)
 
 
 @log_func(log)
 @access_check(log)
 def on_stop_notification(update: Update, _: CallbackContext) -> None:
-    DATA["IS_WORKING"] = False
+    set_is_working(False)
     reply_sending_notification_status(update)
 
 
@@ -376,10 +651,10 @@ def on_search(update: Update, context: CallbackContext) -> None:
         )
         return
 
-    notify = db.Notification.get_by_id(ids[0])
+    notify = db.Notification.get_with_group(ids[0])
     buttons = get_buttons_for_notify(notify, allow_delete_button=False)
 
-    paginator = get_paginator_for_search(
+    reply_markup = get_markup_for_search(
         page=1,
         total=len(ids),
         search=search,
@@ -388,7 +663,7 @@ def on_search(update: Update, context: CallbackContext) -> None:
     send_notify(
         bot=context.bot,
         notify=notify,
-        reply_markup=paginator.markup,
+        reply_markup=reply_markup,
         reply_to_message_id=message.message_id,
         add_sending_datetime=True,
     )
@@ -403,35 +678,46 @@ def on_callback_search_pagination(update: Update, context: CallbackContext):
     page = get_int_from_match(context.match, "page")
     by_search_id = get_int_from_match(context.match, "search_id")
 
-    # NOTE: По сути, переход по кнопкам пагинации вызывает новый поиск
-    #       Что может увеличивать количество результатов
-    #       Обойти можно, если при первом поиске запомнить все id уведомлений
-    #       и по ним переходить в пагинаторе
-    search = db.Search.get_by_id(by_search_id)
-    _, ids = db.Notification.search(search.text)
+    # Результаты запоминаются при первом поиске, поэтому переход по кнопкам пагинации
+    # не выполняет поиск заново и количество результатов не меняется
+    with TIMINGS.span("callback.search.get_notification"):
+        search = db.Search.get_by_id(by_search_id)
+        ids = db.Notification.get_ids_by_search(search)
+        if not ids:
+            return
 
-    notify = db.Notification.get_by_search(regex=search, page=page)
-    buttons = get_buttons_for_notify(notify, allow_delete_button=False)
+        page = min(max(page or 1, 1), len(ids))
 
-    paginator = get_paginator_for_search(
-        page=page,
-        total=len(ids),
-        search=search,
-        buttons=buttons,
-    )
-    reply_markup = paginator.markup
+        notify = db.Notification.get_with_group(ids[page - 1])
+        if not notify:
+            return
+
+    with TIMINGS.span("callback.search.paginator_markup"):
+        buttons = get_buttons_for_notify(notify, allow_delete_button=False)
+
+        reply_markup = get_markup_for_search(
+            page=page,
+            total=len(ids),
+            search=search,
+            buttons=buttons,
+        )
 
     # Fix error: "telegram.error.BadRequest: Message is not modified"
-    if is_equal_inline_keyboards(reply_markup, query.message.reply_markup):
-        return
+    # Если содержимое сообщения неизвестно (например, после перезапуска бота),
+    # то сравниваются только клавиатуры, иначе содержимое проверит send_notify
+    message = query.message
+    if not MESSAGE_STATES.has(message.chat_id, message.message_id):
+        if is_equal_inline_keyboards(reply_markup, message.reply_markup):
+            return
 
     try:
         send_notify(
             context.bot,
             notify,
             reply_markup,
+            chat_id=message.chat_id,
             as_new_message=False,
-            message_id=update.effective_message.message_id,
+            message_id=message.message_id,
             add_sending_datetime=True,
         )
     except BadRequest as e:
@@ -447,6 +733,7 @@ def on_callback_delete_message(update: Update, _: CallbackContext) -> None:
 
     try:
         query.delete_message()
+        MESSAGE_STATES.remove(query.message.chat_id, query.message.message_id)
     except BadRequest as e:
         if "Message can't be deleted for everyone" in str(e):
             text = "Нельзя удалить сообщение, т.к. оно слишком старое. Остается только вручную его удалить"
@@ -471,24 +758,30 @@ def on_change_notification_page(update: Update, context: CallbackContext):
     page = get_int_from_match(context.match, "page")
     by_group_id = get_int_from_match(context.match, "group_id")
 
-    group: db.NotificationGroup = db.NotificationGroup.get_by_id(by_group_id)
-    notify = group.get_notification(page - 1)
-    buttons = get_buttons_for_notify(notify)
+    with TIMINGS.span("callback.page.get_notification"):
+        group: db.NotificationGroup = db.NotificationGroup.get_by_id(by_group_id)
+        notify = group.get_notification(page - 1)
 
-    paginator = get_paginator_for_notify(notify, buttons)
-    reply_markup = paginator.markup
+    with TIMINGS.span("callback.page.paginator_markup"):
+        buttons = get_buttons_for_notify(notify)
+        reply_markup = get_markup_for_notify(notify, buttons)
 
     # Fix error: "telegram.error.BadRequest: Message is not modified"
-    if is_equal_inline_keyboards(reply_markup, query.message.reply_markup):
-        return
+    # Если содержимое сообщения неизвестно (например, после перезапуска бота),
+    # то сравниваются только клавиатуры, иначе содержимое проверит send_notify
+    message = query.message
+    if not MESSAGE_STATES.has(message.chat_id, message.message_id):
+        if is_equal_inline_keyboards(reply_markup, message.reply_markup):
+            return
 
     try:
         send_notify(
             context.bot,
             notify,
             reply_markup,
+            chat_id=message.chat_id,
             as_new_message=False,
-            message_id=update.effective_message.message_id,
+            message_id=message.message_id,
         )
     except BadRequest as e:
         if "Message is not modified" in str(e):
@@ -508,8 +801,58 @@ def on_error(update: Update, context: CallbackContext) -> None:
     reply_error(log, update, context)
 
 
-def main() -> None:
-    log.debug("Start")
+def on_notification_added() -> None:
+    """
+    Функция сразу будит поток рассылки, поэтому новое уведомление не ждет, пока
+    он заметит изменения в базе. Используется, когда web_api работает в процессе бота.
+    Уведомление не ставится в очередь напрямую: проход продолжается после последнего
+    просмотренного id и читает только новые уведомления, а постановка в обход прохода
+    позволила бы уведомлению обогнать более старые уведомления чата
+    """
+
+    SENDING_WATCHER.notify()
+
+
+def run_web_api(updater: Updater) -> None:
+    """
+    Функция запускает web_api в процессе бота: сервер, диспетчер и рассылка работают
+    в одном процессе. Принятые уведомления сохраняются в базу, после чего поток
+    рассылки сразу будится (см. on_notification_added) и читает их из базы.
+
+    Если задан WEBHOOK_URL, то обновления от Telegram приходят на маршрут web_api
+    и сразу попадают в очередь диспетчера, иначе - через long polling
+    """
+
+    dp = updater.dispatcher
+
+    dispatcher_thread: Thread | None = None
+    if WEBHOOK_URL:
+        dispatcher_thread = Thread(target=dp.start, name="dispatcher", daemon=True)
+        dispatcher_thread.start()
+
+        updater.bot.set_webhook(WEBHOOK_URL + get_webhook_path())
+        log.debug(f"Webhook: {WEBHOOK_URL}")
+
+        app = create_app(dispatcher=dp, on_added=on_notification_added)
+    else:
+        updater.start_polling()
+        app = create_app(on_added=on_notification_added)
+
+    try:
+        web.run_app(app, host=HOST, port=PORT)
+    finally:
+        if dispatcher_thread:
+            dp.stop()
+            dispatcher_thread.join()
+        else:
+            updater.stop()
+
+
+def create_updater(base_url: str = None) -> Updater:
+    """
+    Функция создает бота с обработчиками. В base_url можно передать адрес
+    другого сервера Bot API (например, FakeBotApi для тестов)
+    """
 
     cpu_count = os.cpu_count()
     workers = cpu_count
@@ -518,6 +861,7 @@ def main() -> None:
 
     updater = Updater(
         TOKEN,
+        base_url=base_url,
         workers=workers,
         defaults=Defaults(run_async=True),
     )
@@ -525,6 +869,7 @@ def main() -> None:
     log.debug(f"Bot name {bot.first_name!r} ({bot.name})")
 
     DATA["BOT"] = bot
+    EVENT_BOT_IS_READY.set()
 
     dp = updater.dispatcher
 
@@ -532,6 +877,7 @@ def main() -> None:
     dp.add_handler(CommandHandler(COMMAND_HELP, on_start))
 
     dp.add_handler(CommandHandler(COMMAND_STATS, on_stats))
+    dp.add_handler(CommandHandler(COMMAND_PROFILE, on_profile))
 
     dp.add_handler(CommandHandler(COMMAND_START_NOTIFICATION, on_start_notification))
     dp.add_handler(CommandHandler(COMMAND_STOP_NOTIFICATION, on_stop_notification))
@@ -556,18 +902,44 @@ def main() -> None:
 
     dp.add_error_handler(on_error)
 
-    updater.start_polling()
-    updater.idle()
+    return updater
+
+
+def main(with_web_api: bool = False) -> None:
+    log.debug("Start")
+
+    updater = create_updater()
+
+    if WEBHOOK_URL or with_web_api:
+        run_web_api(updater)
+    else:
+        # Вебхук, если был установлен, удаляется при запуске long polling
+        updater.start_polling()
+        updater.idle()
 
     log.debug("Finish")
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Бот для уведомлений в телеграм")
+    parser.add_argument(
+        "--with-web-api",
+        action="store_true",
+        help=(
+            "Запуск web_api в процессе бота, после добавления уведомлений рассылка "
+            "сразу будится. При заданном WEBHOOK_URL web_api запускается всегда"
+        ),
+    )
+    args = parser.parse_args()
+
     Thread(target=sending_notifications).start()
+    Thread(target=archiving_notifications, daemon=True).start()
 
     while True:
         try:
-            main()
+            main(with_web_api=args.with_web_api)
         except:
             log.exception("")
 
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import functools
+
+from typing import Iterable
+
+from telegram import InlineKeyboardButton
+
+from telegram_notifications_bot.config import PAGINATOR_MARKUP_CACHE_MAX_SIZE
+from telegram_notifications_bot.third_party.telegram_bot_pagination import (
+    InlineKeyboardPaginator,
+    PrevNextButtonsEnum,
+)
+
+
+# Кнопка в виде кортежа (text, callback_data, url), чтобы ее можно было использовать в ключе кэша
+ButtonKey = tuple[str, str | None, str | None]
+
+
+@functools.lru_cache(maxsize=PAGINATOR_MARKUP_CACHE_MAX_SIZE)
+def _get_paginator_markup(
+    page_count: int,
+    current_page: int,
+    data_pattern: str,
+    buttons: tuple[ButtonKey, ...],
+    prev_next_buttons: PrevNextButtonsEnum,
+) -> str | None:
+    paginator = InlineKeyboardPaginator(
+        page_count=page_count,
+        current_page=current_page,
+        data_pattern=data_pattern,
+        prev_next_buttons=prev_next_buttons,
+    )
+    if buttons:
+        paginator.add_before(
+            *(
+                InlineKeyboardButton(text, callback_data=callback_data, url=url)
+                for text, callback_data, url in buttons
+            )
+        )
+
+    return paginator.markup
+
+
+def get_paginator_markup(
+    page_count: int,
+    current_page: int,
+    data_pattern: str,
+    buttons: Iterable[InlineKeyboardButton] = (),
+    prev_next_buttons: PrevNextButtonsEnum = PrevNextButtonsEnum.NONE,
+) -> str | None:
+    """
+    Функция возвращает разметку клавиатуры пагинатора (InlineKeyboardMarkup в JSON).
+    Разметка зависит только от аргументов, поэтому она кэшируется и при повторном
+    переходе на ту же страницу кнопки и JSON не создаются заново
+    """
+
+    return _get_paginator_markup(
+        page_count,
+        current_page,
+        data_pattern,
+        tuple((button.text, button.callback_data, button.url) for button in buttons),
+        prev_next_buttons,
+    )
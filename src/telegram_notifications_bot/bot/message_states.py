@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import hashlib
+
+from telegram import InlineKeyboardMarkup
+
+from telegram_notifications_bot.common import LRUCache
+
+
+class MessageStates:
+    """
+    Класс для хранения отпечатков последнего отправленного содержимого сообщений:
+    (chat_id, message_id) -> хэш текста и клавиатуры.
+    Позволяет не отправлять в Telegram изменение сообщения, если содержимое
+    не поменялось (иначе будет ошибка "Message is not modified")
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._items = LRUCache(max_size)
+
+    @staticmethod
+    def get_fingerprint(
+        text: str,
+        reply_markup: InlineKeyboardMarkup | str | None,
+    ) -> bytes:
+        if isinstance(reply_markup, InlineKeyboardMarkup):
+            reply_markup = reply_markup.to_json()
+
+        data = f"{text}\0{reply_markup or ''}".encode("utf-8")
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def has(self, chat_id: int, message_id: int) -> bool:
+        return self._items.get((chat_id, message_id)) is not None
+
+    def is_changed(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: InlineKeyboardMarkup | str | None,
+    ) -> bool:
+        """
+        Функция возвращает False, если сообщению уже было отправлено это же содержимое
+        """
+
+        fingerprint = self._items.get((chat_id, message_id))
+        return fingerprint != self.get_fingerprint(text, reply_markup)
+
+    def set(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: InlineKeyboardMarkup | str | None,
+    ) -> None:
+        self._items.set((chat_id, message_id), self.get_fingerprint(text, reply_markup))
+
+    def remove(self, chat_id: int, message_id: int) -> None:
+        self._items.pop((chat_id, message_id))
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import functools
+import os
+import sys
+import threading
+import time
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, NamedTuple, TypeVar
+
+
+T = TypeVar("T")
+
+# Файлы, в которых поток только ждет (события, очереди, select).
+# Такие выборки не учитываются, иначе простаивающие потоки займут весь отчет
+IDLE_FILE_NAMES: tuple[str, ...] = ("threading.py", "queue.py", "selectors.py")
+
+
+class Span(NamedTuple):
+    name: str
+    # Время начала по time.time
+    started: float
+    # Длительность в секундах
+    duration: float
+    thread: str
+
+
+class Timings:
+    """
+    Кольцевой буфер длительностей этапов обработки: хранятся последние max_size
+    замеров. Добавление в deque потокобезопасно, поэтому блокировки не нужны
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.spans: deque[Span] = deque(maxlen=max_size)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started = time.time()
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append(
+                Span(
+                    name,
+                    started,
+                    time.perf_counter() - t,
+                    threading.current_thread().name,
+                )
+            )
+
+    def wrap(self, name: str, func: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            with self.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def get_stats(self, seconds: float = None) -> dict[str, dict[str, float]]:
+        """
+        Функция возвращает статистику по этапам за последние seconds секунд
+        (или по всему буферу): количество, суммарное, среднее, p95 и максимальное время
+        """
+
+        min_started = time.time() - seconds if seconds is not None else 0.0
+
+        durations: dict[str, list[float]] = dict()
+        for span in list(self.spans):
+            if span.started >= min_started:
+                durations.setdefault(span.name, []).append(span.duration)
+
+        stats = dict()
+        for name, values in durations.items():
+            values.sort()
+            stats[name] = {
+                "number": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "p95": values[min(len(values) - 1, round(0.95 * (len(values) - 1)))],
+                "max": values[-1],
+            }
+
+        return stats
+
+    def format_stats(self, seconds: float = None) -> str:
+        stats = self.get_stats(seconds)
+        if not stats:
+            return "Нет замеров"
+
+        lines = [
+            f"{'Этап':<40} {'Кол-во':>8} {'Всего, с':>10} {'Ср., мс':>10} "
+            f"{'p95, мс':>10} {'Макс., мс':>10}"
+        ]
+        for name, value in sorted(stats.items(), key=lambda x: -x[1]["total"]):
+            lines.append(
+                f"{name:<40} {value['number']:>8} {value['total']:>10.3f} "
+                f"{value['mean'] * 1000:>10.2f} {value['p95'] * 1000:>10.2f} "
+                f"{value['max'] * 1000:>10.2f}"
+            )
+
+        return "\n".join(lines)
+
+
+def _get_function_name(code: Any) -> str:
+    file_name = os.path.relpath(code.co_filename) if code.co_filename else "?"
+    if file_name.startswith(".."):
+        file_name = code.co_filename
+
+    return f"{code.co_name} ({file_name}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Профилировщик, который с интервалом interval снимает стеки всех потоков
+    через sys._current_frames. Считается, сколько раз функция была на вершине стека
+    (собственное время) и сколько раз была в стеке (общее время).
+    Одновременно выполняется только одно профилирование
+    """
+
+    def __init__(self, interval: float, top_number: int) -> None:
+        self.interval: float = interval
+        self.top_number: int = top_number
+
+        self._lock = threading.Lock()
+
+    def _sample(
+        self,
+        own_thread_id: int,
+        self_counts: Counter,
+        total_counts: Counter,
+    ) -> bool:
+        is_sampled = False
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+
+            if frame.f_code.co_filename.endswith(IDLE_FILE_NAMES):
+                continue
+
+            is_sampled = True
+            self_counts[frame.f_code] += 1
+
+            # Рекурсивная функция учитывается один раз на стек
+            codes = set()
+            while frame:
+                codes.add(frame.f_code)
+                frame = frame.f_back
+            total_counts.update(codes)
+
+        return is_sampled
+
+    def run(self, seconds: float) -> str | None:
+        """
+        Функция профилирует процесс seconds секунд и возвращает отчет.
+        Если профилирование уже выполняется, то возвращает None
+        """
+
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            own_thread_id = threading.get_ident()
+            self_counts = Counter()
+            total_counts = Counter()
+
+            samples = 0
+            active_samples = 0
+
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                samples += 1
+                if self._sample(own_thread_id, self_counts, total_counts):
+                    active_samples += 1
+
+                time.sleep(self.interval)
+
+            elapsed = time.perf_counter() - started
+
+        finally:
+            self._lock.release()
+
+        lines = [
+            f"Профилирование: {elapsed:.1f} сек., "
+            f"интервал {self.interval * 1000:g} мс, выборок {samples}, "
+            f"из них с активными потоками {active_samples}",
+        ]
+
+        # Доля от всех выборок потоков, поэтому у общего времени сумма больше 100%
+        total = sum(self_counts.values()) or 1
+        for title, counts in [
+            ("Собственное время", self_counts),
+            ("Общее время", total_counts),
+        ]:
+            lines.append("")
+            lines.append(f"{title}:")
+
+            for code, number in counts.most_common(self.top_number):
+                lines.append(
+                    f"{number:>8} {number / total:>7.1%}  {_get_function_name(code)}"
+                )
+
+        return "\n".join(lines)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import logging
+import time
+
+from threading import Lock
+from typing import Any, Callable, TypeVar
+
+from telegram.error import RetryAfter
+
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """
+    Класс для ограничения частоты: токены пополняются со скоростью rate в секунду,
+    но их не может быть больше capacity (размер допустимого всплеска)
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity
+
+        self.tokens: float = capacity
+        self.updated: float = now
+
+        # Время до которого отправка запрещена (например, из-за RetryAfter)
+        self.blocked_until: float = 0.0
+
+    def refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def get_delay(self, now: float) -> float:
+        """
+        Функция возвращает время ожидания, после которого можно будет взять токен
+        """
+
+        self.refill(now)
+
+        delay = 0.0
+        if self.tokens < 1:
+            delay = (1 - self.tokens) / self.rate
+
+        return max(delay, self.blocked_until - now)
+
+    def consume(self, now: float) -> None:
+        self.refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds: float, now: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+
+    def is_idle(self, now: float) -> bool:
+        """
+        Функция возвращает True, если токены полностью восполнены и блокировки нет,
+        т.е. корзина ничем не отличается от новой
+        """
+
+        self.refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class RateLimiter:
+    """
+    Класс для ограничения частоты запросов к Telegram: общий лимит бота и лимит на чат.
+    При RetryAfter от Telegram и чат, и общий лимит блокируются ровно
+    на указанное время
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        global_burst: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_retries: int = 5,
+        chat_buckets_prune_size: int = 1000,
+        log: logging.Logger = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.chat_rate: float = chat_rate
+        self.chat_burst: float = chat_burst
+        self.max_retries: int = max_retries
+
+        self.log: logging.Logger = log or logging.getLogger(__name__)
+        self.clock: Callable[[], float] = clock
+        self.sleep: Callable[[float], None] = sleep
+
+        self._lock = Lock()
+        self.global_bucket = TokenBucket(global_rate, global_burst, self.clock())
+        self.chat_buckets: dict[int, TokenBucket] = dict()
+
+        # Количество корзин чатов, при котором удаляются простаивающие корзины.
+        # После очистки порог растет вместе с количеством оставшихся корзин,
+        # чтобы очистка не выполнялась на каждый новый чат
+        self.chat_buckets_prune_size: int = chat_buckets_prune_size
+        self._prune_at: int = chat_buckets_prune_size
+
+        self.total_waits: int = 0
+        self.total_wait_seconds: float = 0.0
+        self.total_retry_after: int = 0
+
+    def _prune_chat_buckets(self, now: float) -> None:
+        # Простаивающая корзина равна новой, поэтому ее можно удалить без потери
+        # состояния: при следующем запросе в чат она будет создана заново
+        for chat_id, bucket in list(self.chat_buckets.items()):
+            if bucket.is_idle(now):
+                del self.chat_buckets[chat_id]
+
+        self._prune_at = max(self.chat_buckets_prune_size, 2 * len(self.chat_buckets))
+
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if not bucket:
+            now = self.clock()
+            if len(self.chat_buckets) >= self._prune_at:
+                self._prune_chat_buckets(now)
+
+            bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self.chat_buckets[chat_id] = bucket
+
+        return bucket
+
+    def acquire(self, chat_id: int) -> float:
+        """
+        Функция ждет, пока не появится токен и в общем лимите, и в лимите чата.
+        Возвращает время ожидания
+        """
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                chat_bucket = self._get_chat_bucket(chat_id)
+
+                delay = max(
+                    self.global_bucket.get_delay(now),
+                    chat_bucket.get_delay(now),
+                )
+                if delay <= 0:
+                    self.global_bucket.consume(now)
+                    chat_bucket.consume(now)
+
+                    if waited:
+                        self.total_waits += 1
+                        self.total_wait_seconds += waited
+
+                    return waited
+
+            self.sleep(delay)
+            waited += delay
+
+    def block(self, chat_id: int, seconds: float) -> None:
+        """
+        Функция запрещает запросы на seconds секунд и в чат, и в общем лимите,
+        т.к. RetryAfter от Telegram может означать превышение общего лимита бота
+        """
+
+        with self._lock:
+            now = self.clock()
+            self.global_bucket.block(seconds, now)
+            self._get_chat_bucket(chat_id).block(seconds, now)
+
+    def call(
+        self, chat_id: int, func: Callable[..., T], /, *args: Any, **kwargs: Any
+    ) -> T:
+        attempt = 0
+        while True:
+            self.acquire(chat_id)
+
+            try:
+                return func(*args, **kwargs)
+
+            except RetryAfter as e:
+                attempt += 1
+                with self._lock:
+                    self.total_retry_after += 1
+
+                if attempt > self.max_retries:
+                    raise e
+
+                self.log.warning(
+                    f"Превышен лимит запросов для чата {chat_id}, "
+                    f"повтор через {e.retry_after} секунд"
+                )
+                self.block(chat_id, e.retry_after)
+
+    def get_stats(self, chat_id: int = None) -> dict[str, float]:
+        """
+        Функция возвращает текущий доступный запас запросов и статистику ожиданий
+        """
+
+        with self._lock:
+            now = self.clock()
+
+            self.global_bucket.refill(now)
+            stats = {
+                "global_allowance": self.global_bucket.tokens,
+                "global_capacity": self.global_bucket.capacity,
+                "waits": self.total_waits,
+                "wait_seconds": self.total_wait_seconds,
+                "retry_after": self.total_retry_after,
+            }
+
+            if chat_id is not None:
+                chat_bucket = self._get_chat_bucket(chat_id)
+                chat_bucket.refill(now)
+                stats["chat_allowance"] = chat_bucket.tokens
+                stats["chat_capacity"] = chat_bucket.capacity
+                stats["chat_blocked_seconds"] = max(0.0, chat_bucket.blocked_until - now)
+
+            return stats
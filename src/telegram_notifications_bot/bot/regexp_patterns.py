@@ -18,6 +18,8 @@ COMMAND_HELP = "help"
 
 COMMAND_STATS = "stats"
 
+COMMAND_PROFILE = "profile"
+
 COMMAND_START_NOTIFICATION = "start_notification"
 COMMAND_STOP_NOTIFICATION = "stop_notification"
 
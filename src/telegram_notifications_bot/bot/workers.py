@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import logging
+
+from queue import Queue
+from threading import Thread, Lock
+from typing import Any, Callable, Hashable
+
+
+class ChatWorkerPool:
+    """
+    Пул потоков, в котором у каждого потока своя очередь.
+    Задачи одного чата всегда попадают в одну и ту же очередь, поэтому
+    внутри чата порядок сохраняется, а медленный чат не задерживает чаты
+    из других очередей.
+    Количество задач одного чата в очередях ограничено max_pending_per_chat
+    (проверяется через is_full), чтобы очереди не росли вместе с базой
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        process: Callable[[Any], None],
+        max_pending_per_chat: int = None,
+        log: logging.Logger = None,
+    ) -> None:
+        self.process: Callable[[Any], None] = process
+        self.max_pending_per_chat: int | None = max_pending_per_chat
+        self.log: logging.Logger = log or logging.getLogger(__name__)
+
+        self.queues: list[Queue] = [Queue() for _ in range(max(1, workers))]
+        self.threads: list[Thread] = []
+
+        # Ключи задач, которые стоят в очереди или выполняются
+        self._in_progress: set[Hashable] = set()
+
+        # Количество задач чата, которые стоят в очереди или выполняются
+        self._pending_by_chat: dict[int, int] = dict()
+
+        self._lock = Lock()
+
+    def start(self) -> None:
+        if self.threads:
+            return
+
+        for i, queue in enumerate(self.queues):
+            thread = Thread(
+                target=self._run,
+                args=(queue,),
+                name=f"{type(self).__name__}-{i}",
+                daemon=True,
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def get_queue(self, chat_id: int) -> Queue:
+        return self.queues[hash(chat_id) % len(self.queues)]
+
+    def is_in_progress(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._in_progress
+
+    def is_full(self, chat_id: int) -> bool:
+        if self.max_pending_per_chat is None:
+            return False
+
+        with self._lock:
+            return self._pending_by_chat.get(chat_id, 0) >= self.max_pending_per_chat
+
+    def submit(self, chat_id: int, key: Hashable, item: Any) -> bool:
+        """
+        Функция ставит задачу в очередь чата.
+        Возвращает False, если задача с таким ключом уже в работе
+        """
+
+        with self._lock:
+            if key in self._in_progress:
+                return False
+            self._in_progress.add(key)
+            self._pending_by_chat[chat_id] = self._pending_by_chat.get(chat_id, 0) + 1
+
+        self.get_queue(chat_id).put((chat_id, key, item))
+        return True
+
+    def join(self) -> None:
+        """
+        Функция ждет выполнения всех поставленных задач
+        """
+
+        for queue in self.queues:
+            queue.join()
+
+    def _run(self, queue: Queue) -> None:
+        while True:
+            chat_id, key, item = queue.get()
+            try:
+                self.process(item)
+            except Exception:
+                self.log.exception("")
+            finally:
+                with self._lock:
+                    self._in_progress.discard(key)
+
+                    self._pending_by_chat[chat_id] -= 1
+                    if not self._pending_by_chat[chat_id]:
+                        del self._pending_by_chat[chat_id]
+
+                queue.task_done()
@@ -8,8 +8,11 @@ import enum
 import functools
 import logging
 import sys
+from collections import OrderedDict
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
+from threading import Lock
+from typing import Any, Hashable
 
 from telegram import Update
 from telegram.ext import CallbackContext
@@ -35,6 +38,46 @@ class TypeEnum(AutoName):
         }[self]
 
 
+class LRUCache:
+    """
+    Потокобезопасный кэш ограниченного размера, при переполнении
+    удаляются давно не используемые значения
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size: int = max_size
+
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._items:
+                return default
+
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            return self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
 def get_logger(file_name: str, dir_name="logs"):
     log = logging.getLogger(file_name)
     log.setLevel(logging.DEBUG)
@@ -4,6 +4,7 @@
 __author__ = "ipetrash"
 
 
+import hashlib
 import os
 
 from pathlib import Path
@@ -28,6 +29,21 @@ DB_DIR_NAME.mkdir(parents=True, exist_ok=True)
 # Путь к файлу базы данных
 DB_FILE_NAME: str = str(DB_DIR_NAME / "database.sqlite")
 
+# Папка для файлов-очередей уведомлений, которые не удалось отправить в web_api
+SPOOL_DIR: Path = DIR / "spool"
+
+# Результаты поиска сохраняются для пагинации. Хранятся результаты только последних
+# использованных поисков и не дольше указанного времени, после этого поиск выполнится заново
+SEARCH_SNAPSHOT_MAX_NUMBER: int = 100
+SEARCH_SNAPSHOT_TTL_SECONDS: int = 7 * 24 * 60 * 60
+
+# Отправленные уведомления старше указанного количества дней переносятся в архив,
+# чтобы выборка неотправленных, статистика и поиск не замедлялись из-за истории.
+# Перенос выполняется порциями раз в ARCHIVE_INTERVAL_SECONDS
+ARCHIVE_AFTER_DAYS: int = 90
+ARCHIVE_BATCH_SIZE: int = 1000
+ARCHIVE_INTERVAL_SECONDS: int = 60 * 60
+
 # Example: "127.0.0.1:10016"
 ADDRESS_PATH: Path = DIR / "ADDRESS.txt"
 try:
@@ -38,8 +54,73 @@ except:
     HOST: str = "127.0.0.1"
     PORT: int = 10016
 
+# Example: "https://example.com/telegram_notifications_bot"
+# Если задан, бот получает обновления через вебхук на маршруте web_api,
+# иначе - через long polling
+WEBHOOK_URL_PATH: Path = DIR / "WEBHOOK_URL.txt"
+WEBHOOK_URL: str | None = None
+try:
+    WEBHOOK_URL = (
+        os.environ.get("WEBHOOK_URL") or WEBHOOK_URL_PATH.read_text("utf-8").strip()
+    ).rstrip("/")
+except:
+    pass
+
+# Секретная часть пути вебхука, чтобы обновления мог присылать только Telegram
+WEBHOOK_SECRET: str = hashlib.sha256(f"webhook:{TOKEN}".encode("utf-8")).hexdigest()
+
 MESS_MAX_LENGTH: int = 4096
 
+# Максимальное количество уведомлений в одном запросе /add_notify_batch.
+# Все уведомления вставляются одним запросом, поэтому их число ограничено
+# количеством параметров в запросе SQLite: 1000 помещается начиная с SQLite 3.32,
+# в более старых версиях пакет больше Notification.get_add_many_max_number()
+# отклоняется целиком
+ADD_NOTIFY_BATCH_MAX_SIZE: int = 1000
+
+# Количество потоков для работы с базой в web_api и максимальное количество
+# ожидающих запросов, после которого новые запросы ждут освобождения места
+WEB_API_DB_WORKERS: int = 4
+WEB_API_DB_MAX_PENDING: int = 64
+
+# Ограничения частоты отправки сообщений. Telegram допускает около 30 сообщений
+# в секунду от бота и около 1 сообщения в секунду в один чат с небольшими всплесками
+RATE_LIMIT_GLOBAL_PER_SECOND: float = 30
+RATE_LIMIT_GLOBAL_BURST: int = 30
+RATE_LIMIT_CHAT_PER_SECOND: float = 1
+RATE_LIMIT_CHAT_BURST: int = 3
+
+# Количество потоков рассылки. Уведомления одного чата всегда отправляются
+# одним потоком по порядку, разные чаты распределяются между потоками
+SENDING_WORKERS: int = 4
+
+# Максимальное количество уведомлений одного чата в очередях рассылки.
+# Остальные остаются в базе и ставятся в очередь по мере отправки
+SENDING_CHAT_MAX_PENDING: int = 10
+
+# Максимальное количество неотправленных уведомлений, просматриваемых за один проход
+SENDING_SCAN_MAX_NUMBER: int = 1000
+
+# Максимальное количество уведомлений, чей HTML хранится в памяти
+NOTIFICATION_HTML_CACHE_MAX_SIZE: int = 10_000
+
+# Максимальное количество разметок клавиатуры пагинации, которые хранятся в памяти
+PAGINATOR_MARKUP_CACHE_MAX_SIZE: int = 1024
+
+# Максимальное количество сообщений, для которых запоминается отправленное содержимое,
+# чтобы не изменять сообщение, если содержимое не поменялось
+MESSAGE_STATES_MAX_SIZE: int = 10_000
+
+# Количество последних замеров этапов рассылки и обработки callback'ов в памяти
+TIMINGS_MAX_SIZE: int = 10_000
+
+# Профилирование командой бота: длительность по умолчанию и максимальная
+# (в секундах), интервал между выборками стеков и размер списка в отчете
+PROFILE_DEFAULT_SECONDS: int = 10
+PROFILE_MAX_SECONDS: int = 60
+PROFILE_INTERVAL_SECONDS: float = 0.005
+PROFILE_TOP_NUMBER: int = 30
+
 INLINE_BUTTON_TEXT_URL = "🔗 Открыть ссылку"
 INLINE_BUTTON_TEXT_DELETE = "❌ Удалить"
 
@@ -7,32 +7,72 @@ __author__ = "ipetrash"
 import datetime as dt
 import enum
 import html
+import functools
+import heapq
+import itertools
+import operator
+import re
+import sqlite3
+import threading
 import time
+import zlib
 
-from typing import Any, Type, TypeVar, Optional, Iterable
+from array import array
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+from typing import Any, Type, TypeVar, Optional, Iterable, Iterator
 
 # pip install peewee
 from peewee import (
     Model,
+    ModelSelect,
     TextField,
     ForeignKeyField,
     DateTimeField,
     CharField,
     IntegerField,
     BooleanField,
+    BlobField,
     Field,
+    SQL,
+    Expression,
+    OP,
+    chunked,
+    fn,
+    JOIN,
 )
 from playhouse.sqliteq import SqliteQueueDatabase
 
-from telegram_notifications_bot.config import DB_FILE_NAME
-from telegram_notifications_bot.common import TypeEnum
+from telegram_notifications_bot.config import (
+    DB_FILE_NAME,
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    NOTIFICATION_HTML_CACHE_MAX_SIZE,
+    SEARCH_SNAPSHOT_MAX_NUMBER,
+    SEARCH_SNAPSHOT_TTL_SECONDS,
+)
+from telegram_notifications_bot.common import TypeEnum, LRUCache
+from telegram_notifications_bot.metrics import Gauge
 from telegram_notifications_bot.third_party.shorten import shorten
 
+# Максимальное количество параметров в одном запросе: 32766 начиная с SQLite 3.32,
+# в более старых версиях 999
+SQLITE_MAX_VARIABLE_NUMBER: int = (
+    32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+)
+
 # This working with multithreading
 # SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#sqliteq
 db = SqliteQueueDatabase(
     DB_FILE_NAME,
     pragmas={
+        # Свободные страницы возвращаются по частям через PRAGMA incremental_vacuum.
+        # Для существующей базы режим включается миграцией (нужен VACUUM)
+        "auto_vacuum": "incremental",
         "foreign_keys": 1,
         "journal_mode": "wal",  # WAL-mode
         "cache_size": -1024 * 64,  # 64MB page-cache
@@ -41,10 +81,29 @@ db = SqliteQueueDatabase(
     autostart=True,
     queue_max_size=64,  # Max. # of pending writes that can accumulate.
     results_timeout=5.0,  # Max. time to wait for query to be executed.
-    regexp_function=True,
 )
 
 
+@functools.lru_cache(maxsize=256)
+def compile_regexp(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
+def regexp(pattern: str, value: str | None) -> bool:
+    """
+    Функция REGEXP для SQLite. В отличие от встроенной в peewee, шаблон берется
+    из своего кэша, а не компилируется через re.search для каждой строки
+    """
+
+    if value is None:
+        return False
+
+    return compile_regexp(pattern).search(value) is not None
+
+
+db.register_function(regexp, "regexp", 2)
+
+
 class EnumField(CharField):
     """
     This class enable an Enum like field for Peewee
@@ -71,6 +130,73 @@ class EnumField(CharField):
         return self.choices(value_enum)
 
 
+def is_fts_available() -> bool:
+    """
+    Функция проверяет, что SQLite поддерживает FTS5 с токенизатором trigram (SQLite 3.34+)
+    """
+
+    connection = sqlite3.connect(":memory:")
+    try:
+        connection.execute("CREATE VIRTUAL TABLE t USING fts5(text, tokenize='trigram')")
+        return True
+    except sqlite3.Error:
+        return False
+    finally:
+        connection.close()
+
+
+FTS_IS_AVAILABLE: bool = is_fts_available()
+
+# Токенизатор trigram не находит подстроки короче 3 символов
+FTS_MIN_QUERY_LENGTH: int = 3
+
+REGEX_SPECIAL_CHARS: set[str] = set(r".^$*+?{}[]\|()")
+
+
+def is_plain_text(text: str) -> bool:
+    return not any(c in REGEX_SPECIAL_CHARS for c in text)
+
+
+def _collect_required_literals(items: Iterable, literals: list[str]) -> None:
+    current: list[str] = []
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            current.append(chr(av))
+            continue
+
+        if current:
+            literals.append("".join(current))
+            current.clear()
+
+        # Содержимое группы обязательно, как и содержимое повтора хотя бы с одним вхождением.
+        # Ветвления (|), наборы символов и проверки (lookahead) пропускаются
+        if op is sre_parse.SUBPATTERN:
+            _collect_required_literals(av[-1], literals)
+
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            _collect_required_literals(av[2], literals)
+
+    if current:
+        literals.append("".join(current))
+
+
+def get_required_literals(regex: str) -> list[str]:
+    """
+    Функция возвращает подстроки, которые обязательно есть в любом совпадении
+    с регулярным выражением. Например, для "disk\s+(full|error)" это ["disk"]
+    """
+
+    try:
+        items = sre_parse.parse(regex)
+    except re.error:
+        return []
+
+    literals = []
+    _collect_required_literals(items, literals)
+    return literals
+
+
 ChildModel = TypeVar("ChildModel", bound="BaseModel")
 
 
@@ -78,9 +204,29 @@ class BaseModel(Model):
     class Meta:
         database = db
 
+    @classmethod
+    def get_triggers(cls) -> list[str]:
+        """
+        Функция возвращает SQL триггеров, которые создаются вместе с таблицей
+        """
+
+        return []
+
+    @classmethod
+    def create_table(cls, safe: bool = True, **options: Any) -> None:
+        super().create_table(safe=safe, **options)
+
+        for sql in cls.get_triggers():
+            cls._meta.database.execute_sql(sql)
+
     @classmethod
     def get_inherited_models(cls) -> list[Type["BaseModel"]]:
-        return sorted(cls.__subclasses__(), key=lambda x: x.__name__)
+        items = []
+        for sub_cls in cls.__subclasses__():
+            items.append(sub_cls)
+            items += sub_cls.get_inherited_models()
+
+        return sorted(items, key=lambda x: x.__name__)
 
     @classmethod
     def print_count_of_tables(cls) -> None:
@@ -133,25 +279,111 @@ class BaseModel(Model):
         return self.__class__.__name__ + "(" + ", ".join(fields) + ")"
 
 
+def pack_ids(ids: list[int]) -> bytes:
+    """
+    Функция сжимает отсортированный список id: хранятся разницы между
+    соседними id, которые затем сжимаются zlib
+    """
+
+    deltas = array("Q", (b - a for a, b in zip([0] + ids, ids)))
+    return zlib.compress(deltas.tobytes())
+
+
+def unpack_ids(data: bytes) -> list[int]:
+    deltas = array("Q")
+    deltas.frombytes(zlib.decompress(data))
+    return list(itertools.accumulate(deltas))
+
+
 class Search(BaseModel):
     text = TextField(unique=True)
+    # Результаты поиска (сжатые id уведомлений), чтобы пагинация не выполняла поиск заново
+    ids = BlobField(null=True)
+    last_used_datetime = DateTimeField(null=True, default=dt.datetime.now)
 
     @classmethod
     def get_by(cls, text: str) -> Optional["Search"]:
         return cls.get_or_none(text=text)
 
     @classmethod
-    def add(cls, text: str) -> "Search":
+    def add(cls, text: str, ids: list[int] = None) -> "Search":
         obj = cls.get_by(text)
         if not obj:
             obj = cls.create(text=text)
 
+        if ids is not None:
+            obj.set_ids(ids)
+
         return obj
 
+    def set_ids(self, ids: list[int]) -> None:
+        self.ids = pack_ids(ids)
+        self.last_used_datetime = dt.datetime.now()
+        self.save()
+
+        type(self).evict()
+
+    def get_ids(self) -> list[int] | None:
+        """
+        Функция возвращает сохраненные результаты поиска или None, если их уже удалили
+        """
+
+        if self.ids is None:
+            return
+
+        # Время использования обновляется не чаще раза в минуту, чтобы не нагружать очередь записи
+        now = dt.datetime.now()
+        if (
+            not self.last_used_datetime
+            or now - self.last_used_datetime > dt.timedelta(minutes=1)
+        ):
+            self.last_used_datetime = now
+
+            cls = type(self)
+            cls.update(last_used_datetime=now).where(cls.id == self.id).execute()
+
+        return unpack_ids(self.ids)
+
+    @classmethod
+    def evict(
+        cls,
+        max_number: int = SEARCH_SNAPSHOT_MAX_NUMBER,
+        ttl_seconds: int = SEARCH_SNAPSHOT_TTL_SECONDS,
+    ) -> int:
+        """
+        Функция удаляет сохраненные результаты давно не используемых поисков и тех,
+        что не входят в max_number последних использованных.
+        Сами записи остаются, т.к. на них ссылаются кнопки пагинации в сообщениях
+        """
+
+        has_ids = cls.ids.is_null(False)
+        recent_ids = (
+            cls.select(cls.id)
+            .where(has_ids)
+            .order_by(cls.last_used_datetime.desc())
+            .limit(max_number)
+        )
+        expired = dt.datetime.now() - dt.timedelta(seconds=ttl_seconds)
+
+        return (
+            cls.update(ids=None)
+            .where(
+                has_ids,
+                (
+                    cls.last_used_datetime.is_null(True)
+                    | (cls.last_used_datetime < expired)
+                    | cls.id.not_in(recent_ids)
+                ),
+            )
+            .execute()
+        )
+
 
 class NotificationGroup(BaseModel):
     name = TextField(unique=True)
     max_number = IntegerField()
+    # Значение поддерживается триггерами на таблице Notification
+    total_notifications = IntegerField(default=0)
 
     @classmethod
     def get_by(cls, name: str) -> Optional["NotificationGroup"]:
@@ -181,17 +413,52 @@ class NotificationGroup(BaseModel):
         return obj
 
     def get_total_notifications(self) -> int:
-        return len(self.notifications)
+        # Значение меняется триггерами в базе, поэтому берется не из объекта, а из таблицы
+        cls = type(self)
+        self.total_notifications = (
+            cls.select(cls.total_notifications).where(cls.id == self.id).scalar()
+        )
+        return self.total_notifications
 
     def is_complete(self) -> bool:
         return self.get_total_notifications() >= self.max_number
 
+    def set_as_send(self) -> int:
+        """
+        Функция устанавливает дату отправки всем уведомлениям группы одним запросом
+        """
+
+        return (
+            Notification.update(sending_datetime=dt.datetime.now())
+            .where(
+                Notification.group == self,
+                Notification.sending_datetime.is_null(True),
+            )
+            .execute()
+        )
+
     def get_notification(self, idx: int = 0) -> Optional["Notification"]:
-        items: list[Notification] = list(self.notifications)
-        try:
-            return items[idx]
-        except IndexError:
-            return
+        if idx < 0:
+            idx += self.get_total_notifications()
+
+        # Доставленные уведомления группы могли быть перенесены в архив
+        for model in [Notification, NotificationArchive]:
+            obj = model.get_or_none(
+                model.group == self,
+                model.index_in_group == idx,
+            )
+            if obj:
+                break
+
+        if obj:
+            # Группа уже загружена, поэтому повторно ее из базы не запрашиваем
+            obj.group = self
+
+        return obj
+
+
+# Отрисованный HTML уведомлений: id -> ((позиция в группе, размер группы), HTML)
+HTML_CACHE = LRUCache(NOTIFICATION_HTML_CACHE_MAX_SIZE)
 
 
 class Notification(BaseModel):
@@ -208,9 +475,172 @@ class Notification(BaseModel):
         NotificationGroup, null=True, backref="notifications"
     )
     need_html_escape_content = BooleanField(default=True)
+    # Позиция в группе, значение назначается триггером при вставке
+    index_in_group = IntegerField(null=True)
+
+    class Meta:
+        indexes = (
+            (("group", "index_in_group"), False),
+            # Для первого и последнего уведомления чата в статистике
+            (("chat_id", "append_datetime"), False),
+        )
+
+    def save(self, *args: Any, **kwargs: Any) -> int:
+        HTML_CACHE.pop(self.id)
+        return super().save(*args, **kwargs)
+
+    def delete_instance(self, *args: Any, **kwargs: Any) -> int:
+        HTML_CACHE.pop(self.id)
+        return super().delete_instance(*args, **kwargs)
 
     @classmethod
-    def add(
+    def select_with_group(cls) -> ModelSelect:
+        """
+        Функция возвращает запрос уведомлений вместе с группами, чтобы для
+        get_html и пагинации не нужно было отдельно загружать группу
+        """
+
+        return cls.select(cls, NotificationGroup).join(
+            NotificationGroup, JOIN.LEFT_OUTER
+        )
+
+    @classmethod
+    def get_with_group(cls, id: int) -> Optional["Notification"]:
+        obj = cls.select_with_group().where(cls.id == id).first()
+        if not obj:
+            # Доставленное уведомление могло быть перенесено в архив
+            obj = NotificationArchive.get_with_group(id)
+
+        return obj
+
+    @classmethod
+    def get_fts_table_name(cls) -> str:
+        return f"{cls._meta.table_name}_fts"
+
+    @classmethod
+    def get_triggers(cls) -> list[str]:
+        table = cls._meta.table_name
+        group_table = NotificationGroup._meta.table_name
+        archive_table = NotificationArchive._meta.table_name
+
+        # Позиция и счетчик уведомлений в группе обновляются в той же транзакции,
+        # что и вставка, в том числе при записи из других процессов.
+        # При переносе в архив (см. NotificationArchive.archive) группа не меняется
+        triggers = [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_group_after_insert
+            AFTER INSERT ON {table}
+            WHEN NEW.group_id IS NOT NULL
+            BEGIN
+                UPDATE {table}
+                SET index_in_group = (
+                    SELECT total_notifications FROM {group_table} WHERE id = NEW.group_id
+                )
+                WHERE id = NEW.id;
+
+                UPDATE {group_table}
+                SET total_notifications = total_notifications + 1
+                WHERE id = NEW.group_id;
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_group_after_delete
+            AFTER DELETE ON {table}
+            WHEN OLD.group_id IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM {archive_table} WHERE id = OLD.id)
+            BEGIN
+                UPDATE {table}
+                SET index_in_group = index_in_group - 1
+                WHERE group_id = OLD.group_id AND index_in_group > OLD.index_in_group;
+
+                UPDATE {group_table}
+                SET total_notifications = total_notifications - 1
+                WHERE id = OLD.group_id;
+            END
+            """,
+        ]
+
+        # Статистика уведомлений по годам обновляется вместе со вставкой и удалением
+        triggers += cls.get_stats_triggers(NotificationStats._meta.table_name)
+        return triggers + cls.get_fts_triggers()
+
+    @classmethod
+    def get_stats_triggers(cls, name_prefix: str) -> list[str]:
+        table = cls._meta.table_name
+        stats_table = NotificationStats._meta.table_name
+
+        return [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {name_prefix}_after_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {stats_table}(chat_id, year, type, number)
+                VALUES (
+                    NEW.chat_id,
+                    CAST(STRFTIME('%Y', NEW.append_datetime) AS INTEGER),
+                    NEW.type,
+                    1
+                )
+                ON CONFLICT(chat_id, year, type) DO UPDATE SET number = number + 1;
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {name_prefix}_after_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                UPDATE {stats_table}
+                SET number = number - 1
+                WHERE chat_id = OLD.chat_id
+                    AND year = CAST(STRFTIME('%Y', OLD.append_datetime) AS INTEGER)
+                    AND type = OLD.type;
+            END
+            """,
+        ]
+
+    @classmethod
+    def get_fts_triggers(cls) -> list[str]:
+        if not FTS_IS_AVAILABLE:
+            return []
+
+        # Полнотекстовый индекс по тексту, в котором ищет поиск (name + " " + message).
+        # Таблица без содержимого (content=''), т.к. из нее нужны только id уведомлений
+        table = cls._meta.table_name
+        fts_table = cls.get_fts_table_name()
+        fts_text_new = "NEW.name || ' ' || NEW.message"
+        fts_text_old = "OLD.name || ' ' || OLD.message"
+        return [
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table}
+            USING fts5(text, content='', tokenize='trigram')
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_after_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {fts_table}(rowid, text) VALUES (NEW.id, {fts_text_new});
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_after_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, text)
+                VALUES ('delete', OLD.id, {fts_text_old});
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_after_update
+            AFTER UPDATE OF name, message ON {table}
+            BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, text)
+                VALUES ('delete', OLD.id, {fts_text_old});
+                INSERT INTO {fts_table}(rowid, text) VALUES (NEW.id, {fts_text_new});
+            END
+            """,
+        ]
+
+    @classmethod
+    def _get_fields_for_add(
         cls,
         chat_id: int,
         name: str,
@@ -222,7 +652,14 @@ class Notification(BaseModel):
         group: NotificationGroup | str = None,
         group_max_number: int = None,
         need_html_escape_content: bool = True,
-    ) -> "Notification":
+        number_in_batch: int = 0,
+    ) -> dict[str, Any]:
+        """
+        Функция проверяет данные уведомления и возвращает значения полей для вставки.
+        number_in_batch - количество уведомлений этой же группы, которые будут
+        вставлены вместе с этим уведомлением, но еще не находятся в базе
+        """
+
         if isinstance(url, str) and not url.strip():
             url = None
 
@@ -234,7 +671,7 @@ class Notification(BaseModel):
             )
 
         if group:
-            number = group.get_total_notifications()
+            number = group.get_total_notifications() + number_in_batch
             if group.max_number <= number:
                 raise Exception(
                     f"Количество уведомлений {number} в группе {group} "
@@ -245,7 +682,33 @@ class Notification(BaseModel):
         if not group:
             group = None
 
-        return cls.create(
+        return dict(
+            chat_id=chat_id,
+            name=name,
+            message=message,
+            type=type,
+            url=url,
+            has_delete_button=has_delete_button,
+            show_type=show_type,
+            group=group,
+            need_html_escape_content=need_html_escape_content,
+        )
+
+    @classmethod
+    def add(
+        cls,
+        chat_id: int,
+        name: str,
+        message: str,
+        type: TypeEnum = TypeEnum.INFO,
+        url: str = None,
+        has_delete_button: bool = False,
+        show_type: bool = True,
+        group: NotificationGroup | str = None,
+        group_max_number: int = None,
+        need_html_escape_content: bool = True,
+    ) -> "Notification":
+        fields = cls._get_fields_for_add(
             chat_id=chat_id,
             name=name,
             message=message,
@@ -254,16 +717,133 @@ class Notification(BaseModel):
             has_delete_button=has_delete_button,
             show_type=show_type,
             group=group,
+            group_max_number=group_max_number,
             need_html_escape_content=need_html_escape_content,
         )
 
+        obj = cls.create(**fields)
+        if obj.group_id is not None:
+            # Позиция в группе и размер группы назначаются триггером при вставке
+            obj.index_in_group = (
+                cls.select(cls.index_in_group).where(cls.id == obj.id).scalar()
+            )
+            obj.group.get_total_notifications()
+
+        return obj
+
+    @classmethod
+    def get_add_many_max_number(cls) -> int:
+        """
+        Функция возвращает, сколько уведомлений помещается в один INSERT add_many.
+        Учитываются все поля, т.к. peewee добавляет и значения по умолчанию
+        """
+
+        return SQLITE_MAX_VARIABLE_NUMBER // len(cls._meta.fields)
+
+    @classmethod
+    def add_many(cls, items: list[dict[str, Any]]) -> list[str | None]:
+        """
+        Функция добавляет уведомления одним INSERT, т.е. атомарно: либо добавляются
+        все прошедшие проверку уведомления, либо ни одного. Если пакет не помещается
+        в один запрос (см. SQLITE_MAX_VARIABLE_NUMBER), то он отклоняется целиком.
+        Каждый элемент items - аргументы для Notification.add.
+        Возвращает для каждого элемента текст ошибки или None, если он был добавлен
+        """
+
+        max_number = cls.get_add_many_max_number()
+        if len(items) > max_number:
+            raise Exception(
+                f"Превышено количество уведомлений в пакете: {len(items)}, "
+                f"максимальное количество {max_number}"
+            )
+
+        errors: list[str | None] = []
+        rows: list[dict[str, Any]] = []
+
+        # Количество уведомлений групп (по имени) из этого пакета, которых еще нет в базе
+        number_by_group_name: dict[str, int] = dict()
+
+        for item in items:
+            group = item.get("group")
+            group_name = group.name if isinstance(group, NotificationGroup) else group
+            number_in_batch = number_by_group_name.get(group_name, 0)
+
+            try:
+                fields = cls._get_fields_for_add(**item, number_in_batch=number_in_batch)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+
+            if fields["group"]:
+                number_by_group_name[group_name] = number_in_batch + 1
+
+            rows.append(fields)
+            errors.append(None)
+
+        if rows:
+            cls.insert_many(rows).execute()
+
+        return errors
+
+    @classmethod
+    def iter_unsent(
+        cls,
+        batch_size: int = 100,
+        after_id: int = 0,
+    ) -> Iterator["Notification"]:
+        """
+        Функция, что возвращает неотправленные уведомления с id больше after_id
+        порциями по batch_size.
+        Следующая порция выбирается по последнему id (keyset-пагинация) через
+        частичный индекс неотправленных, поэтому в памяти находится только одна порция
+        """
+
+        # Условие записано без параметра (IS NULL, а не IS ?), иначе SQLite
+        # не сможет использовать частичный индекс notification_unsent
+        is_unsent = Expression(cls.sending_datetime, OP.IS, SQL("NULL"))
+
+        last_id = after_id
+        while True:
+            items: list[Notification] = list(
+                cls.select_with_group()
+                .where(is_unsent, cls.id > last_id)
+                .order_by(cls.id)
+                .limit(batch_size)
+            )
+            yield from items
+
+            if len(items) < batch_size:
+                return
+
+            last_id = items[-1].id
+
     @classmethod
     def get_unsent(cls) -> list["Notification"]:
         """
         Функция, что возвращает неотправленные уведомления
         """
 
-        return list(cls.select().where(cls.sending_datetime.is_null(True)))
+        return list(cls.iter_unsent())
+
+    @classmethod
+    def get_unsent_number(cls) -> int:
+        """
+        Функция возвращает количество неотправленных уведомлений
+        """
+
+        # Без параметра, чтобы использовался частичный индекс (см. iter_unsent)
+        is_unsent = Expression(cls.sending_datetime, OP.IS, SQL("NULL"))
+        return cls.select().where(is_unsent).count()
+
+    @classmethod
+    def is_sent(cls, id: int) -> bool:
+        """
+        Функция проверяет по базе, что уведомление уже отправлено (или его нет).
+        Уведомления группы помечаются вместе, поэтому проверка подходит и для них
+        """
+
+        row = cls.select(cls.sending_datetime).where(cls.id == id).tuples().first()
+        return row is None or row[0] is not None
 
     def set_as_send(self) -> None:
         """
@@ -274,18 +854,80 @@ class Notification(BaseModel):
             self.sending_datetime = dt.datetime.now()
             self.save()
 
+    @classmethod
+    def set_as_send_many(cls, ids: Iterable[int], batch_size: int = 500) -> int:
+        """
+        Функция устанавливает дату отправки уведомлениям с указанными id.
+        Вместо сохранения каждого уведомления выполняется один UPDATE на batch_size id,
+        чтобы не забивать очередь записи SqliteQueueDatabase
+        """
+
+        sending_datetime = dt.datetime.now()
+
+        number = 0
+        for batch in chunked(ids, batch_size):
+            number += (
+                cls.update(sending_datetime=sending_datetime)
+                .where(cls.id.in_(batch), cls.sending_datetime.is_null(True))
+                .execute()
+            )
+        return number
+
+    @classmethod
+    def get_first_and_last_append_datetime(
+        cls, chat_id: int
+    ) -> tuple[dt.datetime | None, dt.datetime | None]:
+        """
+        Функция возвращает даты добавления первого и последнего уведомления чата,
+        в том числе перенесенных в архив.
+        Значения берутся из индекса (chat_id, append_datetime), без сортировки таблицы
+        """
+
+        first_items = []
+        last_items = []
+        for model in [Notification, NotificationArchive]:
+            query = model.select(model.append_datetime).where(model.chat_id == chat_id)
+
+            first = query.order_by(model.append_datetime).first()
+            if first:
+                first_items.append(first.append_datetime)
+
+            last = query.order_by(model.append_datetime.desc()).first()
+            if last:
+                last_items.append(last.append_datetime)
+
+        return (
+            min(first_items) if first_items else None,
+            max(last_items) if last_items else None,
+        )
+
     def get_index_in_group(self) -> int:
-        if self.group:
-            for i in range(self.group.get_total_notifications()):
-                if self == self.group.get_notification(i):
-                    return i
-        return -1
+        if self.group_id is None:
+            return -1
+        return self.index_in_group
 
     def get_html(self) -> str:
         """
-        Функция возвращает текст для отправки запроса в формате HTML
+        Функция возвращает текст для отправки запроса в формате HTML.
+        Текст кэшируется и отрисовывается заново, только если изменились
+        позиция уведомления в группе или размер группы
         """
 
+        # Размер группы берется из загруженной вместе с уведомлением группы (см. select_with_group)
+        total = None
+        if self.group_id is not None:
+            total = self.group.total_notifications
+
+        version = (self.index_in_group, total)
+        cached = HTML_CACHE.get(self.id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        text = self._render_html(total)
+        HTML_CACHE.set(self.id, (version, text))
+        return text
+
+    def _render_html(self, total: int | None) -> str:
         text = ""
         if self.show_type:
             text += self.type.emoji + " "
@@ -298,9 +940,8 @@ class Notification(BaseModel):
             message = html.escape(message)
 
         number_in_group: str = ""
-        if self.group:
+        if total is not None:
             number = self.get_index_in_group() + 1
-            total = self.group.get_total_notifications()
             number_in_group = f" [{number}/{total}]"
 
         text += f"<b>{name}</b>{number_in_group}\n{message}"
@@ -308,25 +949,95 @@ class Notification(BaseModel):
         return text.strip()
 
     def is_first_in_group(self) -> bool:
-        if not self.group:
-            return False
-        return self == self.group.get_notification()
+        return self.get_index_in_group() == 0
+
+    @classmethod
+    def __get_fts_filter(cls, text: str) -> Field | None:
+        """
+        Функция возвращает условие поиска подстроки без учета регистра через
+        полнотекстовый индекс или None, если индекс для этой подстроки не подходит
+        """
+
+        if not FTS_IS_AVAILABLE or len(text) < FTS_MIN_QUERY_LENGTH:
+            return
+
+        fts_table = cls.get_fts_table_name()
+        phrase = '"' + text.replace('"', '""') + '"'
+        return cls.id.in_(
+            SQL(
+                f"(SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH ?)",
+                [phrase],
+            )
+        )
 
     @classmethod
     def __get_filter_for_search(cls, regex: str) -> Field:
+        # Обычный текст ищется только через полнотекстовый индекс
+        if is_plain_text(regex):
+            fts_filter = cls.__get_fts_filter(regex)
+            if fts_filter is not None:
+                return fts_filter
+
         regex = f"(?i){regex}"  # Без учета регистра
 
         # Сложение полей и строк порождает правильное сложение данных в запросе базы
-        return (cls.name + " " + cls.message).regexp(regex)
+        text = cls.name + " " + cls.message
+
+        # Обязательные подстроки шаблона проверяются до REGEXP, поэтому функция
+        # на Python вызывается только для записей, которые их содержат
+        filters = []
+        for literal in get_required_literals(regex):
+            fts_filter = cls.__get_fts_filter(literal)
+            if fts_filter is not None:
+                filters.append(fts_filter)
+                continue
+
+            # LIKE не учитывает регистр только для ASCII
+            for part in re.findall(r"[\x00-\x7f]+", literal):
+                filters.append(text.contains(part))
+
+        filters.append(text.regexp(regex))
+        return functools.reduce(operator.and_, filters)
 
     @classmethod
-    def search(cls, regex: str) -> tuple[Search | None, list[int]]:
+    def __get_ids_for_search(cls, regex: str) -> list[int]:
         expr = cls.__get_filter_for_search(regex)
         query = cls.select(cls.id).where(expr).order_by(cls.id)
-        items = [obj.id for obj in query]
-        search = Search.add(regex) if items else None
+        return [obj.id for obj in query]
+
+    @classmethod
+    def get_ids_for_search(cls, regex: str) -> list[int]:
+        """
+        Функция возвращает отсортированные id найденных уведомлений, в том числе
+        перенесенных в архив. При переносе id сохраняются, поэтому они не пересекаются
+        """
+
+        return list(
+            heapq.merge(
+                Notification.__get_ids_for_search(regex),
+                NotificationArchive.__get_ids_for_search(regex),
+            )
+        )
+
+    @classmethod
+    def search(cls, regex: str) -> tuple[Search | None, list[int]]:
+        items = cls.get_ids_for_search(regex)
+        search = Search.add(regex, ids=items) if items else None
         return search, items
 
+    @classmethod
+    def get_ids_by_search(cls, search: Search) -> list[int]:
+        """
+        Функция возвращает сохраненные результаты поиска, а если их уже удалили,
+        то выполняет поиск заново
+        """
+
+        ids = search.get_ids()
+        if ids is None:
+            _, ids = cls.search(search.text)
+
+        return ids
+
     @classmethod
     def get_by_search(
         cls,
@@ -334,15 +1045,231 @@ class Notification(BaseModel):
         page: int = 1,
     ) -> Optional["Notification"]:
         if isinstance(regex, Search):
-            regex = regex.text
+            # Если результаты поиска сохранены, то уведомление ищется по id
+            ids = regex.get_ids()
+            if ids is None:
+                ids = cls.get_ids_for_search(regex.text)
+        else:
+            ids = cls.get_ids_for_search(regex)
+
+        if not 1 <= page <= len(ids):
+            return
+        return cls.get_with_group(ids[page - 1])
+
+
+class NotificationArchive(Notification):
+    """
+    Доставленные уведомления, перенесенные из Notification, чтобы таблица с новыми
+    уведомлениями оставалась маленькой. При переносе id сохраняются, а поиск,
+    статистика и пагинация групп учитывают обе таблицы
+    """
 
-        items = cls.paginating(
-            page=page,
-            items_per_page=1,
-            filters=[cls.__get_filter_for_search(regex)],
-            order_by=cls.id,
+    group: NotificationGroup = ForeignKeyField(
+        NotificationGroup, null=True, backref="archived_notifications"
+    )
+
+    class Meta:
+        indexes = (
+            (("group", "index_in_group"), False),
+            (("chat_id", "append_datetime"), False),
         )
-        return items[0] if items else None
+
+    @classmethod
+    def get_with_group(cls, id: int) -> Optional["NotificationArchive"]:
+        return cls.select_with_group().where(cls.id == id).first()
+
+    @classmethod
+    def get_triggers(cls) -> list[str]:
+        table = cls._meta.table_name
+        hot_table = Notification._meta.table_name
+        stats_table = NotificationStats._meta.table_name
+
+        # Вставка в архив удаляет уведомление из Notification в том же запросе,
+        # поэтому перенос атомарный и без транзакции (ее нет в SqliteQueueDatabase).
+        # Статистика при переносе не меняется: удаление вычитает, а вставка добавляет
+        triggers = [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_after_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                DELETE FROM {hot_table} WHERE id = NEW.id;
+            END
+            """,
+        ]
+        triggers += cls.get_stats_triggers(f"{stats_table}_{table}")
+        return triggers + cls.get_fts_triggers()
+
+    @classmethod
+    def archive(
+        cls,
+        older_than_days: int = ARCHIVE_AFTER_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+    ) -> int:
+        """
+        Функция переносит в архив отправленные уведомления старше older_than_days дней
+        порциями по batch_size, после чего освобождает страницы базы через
+        PRAGMA incremental_vacuum. Уведомления группы переносятся, только когда
+        все уведомления группы отправлены и старше older_than_days.
+        Возвращает количество перенесенных уведомлений
+        """
+
+        hot = Notification
+        before = dt.datetime.now() - dt.timedelta(days=older_than_days)
+
+        active_group_ids = hot.select(hot.group).where(
+            hot.group.is_null(False),
+            hot.sending_datetime.is_null(True) | (hot.append_datetime >= before),
+        )
+
+        # Последнее уведомление не переносится, иначе SQLite может выдать
+        # его id новому уведомлению и id в архиве повторятся
+        max_id = hot.select(fn.MAX(hot.id))
+
+        query = (
+            hot.select(hot.id)
+            .where(
+                hot.sending_datetime.is_null(False),
+                hot.append_datetime < before,
+                hot.id < max_id,
+                hot.group.is_null(True) | hot.group.not_in(active_group_ids),
+            )
+            .order_by(hot.id)
+            .limit(batch_size)
+        )
+
+        # Поле group в архиве объявлено заново, поэтому порядок полей может отличаться
+        names = [field.name for field in hot._meta.sorted_fields]
+        hot_fields = [hot._meta.fields[name] for name in names]
+        fields = [cls._meta.fields[name] for name in names]
+
+        number = 0
+        while True:
+            ids = [obj.id for obj in query]
+            if not ids:
+                break
+
+            cls.insert_from(
+                hot.select(*hot_fields).where(hot.id.in_(ids)),
+                fields,
+            ).execute()
+            number += len(ids)
+
+            if len(ids) < batch_size:
+                break
+
+        if number:
+            cls._meta.database.execute_sql("PRAGMA incremental_vacuum")
+
+        return number
+
+
+class NotificationStats(BaseModel):
+    """
+    Количество уведомлений чата по годам и типам.
+    Значения поддерживаются триггерами на таблицах Notification и NotificationArchive
+    """
+
+    chat_id = IntegerField()
+    year = IntegerField()
+    type = EnumField(choices=TypeEnum)
+    number = IntegerField(default=0)
+
+    class Meta:
+        indexes = ((("chat_id", "year", "type"), True),)
+
+    @classmethod
+    def get_number_by_year(cls, chat_id: int) -> dict[int, int]:
+        """
+        Функция возвращает количество уведомлений чата по годам, от новых к старым
+        """
+
+        query = (
+            cls.select(cls.year, fn.SUM(cls.number))
+            .where(cls.chat_id == chat_id)
+            .group_by(cls.year)
+            .having(fn.SUM(cls.number) > 0)
+            .order_by(cls.year.desc())
+        )
+        return dict(query.tuples())
+
+
+# Частичный индекс только по неотправленным уведомлениям, его размер не зависит от истории
+Notification.add_index(
+    Notification.index(
+        Notification.id,
+        name="notification_unsent",
+        # Параметры в условии частичного индекса запрещены, поэтому условие задается текстом
+        where=SQL("sending_datetime IS NULL"),
+    )
+)
+
+
+class DataChangeWatcher:
+    """
+    Класс для ожидания изменений в базе данных, в том числе сделанных из других процессов.
+
+    Используется PRAGMA data_version: значение меняется, когда другое подключение
+    (другой поток или процесс) фиксирует изменения в файле базы.
+    Проверка значения дешевая, поэтому ожидание не нагружает процессор
+    """
+
+    def __init__(self, model: Type[BaseModel], interval: float = 0.05) -> None:
+        self.model: Type[BaseModel] = model
+        self.interval: float = interval
+
+        self._last_version: int | None = None
+        self._event = threading.Event()
+
+    def get_version(self) -> int:
+        # Запрос нужно выполнить в подключении текущего потока, а не в очереди записи
+        connection = self.model._meta.database.connection()
+        return connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def notify(self) -> None:
+        """
+        Функция для пробуждения ожидающего потока, без ожидания следующей проверки
+        """
+
+        self._event.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Функция ожидает изменения в базе с момента предыдущего вызова.
+        Возвращает False, если за время timeout изменений не было
+        """
+
+        deadline: float | None = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        while True:
+            version = self.get_version()
+            if version != self._last_version:
+                self._last_version = version
+                return True
+
+            interval = self.interval
+            if deadline is not None:
+                interval = min(interval, deadline - time.monotonic())
+                if interval <= 0:
+                    return False
+
+            if self._event.wait(interval):
+                self._event.clear()
+                return True
+
+
+# Значения вычисляются при запросе метрик
+METRIC_UNSENT = Gauge(
+    "notify_unsent_notifications",
+    "Количество неотправленных уведомлений",
+    func=Notification.get_unsent_number,
+)
+METRIC_DB_WRITE_QUEUE_SIZE = Gauge(
+    "notify_db_write_queue_size",
+    "Количество запросов в очереди записи SqliteQueueDatabase",
+    func=db.queue_size,
+)
 
 
 db.connect()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import bisect
+import math
+import threading
+
+from abc import ABC, abstractmethod
+from typing import Callable
+
+
+Labels = tuple[str, ...]
+
+# Границы корзин гистограмм по умолчанию, в секундах
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Labels, values: Labels) -> str:
+    if not names:
+        return ""
+
+    items = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(items) + "}"
+
+
+class Registry:
+    """
+    Набор метрик процесса, который выводится в текстовом формате Prometheus
+    """
+
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "Metric") -> None:
+        with self._lock:
+            if any(m.name == metric.name for m in self.metrics):
+                raise Exception(f"Метрика {metric.name!r} уже зарегистрирована")
+
+            self.metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self.metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric(ABC):
+    """
+    Базовый класс метрики: значения по меткам возвращает get_values
+    """
+
+    type: str = ""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Labels = (),
+        registry: Registry | None = REGISTRY,
+    ) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.label_names: Labels = tuple(label_names)
+
+        if registry:
+            registry.register(self)
+
+    @abstractmethod
+    def get_values(self) -> dict[Labels, float]:
+        pass
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} "
+            f"{_format_value(value)}"
+            for labels, value in sorted(self.get_values().items())
+        ]
+
+
+class _ThreadShards:
+    """
+    Значения метрики по потокам: каждый поток изменяет только свой словарь,
+    поэтому при обновлении не нужны блокировки. Значения суммируются при выводе
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = dict()
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def copies(self) -> list[dict]:
+        with self._lock:
+            shards = list(self._shards)
+
+        # Копирование словаря в CPython атомарно относительно других потоков
+        return [shard.copy() for shard in shards]
+
+
+class Counter(Metric):
+    """
+    Счетчик, который только растет. Если передана функция func,
+    то значение берется из нее при выводе (для счетчиков, которые уже ведутся в коде)
+    """
+
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Labels = (),
+        func: Callable[[], float] = None,
+        registry: Registry | None = REGISTRY,
+    ) -> None:
+        super().__init__(name, help, label_names, registry)
+
+        self.func: Callable[[], float] | None = func
+        self._shards = _ThreadShards()
+
+    def inc(self, value: float = 1, labels: Labels = ()) -> None:
+        shard = self._shards.get()
+        shard[labels] = shard.get(labels, 0) + value
+
+    def get_values(self) -> dict[Labels, float]:
+        if self.func:
+            return {(): self.func()}
+
+        # Счетчик без меток выводится и до первого изменения
+        values: dict[Labels, float] = {} if self.label_names else {(): 0}
+        for shard in self._shards.copies():
+            for labels, value in shard.items():
+                values[labels] = values.get(labels, 0) + value
+
+        return values
+
+    def get(self, labels: Labels = ()) -> float:
+        return self.get_values().get(labels, 0)
+
+
+class Gauge(Metric):
+    """
+    Текущее значение, которое задается через set
+    или вычисляется функцией func при выводе
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Labels = (),
+        func: Callable[[], float] = None,
+        registry: Registry | None = REGISTRY,
+    ) -> None:
+        super().__init__(name, help, label_names, registry)
+
+        self.func: Callable[[], float] | None = func
+        self._values: dict[Labels, float] = dict()
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self._values[labels] = value
+
+    def get_values(self) -> dict[Labels, float]:
+        if self.func:
+            return {(): self.func()}
+
+        return self._values.copy()
+
+    def get(self, labels: Labels = ()) -> float:
+        return self.get_values().get(labels, 0)
+
+
+class Histogram(Metric):
+    """
+    Гистограмма значений (например, длительности в секундах).
+    Корзины считаются по потокам, как у Counter
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: Registry | None = REGISTRY,
+    ) -> None:
+        super().__init__(name, help, label_names, registry)
+
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets)) + (math.inf,)
+        self._shards = _ThreadShards()
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        shard = self._shards.get()
+
+        # [количество по корзинам (не накопительное), сумма, количество]
+        item = shard.get(labels)
+        if item is None:
+            item = shard[labels] = [[0] * len(self.buckets), 0.0, 0]
+
+        item[0][bisect.bisect_left(self.buckets, value)] += 1
+        item[1] += value
+        item[2] += 1
+
+    def get_values(self) -> dict[Labels, tuple[list[int], float, int]]:
+        values = dict()
+        for shard in self._shards.copies():
+            for labels, (counts, total, number) in shard.items():
+                # Список корзин копируется, т.к. поток может его изменять
+                counts = list(counts)
+
+                old = values.get(labels)
+                if old:
+                    counts = [a + b for a, b in zip(old[0], counts)]
+                    total += old[1]
+                    number += old[2]
+
+                values[labels] = (counts, total, number)
+
+        return values
+
+    def render(self) -> list[str]:
+        lines = []
+        label_names = self.label_names + ("le",)
+
+        for labels, (counts, total, number) in sorted(self.get_values().items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = _format_labels(
+                    label_names, labels + (_format_value(bucket),)
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+
+            labels = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {number}")
+
+        return lines
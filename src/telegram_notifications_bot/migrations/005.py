@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+from playhouse.migrate import SqliteDatabase, SqliteMigrator, IntegerField, migrate
+from telegram_notifications_bot.config import DB_FILE_NAME
+
+
+db = SqliteDatabase(DB_FILE_NAME)
+migrator = SqliteMigrator(db)
+
+
+with db.atomic():
+    migrate(
+        migrator.add_column(
+            "notificationgroup", "total_notifications", IntegerField(default=0)
+        ),
+    )
+
+    # Дальше значение поддерживается триггерами
+    db.execute_sql(
+        """
+        UPDATE notificationgroup
+        SET total_notifications = (
+            SELECT COUNT(*) FROM notification
+            WHERE notification.group_id = notificationgroup.id
+        )
+        """
+    )
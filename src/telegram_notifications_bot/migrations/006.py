@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+from playhouse.migrate import SqliteDatabase, SqliteMigrator, IntegerField, migrate
+from telegram_notifications_bot.config import DB_FILE_NAME
+
+
+db = SqliteDatabase(DB_FILE_NAME)
+migrator = SqliteMigrator(db)
+
+
+with db.atomic():
+    migrate(
+        migrator.add_column("notification", "index_in_group", IntegerField(null=True)),
+    )
+
+    # Дальше значение назначается триггером при вставке
+    db.execute_sql(
+        """
+        UPDATE notification
+        SET index_in_group = (
+            SELECT COUNT(*) FROM notification AS n
+            WHERE n.group_id = notification.group_id AND n.id < notification.id
+        )
+        WHERE group_id IS NOT NULL
+        """
+    )
+
+    migrate(
+        migrator.add_index("notification", ("group_id", "index_in_group"), False),
+    )
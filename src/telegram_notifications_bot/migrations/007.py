@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+# SOURCE: http://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+
+
+from playhouse.migrate import (
+    SqliteDatabase,
+    SqliteMigrator,
+    BlobField,
+    DateTimeField,
+    migrate,
+)
+from telegram_notifications_bot.config import DB_FILE_NAME
+
+
+db = SqliteDatabase(DB_FILE_NAME)
+migrator = SqliteMigrator(db)
+
+
+with db.atomic():
+    migrate(
+        migrator.add_column("search", "ids", BlobField(null=True)),
+        migrator.add_column("search", "last_used_datetime", DateTimeField(null=True)),
+    )
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+from playhouse.migrate import SqliteDatabase
+from telegram_notifications_bot.config import DB_FILE_NAME
+
+
+db = SqliteDatabase(DB_FILE_NAME)
+
+
+with db.atomic():
+    # Таблица и триггеры создаются при запуске бота, здесь индекс заполняется
+    # уже добавленными уведомлениями
+    db.execute_sql(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS notification_fts
+        USING fts5(text, content='', tokenize='trigram')
+        """
+    )
+    db.execute_sql(
+        "INSERT INTO notification_fts(notification_fts) VALUES ('delete-all')"
+    )
+    db.execute_sql(
+        """
+        INSERT INTO notification_fts(rowid, text)
+        SELECT id, name || ' ' || message FROM notification
+        """
+    )
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+from playhouse.migrate import SqliteDatabase
+from telegram_notifications_bot.config import DB_FILE_NAME
+
+
+db = SqliteDatabase(DB_FILE_NAME)
+
+
+with db.atomic():
+    # Таблица, индексы и триггеры создаются при запуске бота, здесь статистика
+    # заполняется по уже добавленным уведомлениям
+    db.execute_sql(
+        """
+        CREATE TABLE IF NOT EXISTS "notificationstats" (
+            "id" INTEGER NOT NULL PRIMARY KEY,
+            "chat_id" INTEGER NOT NULL,
+            "year" INTEGER NOT NULL,
+            "type" VARCHAR(255) NOT NULL,
+            "number" INTEGER NOT NULL
+        )
+        """
+    )
+    db.execute_sql(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS "notificationstats_chat_id_year_type"
+        ON "notificationstats" ("chat_id", "year", "type")
+        """
+    )
+    db.execute_sql(
+        """
+        CREATE INDEX IF NOT EXISTS "notification_chat_id_append_datetime"
+        ON "notification" ("chat_id", "append_datetime")
+        """
+    )
+
+    db.execute_sql("DELETE FROM notificationstats")
+    db.execute_sql(
+        """
+        INSERT INTO notificationstats(chat_id, year, type, number)
+        SELECT chat_id, CAST(STRFTIME('%Y', append_datetime) AS INTEGER), type, COUNT(*)
+        FROM notification
+        GROUP BY 1, 2, 3
+        """
+    )
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+from playhouse.migrate import SqliteDatabase
+from telegram_notifications_bot.config import DB_FILE_NAME
+
+
+db = SqliteDatabase(DB_FILE_NAME)
+
+
+with db.atomic():
+    # Таблица архива и ее триггеры создаются при запуске бота. Триггер удаления
+    # пересоздается при запуске с условием, чтобы перенос в архив не менял группы
+    db.execute_sql("DROP TRIGGER IF EXISTS notification_group_after_delete")
+
+# Режим incremental_vacuum включается только вместе с VACUUM, вне транзакции
+db.execute_sql("PRAGMA auto_vacuum = INCREMENTAL")
+db.execute_sql("VACUUM")
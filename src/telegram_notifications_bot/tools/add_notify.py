@@ -4,6 +4,8 @@
 __author__ = "ipetrash"
 
 
+from typing import Any
+
 from telegram_notifications_bot.db import Notification
 from telegram_notifications_bot.config import USER_ID, USER_ID_PATH
 from telegram_notifications_bot.common import TypeEnum
@@ -19,14 +21,14 @@ def add_notify(
     group: str = None,
     group_max_number: int = None,
     need_html_escape_content: bool = True,
-):
+) -> Notification:
     if not USER_ID:
         raise Exception(f'Нужно заполнить "{USER_ID_PATH.name}"!')
 
     if not isinstance(type, TypeEnum):
         type = TypeEnum[type]
 
-    Notification.add(
+    return Notification.add(
         chat_id=USER_ID,
         name=name,
         message=message,
@@ -40,6 +42,19 @@ def add_notify(
     )
 
 
+def add_notify_many(items: list[dict[str, Any]]) -> list[str | None]:
+    """
+    Функция добавляет уведомления одним INSERT (см. Notification.add_many),
+    каждый элемент items - аргументы add_notify.
+    Возвращает для каждого элемента текст ошибки или None, если он был добавлен
+    """
+
+    if not USER_ID:
+        raise Exception(f'Нужно заполнить "{USER_ID_PATH.name}"!')
+
+    return Notification.add_many([dict(item, chat_id=USER_ID) for item in items])
+
+
 if __name__ == "__main__":
     add_notify("TEST", "Hello World! Привет мир!")
     add_notify("", "Hello World! Привет мир!")
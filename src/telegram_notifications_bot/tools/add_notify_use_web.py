@@ -4,14 +4,52 @@
 __author__ = "ipetrash"
 
 
-import time
+import atexit
+import sys
 
-import requests
+from pathlib import Path
 
 from telegram_notifications_bot.common import TypeEnum
-from telegram_notifications_bot.config import HOST, PORT
+from telegram_notifications_bot.config import SPOOL_DIR
+from telegram_notifications_bot.tools.notify_client import NotifyClient
 
-URL = f"http://{HOST}:{PORT}/add_notify"
+
+CLIENT: NotifyClient | None = None
+
+
+def get_client() -> NotifyClient:
+    """
+    Функция возвращает общий клиент. Уведомления, которые не удалось отправить,
+    сохраняются в файл-очередь скрипта и отправятся, когда сервер станет доступен
+    """
+
+    global CLIENT
+
+    if not CLIENT:
+        name = Path(sys.argv[0]).stem or "notify"
+        CLIENT = NotifyClient(spool_path=SPOOL_DIR / f"{name}.ndjson")
+
+        # Отправка накопленных уведомлений перед завершением скрипта
+        atexit.register(CLIENT.close)
+
+    return CLIENT
+
+
+def send_spools() -> bool:
+    """
+    Функция отправляет уведомления из всех файлов-очередей в SPOOL_DIR,
+    чтобы не ждать повторного запуска скриптов, которые их оставили
+    (например, из планировщика). Возвращает True, если все файлы-очереди отправлены
+    """
+
+    is_ok = True
+    with NotifyClient() as client:
+        for path in sorted(SPOOL_DIR.glob("*.ndjson")):
+            if not client.send_spool(path):
+                print(f"Не удалось отправить {path}")
+                is_ok = False
+
+    return is_ok
 
 
 def add_notify(
@@ -25,40 +63,18 @@ def add_notify(
     group_max_number: int = None,
     need_html_escape_content: bool = True,
 ):
-    if not name:
-        raise Exception('Аргумент "name" не задан')
-
-    if not message:
-        raise Exception('Аргумент "message" не задан')
-
-    data = {
-        "name": name,
-        "message": message,
-        "type": type if isinstance(type, str) else type.value,
-        "url": url,
-        "has_delete_button": has_delete_button,
-        "show_type": show_type,
-        "group": group,
-        "group_max_number": group_max_number,
-        "need_html_escape_content": need_html_escape_content,
-    }
-
-    # Попытки
-    attempts_timeouts = [1, 5, 10, 30, 60]
-
-    while True:
-        try:
-            rs = requests.post(URL, json=data)
-            rs.raise_for_status()
-            return
-
-        except Exception as e:
-            # Если закончились попытки
-            if not attempts_timeouts:
-                raise e
-
-            timeout = attempts_timeouts.pop(0)
-            time.sleep(timeout)
+    # Уведомление ставится в очередь клиента, поэтому функция не ждет ответа сервера
+    get_client().add_notify(
+        name=name,
+        message=message,
+        type=type,
+        url=url,
+        has_delete_button=has_delete_button,
+        show_type=show_type,
+        group=group,
+        group_max_number=group_max_number,
+        need_html_escape_content=need_html_escape_content,
+    )
 
 
 def test() -> None:
@@ -80,7 +96,6 @@ def test() -> None:
 
 if __name__ == "__main__":
     import argparse
-    import sys
 
     def create_parser() -> argparse.ArgumentParser:
         parser = argparse.ArgumentParser(
@@ -122,6 +137,11 @@ if __name__ == "__main__":
             default=True,
             help="Определяет нужно ли экранировать название и текст в уведомлении как HTML",
         )
+        parser.add_argument(
+            "--send-spools",
+            action="store_true",
+            help="Флаг для отправки уведомлений из всех файлов-очередей",
+        )
         parser.add_argument(
             "--run-test",
             action="store_true",
@@ -137,6 +157,9 @@ if __name__ == "__main__":
         sys.exit()
 
     args = parser.parse_args()
+    if args.send_spools:
+        sys.exit(0 if send_spools() else 1)
+
     if args.run_test:
         test()
         sys.exit()
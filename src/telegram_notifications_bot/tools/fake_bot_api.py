@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import json
+import random
+import threading
+import time
+
+from collections import deque
+from typing import Any, NamedTuple
+
+# pip install aiohttp
+from aiohttp import web
+
+
+ERROR_RETRY_AFTER = "retry_after"
+ERROR_NOT_MODIFIED = "not_modified"
+ERROR_SERVER = "server"
+
+BOT_USER: dict[str, Any] = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Fake",
+    "username": "fake_bot",
+}
+
+
+class NotModifiedError(Exception):
+    pass
+
+
+class FakeRequest(NamedTuple):
+    # Время получения запроса по time.perf_counter
+    time: float
+    method: str
+    params: dict[str, Any]
+    status: int
+    result: Any
+
+
+class FakeBotApi:
+    """
+    Локальная замена Telegram Bot API для нагрузочных и сквозных тестов.
+    telegram.Bot подключается к ней через base_url=server.base_url.
+
+    Поддерживаются основные методы бота (отправка, изменение и удаление сообщений,
+    ответы на callback, getUpdates), задержка ответа, ошибки (429 с retry_after,
+    400 "message is not modified", 5xx) с заданной вероятностью или по очереди
+    (fail_next), а также запись всех запросов в requests
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        retry_after_rate: float = 0.0,
+        retry_after: int = 1,
+        server_error_rate: float = 0.0,
+        not_modified_rate: float = 0.0,
+        seed: int = None,
+    ) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.latency: float = latency
+        self.retry_after_rate: float = retry_after_rate
+        self.retry_after: int = retry_after
+        self.server_error_rate: float = server_error_rate
+        self.not_modified_rate: float = not_modified_rate
+
+        self.requests: list[FakeRequest] = []
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+        # Ошибки, которые вернутся на ближайшие запросы: (метод или None, вид ошибки)
+        self._errors: deque[tuple[str | None, str]] = deque()
+
+        # Содержимое отправленных сообщений, чтобы возвращать "message is not modified"
+        self._messages: dict[tuple[int, int], tuple[str, Any]] = dict()
+        self._last_message_id: int = 0
+
+        self._updates: list[dict[str, Any]] = []
+        self._last_update_id: int = 0
+        self._updates_event: asyncio.Event | None = None
+
+        self.loop = asyncio.new_event_loop()
+        self.runner: web.AppRunner | None = None
+        self._thread = threading.Thread(
+            target=self.loop.run_forever,
+            name=self.__class__.__name__,
+            daemon=True,
+        )
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    def fail_next(self, error: str, method: str = None, number: int = 1) -> None:
+        """
+        Функция добавляет ошибку error для следующих number запросов к методу method
+        (или к любому методу, если он не задан)
+        """
+
+        with self._lock:
+            self._errors.extend([(method, error)] * number)
+
+    def put_update(self, update: dict[str, Any]) -> int:
+        """
+        Функция добавляет обновление, которое бот получит через getUpdates.
+        Возвращает update_id
+        """
+
+        with self._lock:
+            self._last_update_id += 1
+            update = dict(update, update_id=self._last_update_id)
+            self._updates.append(update)
+
+        self.loop.call_soon_threadsafe(self._updates_event.set)
+        return update["update_id"]
+
+    def get_requests(self, method: str = None) -> list[FakeRequest]:
+        with self._lock:
+            return [r for r in self.requests if method is None or r.method == method]
+
+    def wait_requests(
+        self,
+        method: str,
+        number: int,
+        timeout: float = None,
+    ) -> list[FakeRequest]:
+        """
+        Функция ждет, пока к методу method не будет number запросов, и возвращает их
+        """
+
+        def get_items() -> list[FakeRequest]:
+            return [r for r in self.requests if r.method == method]
+
+        with self._condition:
+            self._condition.wait_for(lambda: len(get_items()) >= number, timeout)
+            return get_items()
+
+    def _take_error(self, method: str) -> str | None:
+        with self._lock:
+            for i, (error_method, error) in enumerate(self._errors):
+                if error_method is None or error_method == method:
+                    del self._errors[i]
+                    return error
+
+        for error, rate in [
+            (ERROR_RETRY_AFTER, self.retry_after_rate),
+            (ERROR_SERVER, self.server_error_rate),
+        ]:
+            if rate and self._random.random() < rate:
+                return error
+
+        if method.startswith("edit") and self.not_modified_rate:
+            if self._random.random() < self.not_modified_rate:
+                return ERROR_NOT_MODIFIED
+
+    @staticmethod
+    def _get_error_response(error: str, retry_after: int) -> web.Response:
+        if error == ERROR_RETRY_AFTER:
+            status = 429
+            data = {
+                "ok": False,
+                "error_code": status,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }
+        elif error == ERROR_NOT_MODIFIED:
+            status = 400
+            data = {
+                "ok": False,
+                "error_code": status,
+                "description": (
+                    "Bad Request: message is not modified: specified new message "
+                    "content and reply markup are exactly the same as a current "
+                    "content and reply markup of the message"
+                ),
+            }
+        else:
+            status = 500
+            data = {
+                "ok": False,
+                "error_code": status,
+                "description": "Internal Server Error",
+            }
+
+        return web.json_response(data, status=status)
+
+    def _get_message(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Any,
+    ) -> dict[str, Any]:
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+
+        return message
+
+    def _process(self, method: str, params: dict[str, Any]) -> Any:
+        reply_markup = params.get("reply_markup")
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            with self._lock:
+                self._last_message_id += 1
+                message_id = self._last_message_id
+                self._messages[chat_id, message_id] = (params["text"], reply_markup)
+
+            return self._get_message(chat_id, message_id, params["text"], reply_markup)
+
+        if method == "sendDocument":
+            chat_id = int(params["chat_id"])
+            with self._lock:
+                self._last_message_id += 1
+                message_id = self._last_message_id
+
+            message = self._get_message(chat_id, message_id, None, reply_markup)
+            del message["text"]
+
+            file_name = params["document"]["file_name"]
+            message["document"] = {
+                "file_id": f"file_{message_id}",
+                "file_unique_id": f"file_{message_id}",
+                "file_name": file_name,
+            }
+            return message
+
+        if method in ("editMessageText", "editMessageReplyMarkup"):
+            key = int(params["chat_id"]), int(params["message_id"])
+            with self._lock:
+                text, old_reply_markup = self._messages.get(key, ("", None))
+                new = (params.get("text", text), reply_markup)
+                if new == (text, old_reply_markup):
+                    raise NotModifiedError()
+
+                self._messages[key] = new
+
+            return self._get_message(*key, *new)
+
+        if method == "getMe":
+            return BOT_USER
+
+        if method in (
+            "deleteMessage",
+            "answerCallbackQuery",
+            "setWebhook",
+            "deleteWebhook",
+            "setMyCommands",
+        ):
+            return True
+
+        raise web.HTTPNotFound()
+
+    async def _get_updates(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+
+        while True:
+            with self._lock:
+                # Обновления до offset подтверждены ботом
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+                updates = list(self._updates)
+                self._updates_event.clear()
+
+            timeout = deadline - time.monotonic()
+            if updates or timeout <= 0:
+                return updates
+
+            try:
+                await asyncio.wait_for(self._updates_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _handler(self, request: web.Request) -> web.Response:
+        received = time.perf_counter()
+        method = request.match_info["method"]
+
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+            params.update(request.query)
+
+            # Файлы из multipart/form-data (например, sendDocument)
+            for name, value in params.items():
+                if isinstance(value, web.FileField):
+                    params[name] = {
+                        "file_name": value.filename,
+                        "content": value.file.read(),
+                    }
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        result = None
+        error = self._take_error(method)
+        if not error:
+            try:
+                if method == "getUpdates":
+                    result = await self._get_updates(params)
+                else:
+                    result = self._process(method, params)
+            except NotModifiedError:
+                error = ERROR_NOT_MODIFIED
+
+        if error:
+            rs = self._get_error_response(error, self.retry_after)
+            result = None
+        else:
+            rs = web.json_response({"ok": True, "result": result})
+
+        with self._condition:
+            self.requests.append(
+                FakeRequest(received, method, params, rs.status, result)
+            )
+            self._condition.notify_all()
+
+        return rs
+
+    async def _start(self) -> None:
+        self._updates_event = asyncio.Event()
+
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handler)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def start(self) -> None:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def __enter__(self) -> "FakeBotApi":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Задержка в секундах"
+    )
+    parser.add_argument("--retry-after-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--not-modified-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeBotApi(
+        port=args.port,
+        latency=args.latency,
+        retry_after_rate=args.retry_after_rate,
+        retry_after=args.retry_after,
+        server_error_rate=args.server_error_rate,
+        not_modified_rate=args.not_modified_rate,
+    )
+    with server:
+        print(f"base_url: {server.base_url}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import asyncio
+import logging
+import threading
+import time
+
+from pathlib import Path
+from typing import Any
+
+# pip install aiohttp
+import aiohttp
+import requests
+
+from telegram_notifications_bot.common import TypeEnum
+from telegram_notifications_bot.config import HOST, PORT, ADD_NOTIFY_BATCH_MAX_SIZE
+from telegram_notifications_bot.tools.spool import Spool
+
+
+URL = f"http://{HOST}:{PORT}"
+
+# Паузы между попытками отправки пакета
+ATTEMPTS_TIMEOUTS: list[float] = [1, 5, 10, 30, 60]
+
+
+def get_notify_data(
+    name: str,
+    message: str,
+    type: TypeEnum | str = TypeEnum.INFO,
+    url: str = None,
+    has_delete_button: bool = False,
+    show_type: bool = True,
+    group: str = None,
+    group_max_number: int = None,
+    need_html_escape_content: bool = True,
+) -> dict[str, Any]:
+    """
+    Функция проверяет аргументы и возвращает данные уведомления для запроса к web_api
+    """
+
+    if not name:
+        raise Exception('Аргумент "name" не задан')
+
+    if not message:
+        raise Exception('Аргумент "message" не задан')
+
+    return {
+        "name": name,
+        "message": message,
+        "type": type if isinstance(type, str) else type.value,
+        "url": url,
+        "has_delete_button": has_delete_button,
+        "show_type": show_type,
+        "group": group,
+        "group_max_number": group_max_number,
+        "need_html_escape_content": need_html_escape_content,
+    }
+
+
+def check_batch_response(data: dict[str, Any], log: logging.Logger) -> list[dict]:
+    """
+    Функция проверяет ответ /add_notify_batch и пишет в лог уведомления,
+    которые сервер не добавил. Возвращает результаты по каждому уведомлению
+    """
+
+    if "error" in data:
+        raise Exception(data["error"])
+
+    results: list[dict] = data["results"]
+    for i, result in enumerate(results):
+        if not result["ok"]:
+            log.warning(f"Уведомление #{i} из пакета не добавлено: {result['error']}")
+
+    return results
+
+
+class _BaseNotifyClient:
+    """
+    Общая часть NotifyClient и AsyncNotifyClient: настройки и буфер уведомлений,
+    из которого берутся пакеты. Методы буфера вызываются с захваченным
+    self._condition (threading.Condition или asyncio.Condition)
+    """
+
+    def __init__(
+        self,
+        url: str = URL,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_buffer_size: int = 10_000,
+        timeout: float = 30,
+        attempts_timeouts: list[float] = None,
+        log: logging.Logger = None,
+    ) -> None:
+        self.url: str = url.rstrip("/") + "/add_notify_batch"
+        self.batch_size: int = min(batch_size, ADD_NOTIFY_BATCH_MAX_SIZE)
+        self.flush_interval: float = flush_interval
+        self.max_buffer_size: int = max_buffer_size
+        self.timeout: float = timeout
+        self.attempts_timeouts: list[float] = (
+            ATTEMPTS_TIMEOUTS if attempts_timeouts is None else attempts_timeouts
+        )
+        self.log: logging.Logger = log or logging.getLogger(__name__)
+
+        self._condition: threading.Condition | asyncio.Condition | None = None
+
+        self._buffer: list[dict[str, Any]] = []
+        # Время добавления самого старого уведомления в буфере
+        self._buffer_started: float | None = None
+        # Количество уведомлений, которые взяты из буфера, но еще отправляются
+        self._in_flight: int = 0
+        # Буфер нужно отправить, не дожидаясь flush_interval
+        self._is_flush_requested: bool = False
+        self._is_closed: bool = False
+
+    def _is_buffer_full(self) -> bool:
+        return len(self._buffer) >= self.max_buffer_size
+
+    def _put(self, data: dict[str, Any]) -> None:
+        if not self._buffer:
+            self._buffer_started = time.monotonic()
+        self._buffer.append(data)
+        self._condition.notify_all()
+
+    def _take_batch(self) -> list[dict[str, Any]]:
+        items = self._buffer[: self.batch_size]
+        del self._buffer[: self.batch_size]
+
+        self._buffer_started = time.monotonic() if self._buffer else None
+        self._is_flush_requested = bool(self._buffer) and self._is_flush_requested
+        self._in_flight += len(items)
+        self._condition.notify_all()
+
+        return items
+
+    def _is_batch_ready(self) -> bool:
+        return bool(self._buffer) and (
+            self._is_closed
+            or self._is_flush_requested
+            or len(self._buffer) >= self.batch_size
+            or time.monotonic() - self._buffer_started >= self.flush_interval
+        )
+
+    def _get_batch_deadline(self) -> float | None:
+        # Время, когда буфер нужно отправить по flush_interval
+        if not self._buffer:
+            return
+
+        return self._buffer_started + self.flush_interval
+
+
+class NotifyClient(_BaseNotifyClient):
+    """
+    Клиент web_api для отправки большого количества уведомлений.
+
+    Соединения с сервером переиспользуются (requests.Session), а уведомления
+    накапливаются в буфере и отправляются в /add_notify_batch из фонового потока:
+    когда в буфере batch_size уведомлений или через flush_interval секунд после
+    первого уведомления в буфере. Повторные попытки выполняются в фоновом потоке,
+    поэтому add_notify ждет, только если буфер заполнен до max_buffer_size.
+
+    Если задан spool_path, то уведомления, которые не удалось отправить, сохраняются
+    в файл-очередь (см. Spool) и отправляются по порядку, когда сервер станет доступен,
+    в том числе при следующем запуске. Пока в файле-очереди есть уведомления,
+    новые тоже записываются в него, чтобы не нарушить порядок. Один файл-очередь
+    могут использовать несколько процессов, а файлы-очереди других скриптов
+    можно отправить через send_spool
+    """
+
+    def __init__(
+        self,
+        url: str = URL,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_buffer_size: int = 10_000,
+        timeout: float = 30,
+        attempts_timeouts: list[float] = None,
+        log: logging.Logger = None,
+        spool_path: Path | str = None,
+    ) -> None:
+        super().__init__(
+            url=url,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            max_buffer_size=max_buffer_size,
+            timeout=timeout,
+            attempts_timeouts=attempts_timeouts,
+            log=log,
+        )
+
+        self.session = requests.Session()
+
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+        self.spool: Spool | None = None
+        # Время следующей попытки отправить файл-очередь и номер неудачной попытки
+        self._spool_retry_at: float = 0.0
+        self._spool_attempt: int = 0
+
+        if spool_path:
+            self.spool = Spool(spool_path, log=self.log)
+
+            # Отправка уведомлений, оставшихся с прошлого запуска
+            if self.spool.has_pending():
+                with self._condition:
+                    self._start_thread()
+
+    def _start_thread(self) -> None:
+        # Вызывается с захваченным self._condition
+        if self._thread:
+            return
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name=self.__class__.__name__,
+            daemon=True,
+        )
+        self._thread.start()
+
+    def add_notify(
+        self,
+        name: str,
+        message: str,
+        type: TypeEnum | str = TypeEnum.INFO,
+        url: str = None,
+        has_delete_button: bool = False,
+        show_type: bool = True,
+        group: str = None,
+        group_max_number: int = None,
+        need_html_escape_content: bool = True,
+    ) -> None:
+        data = get_notify_data(
+            name=name,
+            message=message,
+            type=type,
+            url=url,
+            has_delete_button=has_delete_button,
+            show_type=show_type,
+            group=group,
+            group_max_number=group_max_number,
+            need_html_escape_content=need_html_escape_content,
+        )
+
+        with self._condition:
+            if self._is_closed:
+                raise Exception("Клиент закрыт")
+
+            while self._is_buffer_full():
+                self._condition.wait()
+
+            self._put(data)
+            self._start_thread()
+
+    def _is_spool_ready(self) -> bool:
+        return (
+            self.spool is not None
+            and not self._is_closed
+            and time.monotonic() >= self._spool_retry_at
+            and self.spool.has_pending()
+        )
+
+    def _get_wait_timeout(self) -> float | None:
+        # Вызывается с захваченным self._condition
+        deadlines = []
+        if self._buffer:
+            deadlines.append(self._get_batch_deadline())
+
+        if self.spool is not None and self.spool.has_pending():
+            deadlines.append(self._spool_retry_at)
+
+        if not deadlines:
+            return
+
+        return min(deadlines) - time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._is_batch_ready() and not self._is_spool_ready():
+                    if self._is_closed and not self._buffer:
+                        return
+
+                    self._condition.wait(self._get_wait_timeout())
+
+                items = self._take_batch() if self._is_batch_ready() else []
+
+            try:
+                if items:
+                    self._process(items)
+
+                if self._is_spool_ready():
+                    if self._replay_spool(self.spool):
+                        self._spool_attempt = 0
+                    else:
+                        self._schedule_spool_retry()
+
+            except Exception:
+                self.log.exception(f"Не удалось отправить {len(items)} уведомлений")
+
+            finally:
+                with self._condition:
+                    self._in_flight -= len(items)
+                    self._condition.notify_all()
+
+    def _post(self, items: list[dict[str, Any]]) -> list[dict]:
+        rs = self.session.post(self.url, json=items, timeout=self.timeout)
+        rs.raise_for_status()
+        return check_batch_response(rs.json(), self.log)
+
+    def _send(self, items: list[dict[str, Any]]) -> list[dict]:
+        attempts_timeouts = list(self.attempts_timeouts)
+
+        while True:
+            try:
+                return self._post(items)
+
+            except requests.RequestException as e:
+                # Если закончились попытки
+                if not attempts_timeouts:
+                    raise e
+
+                time.sleep(attempts_timeouts.pop(0))
+
+    def _process(self, items: list[dict[str, Any]]) -> None:
+        if self.spool is None:
+            self._send(items)
+            return
+
+        # Чтобы не нарушить порядок, новые уведомления отправляются после файла-очереди
+        if self.spool.has_pending():
+            self.spool.append(items)
+            return
+
+        try:
+            self._post(items)
+        except requests.RequestException as e:
+            self.log.warning(
+                f"Сервер недоступен ({e}), {len(items)} уведомлений "
+                f"сохранены в {self.spool.path}"
+            )
+            self.spool.append(items)
+            self._schedule_spool_retry()
+
+    def _schedule_spool_retry(self) -> None:
+        timeout = 0
+        if self.attempts_timeouts:
+            idx = min(self._spool_attempt, len(self.attempts_timeouts) - 1)
+            timeout = self.attempts_timeouts[idx]
+
+        self._spool_attempt += 1
+        self._spool_retry_at = time.monotonic() + timeout
+
+    def _replay_spool(self, spool: Spool) -> bool:
+        """
+        Функция отправляет уведомления из файла-очереди пакетами, по порядку.
+        Возвращает False, если сервер недоступен или файл-очередь уже отправляет
+        другой процесс, тогда следующая попытка будет через время из attempts_timeouts
+        """
+
+        with spool.reading() as is_acquired:
+            if not is_acquired:
+                return False
+
+            while not self._is_closed:
+                items, offset = spool.read(self.batch_size)
+                if not items:
+                    # Нечего отправлять или остались только поврежденные записи
+                    if offset:
+                        spool.commit(offset)
+                    return True
+
+                try:
+                    self._post(items)
+
+                except requests.RequestException:
+                    return False
+
+                except Exception:
+                    # Сервер отклонил пакет, повторная отправка не поможет
+                    self.log.exception(f"Пакет из {spool.path} отклонен сервером")
+
+                spool.commit(offset)
+
+        return True
+
+    def send_spool(self, path: Path | str) -> bool:
+        """
+        Функция отправляет уведомления из файла-очереди path, например, оставшегося
+        от скрипта, который больше не запускается. Возвращает True,
+        если в файле-очереди не осталось неотправленных уведомлений
+        """
+
+        spool = Spool(path, log=self.log)
+        if spool.has_pending():
+            self._replay_spool(spool)
+
+        return not spool.has_pending()
+
+    def flush(self) -> None:
+        """
+        Функция ждет, пока все накопленные уведомления не будут отправлены
+        """
+
+        with self._condition:
+            # Без фонового потока нечего ждать
+            if not self._thread:
+                return
+
+            self._is_flush_requested = True
+            self._condition.notify_all()
+
+            while self._buffer or self._in_flight:
+                self._condition.wait()
+
+    def close(self) -> None:
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify_all()
+
+        if self._thread:
+            self._thread.join()
+
+        self.session.close()
+
+    def __enter__(self) -> "NotifyClient":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class AsyncNotifyClient(_BaseNotifyClient):
+    """
+    Асинхронный вариант NotifyClient для asyncio: соединения переиспользуются
+    через aiohttp.ClientSession, а пакеты отправляет фоновая задача.
+    Файла-очереди (spool_path) нет: если сервер недоступен после всех попыток
+    из attempts_timeouts, то пакет пишется в лог и теряется
+    """
+
+    def __init__(
+        self,
+        url: str = URL,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_buffer_size: int = 10_000,
+        timeout: float = 30,
+        attempts_timeouts: list[float] = None,
+        log: logging.Logger = None,
+    ) -> None:
+        super().__init__(
+            url=url,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            max_buffer_size=max_buffer_size,
+            timeout=timeout,
+            attempts_timeouts=attempts_timeouts,
+            log=log,
+        )
+
+        # Создаются при первом вызове, чтобы принадлежать работающему циклу событий
+        self.session: aiohttp.ClientSession | None = None
+        self._task: asyncio.Task | None = None
+
+    async def add_notify(
+        self,
+        name: str,
+        message: str,
+        type: TypeEnum | str = TypeEnum.INFO,
+        url: str = None,
+        has_delete_button: bool = False,
+        show_type: bool = True,
+        group: str = None,
+        group_max_number: int = None,
+        need_html_escape_content: bool = True,
+    ) -> None:
+        data = get_notify_data(
+            name=name,
+            message=message,
+            type=type,
+            url=url,
+            has_delete_button=has_delete_button,
+            show_type=show_type,
+            group=group,
+            group_max_number=group_max_number,
+            need_html_escape_content=need_html_escape_content,
+        )
+
+        if self._is_closed:
+            raise Exception("Клиент закрыт")
+
+        if not self._task:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._condition = asyncio.Condition()
+            self._task = asyncio.create_task(self._run())
+
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._is_buffer_full())
+            self._put(data)
+
+    async def _run(self) -> None:
+        while True:
+            async with self._condition:
+                while not self._is_batch_ready():
+                    if self._is_closed and not self._buffer:
+                        return
+
+                    timeout = None
+                    if self._buffer:
+                        timeout = self._get_batch_deadline() - time.monotonic()
+
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+
+                items = self._take_batch()
+
+            try:
+                await self._send(items)
+            except Exception:
+                self.log.exception(f"Не удалось отправить {len(items)} уведомлений")
+            finally:
+                async with self._condition:
+                    self._in_flight -= len(items)
+                    self._condition.notify_all()
+
+    async def _send(self, items: list[dict[str, Any]]) -> list[dict]:
+        attempts_timeouts = list(self.attempts_timeouts)
+
+        while True:
+            try:
+                async with self.session.post(self.url, json=items) as rs:
+                    rs.raise_for_status()
+                    data = await rs.json()
+                break
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Если закончились попытки
+                if not attempts_timeouts:
+                    raise e
+
+                await asyncio.sleep(attempts_timeouts.pop(0))
+
+        return check_batch_response(data, self.log)
+
+    async def flush(self) -> None:
+        """
+        Функция ждет, пока все накопленные уведомления не будут отправлены
+        """
+
+        if not self._task:
+            return
+
+        async with self._condition:
+            self._is_flush_requested = True
+            self._condition.notify_all()
+
+            await self._condition.wait_for(
+                lambda: not self._buffer and not self._in_flight
+            )
+
+    async def close(self) -> None:
+        self._is_closed = True
+
+        if self._task:
+            async with self._condition:
+                self._condition.notify_all()
+
+            await self._task
+            await self.session.close()
+
+    async def __aenter__(self) -> "AsyncNotifyClient":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
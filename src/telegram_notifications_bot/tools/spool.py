@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "ipetrash"
+
+
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(f: BinaryIO, blocking: bool = True) -> bool:
+    if fcntl:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(f.fileno(), flags)
+        except BlockingIOError:
+            return False
+        return True
+
+    # msvcrt блокирует байты с текущей позиции и ждет не дольше 10 секунд,
+    # поэтому ожидание выполняется в цикле
+    while True:
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.01)
+
+
+def _unlock_file(f: BinaryIO) -> None:
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def _locked(path: Path, blocking: bool = True) -> Iterator[bool]:
+    with open(path, "a+b") as f:
+        is_locked = _lock_file(f, blocking)
+        try:
+            yield is_locked
+        finally:
+            if is_locked:
+                _unlock_file(f)
+
+
+class Spool:
+    """
+    Файл-очередь уведомлений на диске: записи только добавляются в конец файла
+    (по одному JSON-объекту на строку), а отдельно хранится смещение уже
+    отправленной части (файл .offset). Когда все записи отправлены, файлы очищаются.
+
+    Файл может использоваться несколькими процессами: добавление, commit и очистка
+    выполняются под блокировкой файла .lock, а размер и смещение каждый раз
+    читаются с диска. Отправлять записи (read и commit) должен только один процесс,
+    который захватил reading
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        fsync: bool = True,
+        log: logging.Logger = None,
+    ) -> None:
+        self.path: Path = Path(path)
+        self.offset_path: Path = self.path.with_name(self.path.name + ".offset")
+        self.lock_path: Path = self.path.with_name(self.path.name + ".lock")
+        self.reading_lock_path: Path = self.path.with_name(
+            self.path.name + ".reading.lock"
+        )
+        self.fsync: bool = fsync
+        self.log: logging.Logger = log or logging.getLogger(__name__)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._reading_lock = threading.Lock()
+
+    def _get_size(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _read_offset(self) -> int:
+        try:
+            offset = int(self.offset_path.read_text("utf-8"))
+        except (FileNotFoundError, ValueError):
+            return 0
+
+        # Смещение больше размера, если процесс завершился во время очистки
+        return offset if offset <= self._get_size() else 0
+
+    def has_pending(self) -> bool:
+        return self._get_size() > self._read_offset()
+
+    @contextmanager
+    def reading(self) -> Iterator[bool]:
+        """
+        Контекстный менеджер захватывает право отправки записей и возвращает True,
+        если оно получено, или False, если записи уже отправляет другой поток
+        или процесс
+        """
+
+        if not self._reading_lock.acquire(blocking=False):
+            yield False
+            return
+
+        try:
+            with _locked(self.reading_lock_path, blocking=False) as is_locked:
+                yield is_locked
+        finally:
+            self._reading_lock.release()
+
+    def append(self, items: list[dict[str, Any]]) -> None:
+        data = "".join(
+            json.dumps(item, ensure_ascii=False) + "\n" for item in items
+        ).encode("utf-8")
+
+        with self._lock, _locked(self.lock_path):
+            with open(self.path, "ab") as f:
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+    def read(self, max_number: int) -> tuple[list[dict[str, Any]], int]:
+        """
+        Функция возвращает до max_number неотправленных записей и смещение после них,
+        которое нужно передать в commit после успешной отправки
+        """
+
+        items = []
+        with self._lock, _locked(self.lock_path):
+            offset = self._read_offset()
+            if offset >= self._get_size():
+                return items, offset
+
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                while len(items) < max_number:
+                    line = f.readline()
+
+                    # Недописанная строка (например, процесс завершился во время записи)
+                    if not line.endswith(b"\n"):
+                        break
+
+                    offset += len(line)
+                    try:
+                        items.append(json.loads(line))
+                    except ValueError:
+                        self.log.warning(f"Пропущена поврежденная запись: {line!r}")
+
+        return items, offset
+
+    def commit(self, offset: int) -> None:
+        with self._lock, _locked(self.lock_path):
+            # Все записи отправлены - файл очищается, чтобы не расти бесконечно.
+            # Размер проверяется под блокировкой, поэтому записи, добавленные
+            # другими процессами после read, не будут потеряны.
+            # Сначала удаляется смещение: если процесс завершится между шагами,
+            # то записи отправятся повторно, но не потеряются
+            if offset >= self._get_size():
+                self.offset_path.unlink(missing_ok=True)
+                self.path.write_bytes(b"")
+                return
+
+            temp_path = self.offset_path.with_name(self.offset_path.name + ".tmp")
+            temp_path.write_text(str(offset), "utf-8")
+            os.replace(temp_path, self.offset_path)
@@ -4,22 +4,100 @@
 __author__ = "ipetrash"
 
 
-from typing import Any
+import asyncio
+import functools
+import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
 
 # pip install aiohttp
 from aiohttp import web
 
-from telegram_notifications_bot.tools.add_notify import add_notify
-from telegram_notifications_bot.config import HOST, PORT
+# pip install python-telegram-bot
+from telegram import Update
+from telegram.ext import Dispatcher
+
+from telegram_notifications_bot.db import Notification
+from telegram_notifications_bot.tools.add_notify import add_notify, add_notify_many
+from telegram_notifications_bot.config import (
+    HOST,
+    PORT,
+    ADD_NOTIFY_BATCH_MAX_SIZE,
+    WEB_API_DB_WORKERS,
+    WEB_API_DB_MAX_PENDING,
+    WEBHOOK_SECRET,
+)
 from telegram_notifications_bot.common import TypeEnum
+from telegram_notifications_bot.metrics import REGISTRY, Counter, Histogram
 
 routes = web.RouteTableDef()
 
+T = TypeVar("T")
+
+OnAddedFunc = Callable[[], None]
+
+METRIC_REQUESTS = Counter(
+    "notify_web_api_requests_total",
+    "Количество запросов к web_api",
+    label_names=("path", "status"),
+)
+METRIC_REQUEST_DURATION = Histogram(
+    "notify_web_api_request_duration_seconds",
+    "Время обработки запросов к web_api",
+    label_names=("path",),
+)
+METRIC_INGESTED = Counter(
+    "notify_ingested_notifications_total",
+    "Количество уведомлений, полученных web_api",
+    label_names=("result",),
+)
+
+
+class DbExecutor:
+    """
+    Класс для выполнения синхронной работы с базой в пуле потоков,
+    чтобы чтение и ожидание очереди записи SqliteQueueDatabase не блокировали
+    цикл событий. Количество задач ограничено: при переполнении запросы ждут
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix=type(self).__name__,
+        )
+        self.max_pending: int = max_pending
+
+        # Создается при первом вызове, чтобы принадлежать работающему циклу событий
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(func, *args, **kwargs)
+            )
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+def parse_notify(data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Функция проверяет данные запроса и возвращает аргументы для add_notify
+    """
 
-def process_notify(data: dict[str, Any]) -> None:
     name = data["name"]
     message = data["message"]
+
     type = data.get("type", TypeEnum.INFO)
+    if not isinstance(type, TypeEnum):
+        type = TypeEnum[type]
+
     url = data.get("url")
 
     has_delete_button = data.get("has_delete_button", False)
@@ -39,7 +117,7 @@ def process_notify(data: dict[str, Any]) -> None:
     if isinstance(need_html_escape_content, str):
         need_html_escape_content = need_html_escape_content == "true"
 
-    add_notify(
+    return dict(
         name=name,
         message=message,
         type=type,
@@ -52,6 +130,61 @@ def process_notify(data: dict[str, Any]) -> None:
     )
 
 
+def process_notify(data: dict[str, Any]) -> Notification:
+    return add_notify(**parse_notify(data))
+
+
+def parse_notify_batch(text: str) -> list[dict[str, Any]]:
+    """
+    Функция разбирает тело запроса: JSON-массив или NDJSON (один JSON-объект на строку)
+    """
+
+    try:
+        items = json.loads(text)
+        if not isinstance(items, list):
+            items = [items]
+
+    except json.JSONDecodeError:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    if len(items) > ADD_NOTIFY_BATCH_MAX_SIZE:
+        raise Exception(
+            f"Количество уведомлений {len(items)} превышает "
+            f"максимальное количество {ADD_NOTIFY_BATCH_MAX_SIZE}"
+        )
+
+    return items
+
+
+def process_notify_batch(items: list[Any]) -> list[dict[str, Any]]:
+    """
+    Функция проверяет каждое уведомление по тем же правилам, что и process_notify,
+    и добавляет подходящие одним INSERT: либо все, либо ни одного.
+    Возвращает результат для каждого элемента
+    """
+
+    results: list[dict[str, Any] | None] = [None] * len(items)
+
+    indexes: list[int] = []
+    valid_items: list[dict[str, Any]] = []
+    for i, data in enumerate(items):
+        try:
+            if not isinstance(data, dict):
+                raise Exception(f"Ожидался объект, а не {type(data).__name__}")
+
+            valid_items.append(parse_notify(data))
+            indexes.append(i)
+
+        except Exception as e:
+            results[i] = {"ok": False, "error": str(e)}
+
+    errors = add_notify_many(valid_items) if valid_items else []
+    for i, error in zip(indexes, errors):
+        results[i] = {"ok": True} if error is None else {"ok": False, "error": error}
+
+    return results
+
+
 @routes.get("/")
 async def index(_: web.Request):
     text = """
@@ -152,16 +285,131 @@ async def add_notify_handler(request: web.Request):
             data = await request.json()
 
         print(f"[add_notify] data: {data}")
-        process_notify(data)
+
+        db_executor: DbExecutor = request.app["db_executor"]
+        await db_executor.run(process_notify, data)
+
+        METRIC_INGESTED.inc(labels=("ok",))
+
+        on_added: OnAddedFunc | None = request.app["on_added"]
+        if on_added:
+            on_added()
 
         return web.json_response({"ok": True})
 
     except Exception as e:
+        METRIC_INGESTED.inc(labels=("error",))
         return web.json_response({"error": str(e)})
 
 
-if __name__ == "__main__":
-    app = web.Application()
+@routes.post("/add_notify_batch")
+async def add_notify_batch_handler(request: web.Request):
+    try:
+        items = parse_notify_batch(await request.text())
+
+        db_executor: DbExecutor = request.app["db_executor"]
+        results = await db_executor.run(process_notify_batch, items)
+
+        ok_number = sum(1 for result in results if result["ok"])
+        METRIC_INGESTED.inc(ok_number, labels=("ok",))
+        METRIC_INGESTED.inc(len(results) - ok_number, labels=("error",))
+
+        on_added: OnAddedFunc | None = request.app["on_added"]
+        if on_added and ok_number:
+            on_added()
+
+        return web.json_response({"ok": True, "results": results})
+
+    except Exception as e:
+        METRIC_INGESTED.inc(labels=("error",))
+        return web.json_response({"error": str(e)})
+
+
+@routes.post("/webhook/{secret}")
+async def webhook_handler(request: web.Request):
+    dispatcher: Dispatcher | None = request.app.get("dispatcher")
+    if not dispatcher or request.match_info["secret"] != WEBHOOK_SECRET:
+        raise web.HTTPNotFound()
+
+    try:
+        data = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest()
+
+    # Обработчики выполняются в потоках диспетчера, поэтому Telegram получает ответ сразу
+    update = Update.de_json(data, dispatcher.bot)
+    dispatcher.update_queue.put(update)
+
+    return web.Response()
+
+
+@routes.get("/metrics")
+async def metrics_handler(request: web.Request):
+    # Часть метрик читается из базы, поэтому вывод выполняется в пуле потоков
+    db_executor: DbExecutor = request.app["db_executor"]
+    text = await db_executor.run(REGISTRY.render)
+
+    return web.Response(
+        body=text.encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler):
+    t = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+
+    except web.HTTPException as e:
+        status = e.status
+        raise e
+
+    finally:
+        # Шаблон маршрута, а не путь, чтобы секрет вебхука не попал в метки
+        resource = request.match_info.route.resource
+        path = resource.canonical if resource else "unknown"
+
+        METRIC_REQUESTS.inc(labels=(path, str(status)))
+        METRIC_REQUEST_DURATION.observe(time.perf_counter() - t, labels=(path,))
+
+
+def get_webhook_path() -> str:
+    return f"/webhook/{WEBHOOK_SECRET}"
+
+
+def create_app(
+    dispatcher: Dispatcher = None,
+    on_added: OnAddedFunc = None,
+) -> web.Application:
+    """
+    Функция создает приложение web_api. Если передан диспетчер бота,
+    то обновления от Telegram принимаются на маршруте вебхука.
+    Функция on_added вызывается после добавления уведомлений (одного или пакета)
+    """
+
+    app = web.Application(middlewares=[metrics_middleware])
     app.add_routes(routes)
+    app["dispatcher"] = dispatcher
+    app["on_added"] = on_added
+
+    db_executor = DbExecutor(
+        workers=WEB_API_DB_WORKERS,
+        max_pending=WEB_API_DB_MAX_PENDING,
+    )
+    app["db_executor"] = db_executor
 
+    async def on_cleanup(_: web.Application) -> None:
+        db_executor.shutdown()
+
+    app.on_cleanup.append(on_cleanup)
+
+    return app
+
+
+if __name__ == "__main__":
+    app = create_app()
     web.run_app(app, host=HOST, port=PORT)
@@ -4,15 +4,74 @@
 __author__ = "ipetrash"
 
 
+import asyncio
+import datetime as dt
+import json
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+import unittest.mock
 
+from pathlib import Path
+from typing import Any
+from queue import Queue
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
 from peewee import SqliteDatabase
 from playhouse.sqlite_ext import SqliteExtDatabase
 
-from telegram_notifications_bot.bot import regexp_patterns as P
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.ext import Dispatcher, TypeHandler
 
-from telegram_notifications_bot.common import TypeEnum
-from telegram_notifications_bot.db import NotificationGroup, Notification, Search
+from telegram_notifications_bot.bot import regexp_patterns as P
+from telegram_notifications_bot.bot.markup import (
+    get_paginator_markup,
+    _get_paginator_markup,
+)
+from telegram_notifications_bot.bot.message_states import MessageStates
+from telegram_notifications_bot.bot.profiling import Timings, SamplingProfiler
+from telegram_notifications_bot.bot.rate_limiter import RateLimiter
+from telegram_notifications_bot.bot.workers import ChatWorkerPool
+
+from telegram_notifications_bot.common import TypeEnum, LRUCache
+from telegram_notifications_bot.metrics import Counter, Gauge, Histogram, Registry
+from telegram_notifications_bot.config import (
+    ADD_NOTIFY_BATCH_MAX_SIZE,
+    MESSAGE_ACCESS_DENIED,
+)
+from telegram_notifications_bot.db import (
+    NotificationGroup,
+    Notification,
+    NotificationArchive,
+    NotificationStats,
+    Search,
+    DataChangeWatcher,
+    FTS_IS_AVAILABLE,
+    HTML_CACHE,
+    SQLITE_MAX_VARIABLE_NUMBER,
+    get_required_literals,
+    regexp,
+)
+from telegram_notifications_bot.third_party.telegram_bot_pagination import (
+    InlineKeyboardPaginator,
+)
+from telegram_notifications_bot.tools.fake_bot_api import (
+    FakeBotApi,
+    ERROR_RETRY_AFTER,
+    ERROR_SERVER,
+)
+from telegram_notifications_bot.tools.notify_client import (
+    NotifyClient,
+    AsyncNotifyClient,
+)
+from telegram_notifications_bot.tools.spool import Spool
+from telegram_notifications_bot.web_api import main as WebApi
+from telegram_notifications_bot.bot import main as BotMain
 
 DEBUG: bool = False
 
@@ -55,14 +114,390 @@ class TestRegexpPatterns(unittest.TestCase):
         )
 
 
+class TestLRUCache(unittest.TestCase):
+    def test_max_size(self) -> None:
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(1, cache.get("a"))
+
+        # Удаляется давно не используемое значение
+        cache.set("c", 3)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(3, cache.get("c"))
+
+        self.assertEqual(3, cache.pop("c"))
+        self.assertIsNone(cache.pop("c"))
+        self.assertEqual(-1, cache.get("c", -1))
+
+
+class TestPaginatorMarkup(unittest.TestCase):
+    def test_get_paginator_markup(self) -> None:
+        buttons = [
+            InlineKeyboardButton("url", url="https://example.com"),
+            InlineKeyboardButton("delete", callback_data="delete"),
+        ]
+
+        for page_count, current_page, buttons in [
+            (1, 1, []),
+            (1, 1, buttons),
+            (5, 3, buttons),
+            (100, 1, buttons),
+            (100, 50, []),
+            (100, 99, buttons[:1]),
+        ]:
+            with self.subTest(
+                page_count=page_count, current_page=current_page, buttons=buttons
+            ):
+                paginator = InlineKeyboardPaginator(
+                    page_count=page_count,
+                    current_page=current_page,
+                    data_pattern="page={page}",
+                )
+                if buttons:
+                    paginator.add_before(*buttons)
+
+                markup = get_paginator_markup(
+                    page_count=page_count,
+                    current_page=current_page,
+                    data_pattern="page={page}",
+                    buttons=buttons,
+                )
+                self.assertEqual(paginator.markup, markup)
+
+                hits = _get_paginator_markup.cache_info().hits
+                self.assertIs(
+                    markup,
+                    get_paginator_markup(
+                        page_count=page_count,
+                        current_page=current_page,
+                        data_pattern="page={page}",
+                        buttons=buttons,
+                    ),
+                )
+                self.assertEqual(hits + 1, _get_paginator_markup.cache_info().hits)
+
+
+class TestMessageStates(unittest.TestCase):
+    def test_is_changed(self) -> None:
+        states = MessageStates(max_size=10)
+        chat_id, message_id = 1, 100
+        reply_markup = '{"inline_keyboard": [[{"text": "1", "callback_data": "1"}]]}'
+
+        self.assertFalse(states.has(chat_id, message_id))
+        self.assertTrue(states.is_changed(chat_id, message_id, "text", reply_markup))
+
+        states.set(chat_id, message_id, "text", reply_markup)
+        self.assertTrue(states.has(chat_id, message_id))
+        self.assertFalse(states.is_changed(chat_id, message_id, "text", reply_markup))
+        self.assertTrue(states.is_changed(chat_id, message_id, "text 2", reply_markup))
+        self.assertTrue(states.is_changed(chat_id, message_id, "text", None))
+        self.assertTrue(states.is_changed(chat_id, message_id + 1, "text", reply_markup))
+
+        with self.subTest("InlineKeyboardMarkup"):
+            markup = InlineKeyboardMarkup.from_button(InlineKeyboardButton("1", url="1"))
+            states.set(chat_id, message_id, "text", markup)
+            self.assertFalse(states.is_changed(chat_id, message_id, "text", markup))
+
+        with self.subTest("Remove"):
+            states.remove(chat_id, message_id)
+            self.assertFalse(states.has(chat_id, message_id))
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+        def sleep(seconds: float) -> None:
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+        self.limiter = RateLimiter(
+            global_rate=10,
+            global_burst=10,
+            chat_rate=1,
+            chat_burst=2,
+            clock=lambda: self.now,
+            sleep=sleep,
+        )
+
+    def test_acquire(self) -> None:
+        with self.subTest("Burst"):
+            self.assertEqual(0, self.limiter.acquire(1))
+            self.assertEqual(0, self.limiter.acquire(1))
+
+        with self.subTest("Chat limit"):
+            self.assertAlmostEqual(1, self.limiter.acquire(1))
+
+        with self.subTest("Other chat"):
+            self.assertEqual(0, self.limiter.acquire(2))
+
+        stats = self.limiter.get_stats(1)
+        self.assertEqual(1, stats["waits"])
+        self.assertAlmostEqual(0, stats["chat_allowance"])
+
+    def test_call_retry_after(self) -> None:
+        calls = []
+
+        def func(chat_id: int) -> str:
+            calls.append(self.now)
+            if len(calls) == 1:
+                raise RetryAfter(5)
+            return f"ok {chat_id}"
+
+        self.assertEqual("ok 1", self.limiter.call(1, func, chat_id=1))
+        self.assertEqual(2, len(calls))
+        self.assertAlmostEqual(5, calls[1] - calls[0])
+        self.assertEqual(1, self.limiter.get_stats()["retry_after"])
+
+    def test_retry_after_blocks_global(self) -> None:
+        self.limiter.block(1, 5)
+
+        # Другой чат тоже ждет, т.к. заблокирован общий лимит
+        self.assertAlmostEqual(5, self.limiter.acquire(2))
+
+    def test_prune_chat_buckets(self) -> None:
+        limiter = RateLimiter(
+            global_rate=1000,
+            global_burst=1000,
+            chat_rate=1,
+            chat_burst=2,
+            chat_buckets_prune_size=3,
+            clock=lambda: self.now,
+            sleep=lambda seconds: self.fail(f"Лишнее ожидание {seconds} сек."),
+        )
+
+        for chat_id in range(3):
+            limiter.acquire(chat_id)
+        # Только корзина чата, без общего лимита
+        limiter.chat_buckets[0].block(60, self.now)
+        self.assertEqual(3, len(limiter.chat_buckets))
+
+        # Корзины восполнились, но чат 0 еще заблокирован
+        self.now += 10
+        limiter.acquire(3)
+        self.assertEqual([0, 3], sorted(limiter.chat_buckets))
+
+    def test_call_max_retries(self) -> None:
+        def func() -> None:
+            raise RetryAfter(1)
+
+        with self.assertRaises(RetryAfter):
+            self.limiter.call(1, func)
+
+
+class TestChatWorkerPool(unittest.TestCase):
+    def test_submit(self) -> None:
+        processed: dict[int, list[int]] = dict()
+        lock = threading.Lock()
+        event = threading.Event()
+
+        def process(item: tuple[int, int]) -> None:
+            event.wait()
+
+            chat_id, number = item
+            with lock:
+                processed.setdefault(chat_id, []).append(number)
+
+        pool = ChatWorkerPool(workers=3, process=process)
+        pool.start()
+
+        expected: dict[int, list[int]] = dict()
+        for number in range(20):
+            for chat_id in range(5):
+                self.assertTrue(
+                    pool.submit(chat_id, (chat_id, number), (chat_id, number))
+                )
+                expected.setdefault(chat_id, []).append(number)
+
+        with self.subTest("Duplicate"):
+            self.assertTrue(pool.is_in_progress((0, 0)))
+            self.assertFalse(pool.submit(0, (0, 0), (0, 0)))
+
+        event.set()
+        pool.join()
+
+        with self.subTest("Order in chat"):
+            self.assertEqual(expected, processed)
+            self.assertFalse(pool.is_in_progress((0, 0)))
+
+    def test_max_pending_per_chat(self) -> None:
+        event = threading.Event()
+
+        pool = ChatWorkerPool(
+            workers=1, process=lambda _: event.wait(), max_pending_per_chat=2
+        )
+        pool.start()
+
+        pool.submit(1, 1, None)
+        self.assertFalse(pool.is_full(1))
+
+        pool.submit(1, 2, None)
+        self.assertTrue(pool.is_full(1))
+        self.assertFalse(pool.is_full(2))
+
+        event.set()
+        pool.join()
+        self.assertFalse(pool.is_full(1))
+
+
+class FakeSendingPool:
+    """
+    Пул без потоков: задачи остаются в очереди, пока не будет вызван done
+    """
+
+    def __init__(self, max_pending_per_chat: int) -> None:
+        self.max_pending_per_chat: int = max_pending_per_chat
+        self.pending: dict[int, list[Notification]] = dict()
+        self.submitted: list[int] = []
+
+    def is_full(self, chat_id: int) -> bool:
+        return len(self.pending.get(chat_id, [])) >= self.max_pending_per_chat
+
+    def submit(self, chat_id: int, key: int, item: Notification) -> bool:
+        if any(n.id == key for items in self.pending.values() for n in items):
+            return False
+
+        self.pending.setdefault(chat_id, []).append(item)
+        self.submitted.append(key)
+        return True
+
+    def done(self, chat_id: int) -> None:
+        self.pending[chat_id].pop(0).set_as_send()
+
+
+class TestSending(unittest.TestCase):
+    def setUp(self) -> None:
+        self.models = [
+            NotificationGroup,
+            Notification,
+            NotificationArchive,
+            NotificationStats,
+        ]
+        self.test_db = SqliteExtDatabase(":memory:", regexp_function=True)
+        self.test_db.bind(self.models, bind_refs=False, bind_backrefs=False)
+        self.test_db.connect()
+        self.test_db.create_tables(self.models)
+
+        HTML_CACHE.clear()
+
+    def tearDown(self) -> None:
+        self.test_db.close()
+
+    def test_scanner(self) -> None:
+        # Уведомления чата 1: id 1-5, чата 2: id 6-7
+        for chat_id, number in [(1, 5), (2, 2)]:
+            for i in range(number):
+                Notification.add(chat_id=chat_id, name="test", message=str(i))
+
+        pool = FakeSendingPool(max_pending_per_chat=2)
+        scanner = BotMain.UnsentScanner(pool, max_number=100)
+
+        self.assertFalse(scanner.scan())
+        self.assertEqual([1, 2, 6, 7], pool.submitted)
+
+        with self.subTest("Order in chat"):
+            pool.done(1)
+            scanner.scan()
+            self.assertEqual([1, 2, 6, 7, 3], pool.submitted)
+
+            pool.done(1)
+            pool.done(1)
+            scanner.scan()
+            self.assertEqual([1, 2, 6, 7, 3, 4, 5], pool.submitted)
+
+        with self.subTest("Resume after last id"):
+            pool.done(2)
+            pool.done(2)
+            Notification.add(chat_id=3, name="test", message="new")
+
+            scanner.scan()
+            self.assertEqual(8, scanner.after_id)
+            self.assertEqual([1, 2, 6, 7, 3, 4, 5, 8], pool.submitted)
+
+        with self.subTest("Max number"):
+            for i in range(3):
+                Notification.add(chat_id=4 + i, name="test", message=str(i))
+
+            scanner.max_number = 2
+            self.assertTrue(scanner.scan())
+            self.assertFalse(scanner.scan())
+            self.assertEqual([9, 10, 11], pool.submitted[-3:])
+
+    def test_send_notification(self) -> None:
+        notify = Notification.add(chat_id=1, name="test", message="message")
+
+        bot = unittest.mock.MagicMock(spec=Bot)
+        bot.send_message.side_effect = [Exception("Network error"), bot.send_message]
+
+        with (
+            unittest.mock.patch.dict(BotMain.DATA, {"BOT": bot}),
+            unittest.mock.patch.object(BotMain.time, "sleep") as sleep,
+        ):
+            # Отправка повторяется для того же уведомления, а не переходит к следующим
+            BotMain.send_notification(notify)
+            self.assertEqual(2, bot.send_message.call_count)
+            sleep.assert_called_once()
+            self.assertTrue(Notification.is_sent(notify.id))
+
+            with self.subTest("Already sent"):
+                BotMain.send_notification(Notification.get_by_id(notify.id))
+                self.assertEqual(2, bot.send_message.call_count)
+
+            with self.subTest("Database errors"):
+                notify = Notification.add(chat_id=1, name="test", message="message 2")
+
+                bot.send_message.reset_mock(side_effect=True)
+                sleep.reset_mock()
+
+                set_as_send = Notification.set_as_send
+                set_as_send_errors = [Exception("Database error")]
+
+                def set_as_send_with_error(self: Notification) -> None:
+                    if set_as_send_errors:
+                        raise set_as_send_errors.pop()
+                    set_as_send(self)
+
+                # Ошибки базы до и после отправки не должны терять уведомление,
+                # а после успешной отправки повторяется только отметка
+                with (
+                    unittest.mock.patch.object(
+                        Notification,
+                        "is_sent",
+                        side_effect=[Exception("Database error"), False],
+                    ),
+                    unittest.mock.patch.object(
+                        Notification,
+                        "set_as_send",
+                        autospec=True,
+                        side_effect=set_as_send_with_error,
+                    ),
+                ):
+                    BotMain.send_notification(notify)
+
+                self.assertEqual(1, bot.send_message.call_count)
+                self.assertEqual(2, sleep.call_count)
+                self.assertTrue(Notification.is_sent(notify.id))
+
+
 class TestDbNotificationGroup(unittest.TestCase):
     def setUp(self) -> None:
-        self.models = [NotificationGroup, Notification]
+        self.models = [
+            NotificationGroup,
+            Notification,
+            NotificationArchive,
+            NotificationStats,
+        ]
         self.test_db = SqliteDatabase(":memory:")
         self.test_db.bind(self.models, bind_refs=False, bind_backrefs=False)
         self.test_db.connect()
         self.test_db.create_tables(self.models)
 
+        HTML_CACHE.clear()
+
     def test_add(self) -> None:
         with self.subTest("Ok"):
             name = "test group 1"
@@ -113,6 +548,11 @@ class TestDbNotificationGroup(unittest.TestCase):
         ]
         self.assertEqual(len(notifications), group.get_total_notifications())
 
+        with self.subTest("Delete"):
+            notifications.pop().delete_instance()
+            self.assertEqual(len(notifications), group.get_total_notifications())
+            self.assertEqual(len(notifications), group.total_notifications)
+
     def test_is_complete(self) -> None:
         group = NotificationGroup.add(name="test group 1", max_number=10)
         self.assertFalse(group.is_complete())
@@ -135,6 +575,25 @@ class TestDbNotificationGroup(unittest.TestCase):
             )
         self.assertTrue(group.is_complete())
 
+    def test_set_as_send(self) -> None:
+        group = NotificationGroup.add(name="test group 1", max_number=3)
+        notifications = [
+            Notification.add(
+                chat_id=1,
+                name="test",
+                message=f"message #{i}",
+                group=group,
+            )
+            for i in range(group.max_number)
+        ]
+        notify_without_group = Notification.add(chat_id=1, name="test", message="")
+
+        self.assertEqual(len(notifications), group.set_as_send())
+        self.assertEqual([notify_without_group], Notification.get_unsent())
+
+        # Повторно не помечаются
+        self.assertEqual(0, group.set_as_send())
+
     def test_get_notification(self) -> None:
         group = NotificationGroup.add(name="test group 1", max_number=10)
 
@@ -153,12 +612,20 @@ class TestDbNotificationGroup(unittest.TestCase):
 
 class TestDbNotification(unittest.TestCase):
     def setUp(self) -> None:
-        self.models = [NotificationGroup, Notification, Search]
+        self.models = [
+            NotificationGroup,
+            Notification,
+            NotificationArchive,
+            NotificationStats,
+            Search,
+        ]
         self.test_db = SqliteExtDatabase(":memory:", regexp_function=True)
         self.test_db.bind(self.models, bind_refs=False, bind_backrefs=False)
         self.test_db.connect()
         self.test_db.create_tables(self.models)
 
+        HTML_CACHE.clear()
+
     def test_add(self) -> None:
         chat_id = 123
         name = "test"
@@ -253,6 +720,103 @@ class TestDbNotification(unittest.TestCase):
         ]
         self.assertEqual(items, Notification.get_unsent())
 
+    def test_add_many(self) -> None:
+        chat_id = 123
+        group_name = "group 1"
+
+        errors = Notification.add_many(
+            [
+                dict(chat_id=chat_id, name="test", message="message 1"),
+                dict(
+                    chat_id=chat_id,
+                    name="test",
+                    message="message 2",
+                    group=group_name,
+                    group_max_number=2,
+                ),
+                # Группы еще нет в базе, но max_number должен быть задан
+                dict(chat_id=chat_id, name="test", message="", group="group 404"),
+                dict(chat_id=chat_id, name="test", message="message 3", group=group_name),
+                # Превышение максимального количества с учетом уведомлений из пакета
+                dict(chat_id=chat_id, name="test", message="message 4", group=group_name),
+            ]
+        )
+        self.assertEqual(5, len(errors))
+        self.assertIsNone(errors[0])
+        self.assertIsNone(errors[1])
+        self.assertIsNotNone(errors[2])
+        self.assertIsNone(errors[3])
+        self.assertIsNotNone(errors[4])
+
+        items = Notification.get_unsent()
+        self.assertEqual(
+            ["message 1", "message 2", "message 3"],
+            [notify.message for notify in items],
+        )
+
+        group = NotificationGroup.get_by(group_name)
+        self.assertTrue(group.is_complete())
+        self.assertEqual(items[1], group.get_notification(0))
+        self.assertEqual(items[2], group.get_notification(1))
+
+        with self.subTest("One INSERT"):
+            number = ADD_NOTIFY_BATCH_MAX_SIZE
+            with unittest.mock.patch.object(
+                Notification, "insert_many", wraps=Notification.insert_many
+            ) as insert_many:
+                errors = Notification.add_many(
+                    [
+                        dict(chat_id=chat_id, name="test", message=f"many {i}")
+                        for i in range(number)
+                    ]
+                )
+
+            self.assertEqual([None] * number, errors)
+            self.assertEqual(1, insert_many.call_count)
+            self.assertLessEqual(
+                number * len(Notification._meta.fields), SQLITE_MAX_VARIABLE_NUMBER
+            )
+
+        with self.subTest("Parameters limit"):
+            unsent_number = Notification.get_unsent_number()
+
+            # Как в SQLite < 3.32: пакет отклоняется целиком, а не частично
+            with unittest.mock.patch(
+                "telegram_notifications_bot.db.SQLITE_MAX_VARIABLE_NUMBER", 999
+            ):
+                max_number = Notification.get_add_many_max_number()
+                with self.assertRaises(Exception):
+                    Notification.add_many(
+                        [
+                            dict(chat_id=chat_id, name="test", message="message")
+                            for _ in range(max_number + 1)
+                        ]
+                    )
+
+            self.assertEqual(unsent_number, Notification.get_unsent_number())
+
+    def test_iter_unsent(self) -> None:
+        chat_id = 123
+        name = "test"
+        message = "message 1"
+
+        items = [
+            Notification.add(
+                chat_id=chat_id,
+                name=name,
+                message=message,
+            )
+            for _ in range(5)
+        ]
+        items[1].set_as_send()
+        expected = [items[0]] + items[2:]
+
+        for batch_size in [1, 2, 4, 100]:
+            with self.subTest(batch_size=batch_size):
+                self.assertEqual(
+                    expected, list(Notification.iter_unsent(batch_size=batch_size))
+                )
+
     def test_set_as_send(self) -> None:
         chat_id = 123
         name = "test"
@@ -273,6 +837,27 @@ class TestDbNotification(unittest.TestCase):
 
         self.assertFalse(Notification.get_unsent())
 
+    def test_set_as_send_many(self) -> None:
+        items = [
+            Notification.add(
+                chat_id=123,
+                name="test",
+                message="message 1",
+            )
+            for _ in range(5)
+        ]
+        items[0].set_as_send()
+
+        ids = [notify.id for notify in items[:4]]
+        self.assertEqual(3, Notification.set_as_send_many(ids, batch_size=2))
+        self.assertEqual([items[-1]], Notification.get_unsent())
+
+        # Дата отправки уже помеченных не меняется
+        self.assertEqual(
+            items[0].sending_datetime,
+            Notification.get_by_id(items[0].id).sending_datetime,
+        )
+
     def test_get_index_in_group(self) -> None:
         with self.subTest("Ok"):
             group = NotificationGroup.add(name="test group 1", max_number=10)
@@ -290,6 +875,14 @@ class TestDbNotification(unittest.TestCase):
                 idx = notify.get_index_in_group()
                 self.assertEqual(notify, notify.group.get_notification(idx))
 
+        with self.subTest("Delete"):
+            notifications.pop(1).delete_instance()
+            for i, notify in enumerate(notifications):
+                self.assertEqual(notify, group.get_notification(i))
+                self.assertEqual(
+                    i, Notification.get_by_id(notify.id).get_index_in_group()
+                )
+
         with self.subTest("Without group"):
             notify = Notification.add(
                 chat_id=1,
@@ -329,6 +922,45 @@ class TestDbNotification(unittest.TestCase):
             self.assertIn(notify.name, text)
             self.assertIn(notify.message, text)
 
+    def test_get_html_cache(self) -> None:
+        chat_id = 123
+        group_name = "group 1"
+        group_max_number = 3
+
+        def add() -> Notification:
+            return Notification.add(
+                chat_id=chat_id,
+                name="<b>name</b>",
+                message="message",
+                group=group_name,
+                group_max_number=group_max_number,
+            )
+
+        notify = add()
+        add()
+
+        notify = Notification.get_with_group(notify.id)
+        self.assertIn("[1/2]", notify.get_html())
+
+        with self.subTest("Without queries"):
+            with unittest.mock.patch.object(
+                self.test_db, "execute_sql", wraps=self.test_db.execute_sql
+            ) as mock_execute_sql:
+                self.assertEqual(
+                    notify.get_html(), Notification.get_with_group(notify.id).get_html()
+                )
+                self.assertEqual(1, mock_execute_sql.call_count)
+
+        with self.subTest("Group changed"):
+            add()
+            notify = Notification.get_with_group(notify.id)
+            self.assertIn("[1/3]", notify.get_html())
+
+        with self.subTest("Save"):
+            notify.message = "new message"
+            notify.save()
+            self.assertIn("new message", notify.get_html())
+
     def test_is_first_in_group(self) -> None:
         chat_id = 123
         name = "test"
@@ -379,6 +1011,233 @@ class TestDbNotification(unittest.TestCase):
 
                 search = Search.get_by(text)
                 self.assertIsNotNone(search)
+                self.assertEqual(expected, search.get_ids())
+                self.assertEqual(expected, Notification.get_ids_by_search(search))
+
+    @unittest.skipUnless(FTS_IS_AVAILABLE, "SQLite без FTS5 trigram")
+    def test_search_fts(self) -> None:
+        chat_id = 123
+        notification_1 = Notification.add(chat_id, name="Hello", message="Привет мир!")
+        notification_2 = Notification.add(chat_id, name="World", message='Say "hello"')
+        notification_3 = Notification.add(chat_id, name="Hi", message="пока")
+
+        for text, expected in [
+            ("hello", [notification_1.id, notification_2.id]),
+            ("ПРИВЕТ", [notification_1.id]),
+            ("hello привет", [notification_1.id]),
+            ('"hello"', [notification_2.id]),
+            # Короче 3 символов - поиск через регулярное выражение
+            ("hi", [notification_3.id]),
+            ("^hel+o ", [notification_1.id]),
+        ]:
+            with self.subTest(text=text):
+                _, actual = Notification.search(text)
+                self.assertEqual(expected, actual)
+
+        with self.subTest("Update"):
+            notification_3.message = "hello again"
+            notification_3.save()
+
+            _, actual = Notification.search("hello")
+            self.assertEqual(
+                [notification_1.id, notification_2.id, notification_3.id], actual
+            )
+            _, actual = Notification.search("пока")
+            self.assertEqual([], actual)
+
+        with self.subTest("Delete"):
+            notification_1.delete_instance()
+
+            _, actual = Notification.search("hello")
+            self.assertEqual([notification_2.id, notification_3.id], actual)
+
+    def test_stats(self) -> None:
+        chat_id = 123
+
+        with self.subTest("Empty"):
+            self.assertEqual(dict(), NotificationStats.get_number_by_year(chat_id))
+            self.assertEqual(
+                (None, None), Notification.get_first_and_last_append_datetime(chat_id)
+            )
+
+        items = [
+            Notification.create(
+                chat_id=chat_id,
+                name="name",
+                message="message",
+                type=type,
+                append_datetime=dt.datetime(year, 1, day),
+            )
+            for day, (year, type) in enumerate(
+                [
+                    (2022, TypeEnum.INFO),
+                    (2024, TypeEnum.ERROR),
+                    (2024, TypeEnum.INFO),
+                    (2024, TypeEnum.INFO),
+                ],
+                start=1,
+            )
+        ]
+        Notification.add(chat_id + 1, name="name", message="message")
+
+        with self.subTest("Number by year"):
+            self.assertEqual(
+                {2024: 3, 2022: 1}, NotificationStats.get_number_by_year(chat_id)
+            )
+
+            stats = NotificationStats.get(chat_id=chat_id, year=2024, type=TypeEnum.INFO)
+            self.assertEqual(2, stats.number)
+
+        with self.subTest("First and last"):
+            self.assertEqual(
+                (items[0].append_datetime, items[-1].append_datetime),
+                Notification.get_first_and_last_append_datetime(chat_id),
+            )
+
+        with self.subTest("Delete"):
+            Notification.delete().where(Notification.id == items[0].id).execute()
+            self.assertEqual({2024: 3}, NotificationStats.get_number_by_year(chat_id))
+
+    def test_archive(self) -> None:
+        chat_id = 123
+        old = dt.datetime.now() - dt.timedelta(days=100)
+        sent = dt.datetime.now()
+
+        def add(name: str, **kwargs: Any) -> Notification:
+            return Notification.create(
+                chat_id=chat_id, name=name, message="message", **kwargs
+            )
+
+        old_sent = add("old sent", append_datetime=old, sending_datetime=sent)
+        old_unsent = add("old unsent", append_datetime=old)
+        new_sent = add("new sent", sending_datetime=sent)
+
+        group = NotificationGroup.add("group", max_number=2)
+        group_items = [
+            Notification.add(chat_id, f"group {i}", "message", group=group)
+            for i in range(2)
+        ]
+        Notification.update(append_datetime=old, sending_datetime=sent).where(
+            Notification.group == group
+        ).execute()
+
+        # Группа, в которой есть неотправленное уведомление, остается целиком
+        active_group = NotificationGroup.add("active group", max_number=3)
+        active_group_items = [
+            Notification.add(chat_id, f"active {i}", "message", group=active_group)
+            for i in range(2)
+        ]
+        Notification.update(append_datetime=old).where(
+            Notification.group == active_group
+        ).execute()
+        active_group_items[0].set_as_send()
+
+        # Последнее уведомление не переносится, чтобы его id не достался новому
+        last = add("last", append_datetime=old, sending_datetime=sent)
+
+        number_by_year = NotificationStats.get_number_by_year(chat_id)
+        first_and_last = Notification.get_first_and_last_append_datetime(chat_id)
+
+        self.assertEqual(3, NotificationArchive.archive(older_than_days=30))
+
+        archived_ids = [old_sent.id] + [obj.id for obj in group_items]
+        query = NotificationArchive.select().order_by(NotificationArchive.id)
+        self.assertEqual(archived_ids, [obj.id for obj in query])
+        self.assertEqual(
+            [old_unsent.id, new_sent.id]
+            + [obj.id for obj in active_group_items]
+            + [last.id],
+            [obj.id for obj in Notification.select().order_by(Notification.id)],
+        )
+
+        with self.subTest("Repeat"):
+            self.assertEqual(0, NotificationArchive.archive(older_than_days=30))
+
+        with self.subTest("Stats"):
+            self.assertEqual(
+                number_by_year, NotificationStats.get_number_by_year(chat_id)
+            )
+            self.assertEqual(
+                first_and_last,
+                Notification.get_first_and_last_append_datetime(chat_id),
+            )
+
+        with self.subTest("Group"):
+            self.assertEqual(2, group.get_total_notifications())
+            for i, notify in enumerate(group_items):
+                actual = group.get_notification(i)
+                self.assertIsInstance(actual, NotificationArchive)
+                self.assertEqual(notify.id, actual.id)
+                self.assertEqual(i, actual.index_in_group)
+                self.assertEqual(notify.get_html(), actual.get_html())
+
+        with self.subTest("Get with group"):
+            notify = Notification.get_with_group(group_items[1].id)
+            self.assertIsInstance(notify, NotificationArchive)
+            self.assertEqual(group.id, notify.group.id)
+
+        with self.subTest("Search"):
+            _, ids = Notification.search("sent")
+            self.assertEqual([old_sent.id, old_unsent.id, new_sent.id], ids)
+
+            _, ids = Notification.search("group [01]")
+            self.assertEqual([obj.id for obj in group_items], ids)
+
+            notify = Notification.get_by_search("group", page=2)
+            self.assertEqual(group_items[1].id, notify.id)
+
+        with self.subTest("Delete from archive"):
+            NotificationArchive.delete().where(
+                NotificationArchive.id == old_sent.id
+            ).execute()
+
+            _, ids = Notification.search("sent")
+            self.assertEqual([old_unsent.id, new_sent.id], ids)
+            self.assertEqual(
+                sum(number_by_year.values()) - 1,
+                sum(NotificationStats.get_number_by_year(chat_id).values()),
+            )
+
+    def test_get_required_literals(self) -> None:
+        for regex, expected in [
+            ("timeout", ["timeout"]),
+            (r"disk\s+full", ["disk", "full"]),
+            (r"disk (full|error)", ["disk "]),
+            ("(?i)Ошибка:? .+ сервер", ["Ошибка", " ", " сервер"]),
+            ("(backup){2} ok?", ["backup", " o"]),
+            ("a*b[cd]", ["b"]),
+            ("x|y", []),
+            ("[invalid", []),
+        ]:
+            with self.subTest(regex=regex):
+                self.assertEqual(expected, get_required_literals(regex))
+
+    def test_search_regexp_prefilter(self) -> None:
+        chat_id = 123
+        for i in range(100):
+            Notification.add(chat_id, name=f"Job #{i}", message="OK")
+        notification_1 = Notification.add(chat_id, name="Job", message="Disk  FULL")
+        notification_2 = Notification.add(chat_id, name="Диск", message="полон!")
+
+        values = []
+
+        def regexp_with_counter(pattern: str, value: str) -> bool:
+            values.append(value)
+            return regexp(pattern, value)
+
+        self.test_db.register_function(regexp_with_counter, "regexp", 2)
+
+        # Без обязательных подстрок функция вызывается для всех записей
+        for text, expected, number_of_calls in [
+            (r"disk\s+full", [notification_1.id], 1),
+            (r"ДИСК\s+полон", [notification_2.id], 1),
+            (r"(disk|диск)\s+", [notification_1.id, notification_2.id], 102),
+        ]:
+            with self.subTest(text=text):
+                values.clear()
+                _, actual = Notification.search(text)
+                self.assertEqual(expected, actual)
+                self.assertEqual(number_of_calls, len(values))
 
     def test_get_by_search(self) -> None:
         with self.subTest("Not found"):
@@ -416,6 +1275,8 @@ class TestDbNotification(unittest.TestCase):
                 actual = Notification.get_by_search(search, page=2)
                 self.assertEqual(notification_2, actual)
 
+                self.assertIsNone(Notification.get_by_search(search, page=3))
+
 
 class TestDbSearch(unittest.TestCase):
     def setUp(self) -> None:
@@ -435,6 +1296,39 @@ class TestDbSearch(unittest.TestCase):
 
         self.assertEqual(search1, search2)
 
+    def test_get_ids(self) -> None:
+        text = "Hello World!"
+
+        with self.subTest("Without ids"):
+            search = Search.add(text=text)
+            self.assertIsNone(search.get_ids())
+
+        with self.subTest("With ids"):
+            ids = [1, 2, 5, 100, 100_000, 2**40]
+            search = Search.add(text=text, ids=ids)
+            self.assertEqual(ids, search.get_ids())
+            self.assertEqual(ids, Search.get_by(text).get_ids())
+
+        with self.subTest("Empty"):
+            search.set_ids([])
+            self.assertEqual([], Search.get_by(text).get_ids())
+
+    def test_evict(self) -> None:
+        items = [Search.add(text=f"search #{i}", ids=[i + 1]) for i in range(5)]
+
+        with self.subTest("Max number"):
+            self.assertEqual(3, Search.evict(max_number=2))
+            self.assertEqual(
+                [None, None, None, [4], [5]],
+                [Search.get_by_id(search.id).get_ids() for search in items],
+            )
+
+        with self.subTest("TTL"):
+            self.assertEqual(2, Search.evict(ttl_seconds=-1))
+            self.assertTrue(
+                all(Search.get_by_id(search.id).get_ids() is None for search in items)
+            )
+
     def test_get_by(self) -> None:
         text = "Hello World!"
         self.assertIsNone(Search.get_by(text=text))
@@ -447,5 +1341,843 @@ class TestDbSearch(unittest.TestCase):
         self.assertEqual(search1, search2)
 
 
+class TestWebApi(unittest.TestCase):
+    def test_parse_notify(self) -> None:
+        with self.subTest("Form"):
+            data = WebApi.parse_notify(
+                {
+                    "name": "test",
+                    "message": "message",
+                    "type": "ERROR",
+                    "has_delete_button": "true",
+                    "show_type": "false",
+                    "group_max_number": "3",
+                }
+            )
+            self.assertEqual(TypeEnum.ERROR, data["type"])
+            self.assertTrue(data["has_delete_button"])
+            self.assertFalse(data["show_type"])
+            self.assertEqual(3, data["group_max_number"])
+
+        with self.subTest("Without name"):
+            with self.assertRaises(Exception):
+                WebApi.parse_notify({"message": "message"})
+
+        with self.subTest("Invalid type"):
+            with self.assertRaises(Exception):
+                WebApi.parse_notify({"name": "test", "message": "message", "type": "?"})
+
+    def test_db_executor(self) -> None:
+        db_executor = WebApi.DbExecutor(workers=4, max_pending=2)
+
+        async def run() -> tuple[list[int], int]:
+            ticks = 0
+
+            async def ticker() -> None:
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            task = asyncio.create_task(ticker())
+            results = await asyncio.gather(
+                *[db_executor.run(lambda i: time.sleep(0.05) or i, i) for i in range(4)]
+            )
+            task.cancel()
+            return results, ticks
+
+        try:
+            results, ticks = asyncio.run(run())
+        finally:
+            db_executor.shutdown()
+
+        self.assertEqual([0, 1, 2, 3], results)
+
+        # Цикл событий не блокировался, пока выполнялись задачи
+        self.assertGreater(ticks, 3)
+
+    def test_parse_notify_batch(self) -> None:
+        items = [{"name": "test", "message": f"message {i}"} for i in range(3)]
+
+        with self.subTest("JSON"):
+            self.assertEqual(items, WebApi.parse_notify_batch(json.dumps(items)))
+
+        with self.subTest("NDJSON"):
+            text = "\n".join(json.dumps(item) for item in items) + "\n"
+            self.assertEqual(items, WebApi.parse_notify_batch(text))
+
+        with self.subTest("Max size"):
+            with self.assertRaises(Exception):
+                WebApi.parse_notify_batch(
+                    json.dumps(items * (ADD_NOTIFY_BATCH_MAX_SIZE // len(items) + 1))
+                )
+
+
+    def test_on_added(self) -> None:
+        # Запросы выполняются в потоках DbExecutor, поэтому база в файле, а не в памяти
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = str(Path(temp_dir.name) / "database.sqlite")
+
+        models = [
+            NotificationGroup,
+            Notification,
+            NotificationArchive,
+            NotificationStats,
+        ]
+        test_db = SqliteDatabase(db_path, pragmas={"journal_mode": "wal"})
+        test_db.bind(models, bind_refs=False, bind_backrefs=False)
+        test_db.connect()
+        test_db.create_tables(models)
+
+        added: list[bool] = []
+
+        async def run() -> None:
+            app = WebApi.create_app(on_added=lambda: added.append(True))
+            async with TestClient(TestServer(app)) as client:
+                await client.post("/add_notify", json={"name": "1", "message": "1"})
+                await client.post(
+                    "/add_notify_batch",
+                    json=[{"name": "2", "message": "2"}, {"name": "3", "message": "3"}],
+                )
+
+                # Ни одно уведомление из пакета не добавлено
+                await client.post("/add_notify_batch", json=[{"name": "4"}])
+
+        try:
+            with unittest.mock.patch(
+                "telegram_notifications_bot.tools.add_notify.USER_ID", 123
+            ):
+                asyncio.run(run())
+        finally:
+            test_db.close()
+            temp_dir.cleanup()
+
+        # Один вызов после уведомления и один после пакета,
+        # а после пакета, из которого ничего не добавлено, вызова нет
+        self.assertEqual(2, len(added))
+
+    def test_metrics(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = str(Path(temp_dir.name) / "database.sqlite")
+
+        models = [
+            NotificationGroup,
+            Notification,
+            NotificationArchive,
+            NotificationStats,
+        ]
+        test_db = SqliteDatabase(db_path, pragmas={"journal_mode": "wal"})
+        test_db.bind(models, bind_refs=False, bind_backrefs=False)
+        test_db.connect()
+        test_db.create_tables(models)
+
+        ingested_ok = WebApi.METRIC_INGESTED.get(("ok",))
+        ingested_error = WebApi.METRIC_INGESTED.get(("error",))
+
+        async def run() -> tuple[str, str]:
+            app = WebApi.create_app()
+            async with TestClient(TestServer(app)) as client:
+                await client.post("/add_notify", json={"name": "1", "message": "1"})
+                await client.post(
+                    "/add_notify_batch",
+                    json=[{"name": "2", "message": "2"}, {"name": "3"}],
+                )
+                # Пакет не разобран
+                await client.post("/add_notify_batch", data="not json")
+
+                rs = await client.get("/metrics")
+                return rs.headers["Content-Type"], await rs.text()
+
+        try:
+            with unittest.mock.patch(
+                "telegram_notifications_bot.tools.add_notify.USER_ID", 123
+            ):
+                content_type, text = asyncio.run(run())
+        finally:
+            test_db.close()
+            temp_dir.cleanup()
+
+        self.assertTrue(content_type.startswith("text/plain; version=0.0.4"))
+        self.assertEqual(ingested_ok + 2, WebApi.METRIC_INGESTED.get(("ok",)))
+        self.assertEqual(ingested_error + 2, WebApi.METRIC_INGESTED.get(("error",)))
+
+        lines = text.splitlines()
+        self.assertIn("# TYPE notify_web_api_requests_total counter", lines)
+        self.assertIn("notify_unsent_notifications 2", lines)
+        self.assertIn("notify_db_write_queue_size 0", lines)
+        self.assertTrue(
+            any(
+                line.startswith(
+                    'notify_web_api_request_duration_seconds_count{path="/add_notify"}'
+                )
+                for line in lines
+            )
+        )
+
+    def test_webhook(self) -> None:
+        # Записанные обновления, которые Telegram присылает на вебхук
+        updates = [
+            {
+                "update_id": 1,
+                "callback_query": {
+                    "id": "1",
+                    "from": {"id": 1, "is_bot": False, "first_name": "User"},
+                    "chat_instance": "1",
+                    "data": "page=2",
+                },
+            },
+            {
+                "update_id": 2,
+                "message": {
+                    "message_id": 1,
+                    "date": 0,
+                    "chat": {"id": 1, "type": "private"},
+                    "text": "Hello",
+                },
+            },
+        ]
+
+        # Бот без обращений к Telegram
+        bot = unittest.mock.MagicMock(spec=Bot)
+        dispatcher = Dispatcher(bot, Queue(), workers=1)
+
+        received = Queue()
+        dispatcher.add_handler(TypeHandler(Update, lambda u, _: received.put(u)))
+
+        thread = threading.Thread(target=dispatcher.start, daemon=True)
+        thread.start()
+
+        async def run() -> list[int]:
+            app = WebApi.create_app(dispatcher=dispatcher)
+            async with TestClient(TestServer(app)) as client:
+                statuses = []
+                for data in updates:
+                    rs = await client.post(WebApi.get_webhook_path(), json=data)
+                    statuses.append(rs.status)
+
+                rs = await client.post("/webhook/wrong", json=updates[0])
+                statuses.append(rs.status)
+
+                return statuses
+
+        try:
+            statuses = asyncio.run(run())
+            items = [received.get(timeout=5) for _ in updates]
+        finally:
+            dispatcher.stop()
+            thread.join()
+
+        self.assertEqual([200, 200, 404], statuses)
+        self.assertEqual([1, 2], [update.update_id for update in items])
+        self.assertEqual("page=2", items[0].callback_query.data)
+        self.assertEqual("Hello", items[1].message.text)
+
+        with self.subTest("Without dispatcher"):
+
+            async def run_without_dispatcher() -> int:
+                async with TestClient(TestServer(WebApi.create_app())) as client:
+                    rs = await client.post(WebApi.get_webhook_path(), json=updates[0])
+                    return rs.status
+
+            self.assertEqual(404, asyncio.run(run_without_dispatcher()))
+
+class FakeBatchServer:
+    """
+    Сервер с /add_notify_batch, который запоминает пакеты и соединения, из которых они пришли
+    """
+
+    def __init__(self, port: int = 0) -> None:
+        self.port: int = port
+        self.batches: list[list[dict]] = []
+        self.connections: set[int] = set()
+
+        self.loop = asyncio.new_event_loop()
+        self.runner: web.AppRunner | None = None
+        self.url: str | None = None
+
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    async def _handler(self, request: web.Request) -> web.Response:
+        items = await request.json()
+        self.batches.append(items)
+        self.connections.add(id(request.transport))
+        return web.json_response({"ok": True, "results": [{"ok": True}] * len(items)})
+
+    async def _start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/add_notify_batch", self._handler)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+
+        site = web.TCPSite(self.runner, "127.0.0.1", self.port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    def start(self) -> None:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def get_names(self) -> list[str]:
+        return [item["name"] for batch in self.batches for item in batch]
+
+
+class TestNotifyClient(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = FakeBatchServer()
+        self.server.start()
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def test_batch_size(self) -> None:
+        with NotifyClient(self.server.url, batch_size=3, flush_interval=60) as client:
+            for i in range(7):
+                client.add_notify(str(i), "message")
+
+        self.assertEqual([3, 3, 1], [len(batch) for batch in self.server.batches])
+        self.assertEqual([str(i) for i in range(7)], self.server.get_names())
+
+        # Все пакеты отправлены через одно соединение
+        self.assertEqual(1, len(self.server.connections))
+
+    def test_flush_interval(self) -> None:
+        with NotifyClient(self.server.url, batch_size=100, flush_interval=0.1) as client:
+            client.add_notify("1", "message")
+            client.add_notify("2", "message")
+
+            time.sleep(0.5)
+            names = [[item["name"] for item in batch] for batch in self.server.batches]
+            self.assertEqual([["1", "2"]], names)
+
+            client.add_notify("3", "message")
+            client.flush()
+            self.assertEqual(["1", "2", "3"], self.server.get_names())
+
+    def test_async(self) -> None:
+        async def run() -> None:
+            async with AsyncNotifyClient(
+                self.server.url, batch_size=3, flush_interval=0.1
+            ) as client:
+                for i in range(7):
+                    await client.add_notify(str(i), "message")
+
+                await client.flush()
+                self.assertEqual([str(i) for i in range(7)], self.server.get_names())
+
+                await client.add_notify("7", "message")
+                await asyncio.sleep(0.5)
+                self.assertEqual(8, len(self.server.get_names()))
+
+        asyncio.run(run())
+
+        self.assertEqual([3, 3, 1, 1], [len(batch) for batch in self.server.batches])
+        self.assertEqual(1, len(self.server.connections))
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "spool.ndjson"
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_spool(self) -> None:
+        spool = Spool(self.path, fsync=False)
+        self.assertFalse(spool.has_pending())
+
+        spool.append([{"name": str(i)} for i in range(5)])
+        self.assertTrue(spool.has_pending())
+
+        items, offset = spool.read(3)
+        self.assertEqual(["0", "1", "2"], [item["name"] for item in items])
+
+        # Без commit те же записи будут прочитаны снова
+        self.assertEqual(items, spool.read(3)[0])
+
+        spool.commit(offset)
+
+        with self.subTest("Offset persisted"):
+            spool = Spool(self.path, fsync=False)
+            items, offset = spool.read(10)
+            self.assertEqual(["3", "4"], [item["name"] for item in items])
+
+        with self.subTest("Incomplete and corrupted lines"):
+            with open(self.path, "ab") as f:
+                f.write(b"not json\n")
+                f.write(b'{"name": "5"}\n')
+                f.write(b'{"name": "6"')
+
+            spool = Spool(self.path, fsync=False)
+            items, offset = spool.read(10)
+            self.assertEqual(["3", "4", "5"], [item["name"] for item in items])
+
+        with self.subTest("Truncate"):
+            spool.commit(self.path.stat().st_size)
+            self.assertFalse(spool.has_pending())
+            self.assertEqual(0, self.path.stat().st_size)
+            self.assertFalse(spool.offset_path.exists())
+
+    def test_shared_spool(self) -> None:
+        # Два экземпляра на одном файле, как у двух процессов
+        spool_1 = Spool(self.path, fsync=False)
+        spool_2 = Spool(self.path, fsync=False)
+
+        spool_1.append([{"name": "0"}, {"name": "1"}])
+        spool_2.append([{"name": "2"}])
+
+        with spool_1.reading() as is_acquired:
+            self.assertTrue(is_acquired)
+
+            # Записи уже отправляет первый экземпляр
+            with spool_2.reading() as is_acquired_2:
+                self.assertFalse(is_acquired_2)
+
+            items, offset = spool_1.read(10)
+            self.assertEqual(["0", "1", "2"], [item["name"] for item in items])
+
+            # Запись, добавленная после read, не должна потеряться при очистке
+            spool_2.append([{"name": "3"}])
+            spool_1.commit(offset)
+
+        self.assertTrue(spool_2.has_pending())
+        with spool_2.reading() as is_acquired:
+            self.assertTrue(is_acquired)
+
+            items, offset = spool_2.read(10)
+            self.assertEqual(["3"], [item["name"] for item in items])
+            spool_2.commit(offset)
+
+        self.assertFalse(spool_1.has_pending())
+        self.assertEqual(0, self.path.stat().st_size)
+
+
+class TestNotifyClientSpool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spool_path = Path(self.temp_dir.name) / "spool.ndjson"
+
+        # Свободный порт, на котором сервер пока не запущен
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+
+        self.server = FakeBatchServer(self.port)
+
+    def tearDown(self) -> None:
+        if self.server.runner:
+            self.server.stop()
+        self.temp_dir.cleanup()
+
+    def test_spool(self) -> None:
+        client = NotifyClient(
+            f"http://127.0.0.1:{self.port}",
+            batch_size=3,
+            flush_interval=0.01,
+            attempts_timeouts=[0.05],
+            spool_path=self.spool_path,
+        )
+
+        t = time.perf_counter()
+        for i in range(5):
+            client.add_notify(str(i), "message")
+        self.assertLess(time.perf_counter() - t, 0.1)
+
+        client.flush()
+        self.assertTrue(client.spool.has_pending())
+
+        items, _ = client.spool.read(10)
+        self.assertEqual([str(i) for i in range(5)], [item["name"] for item in items])
+
+        # Пока есть файл-очередь, новые уведомления добавляются в нее же
+        self.server.start()
+        for i in range(5, 7):
+            client.add_notify(str(i), "message")
+
+        for _ in range(100):
+            if not client.spool.has_pending() and len(self.server.get_names()) == 7:
+                break
+            time.sleep(0.05)
+
+        client.close()
+
+        self.assertEqual([str(i) for i in range(7)], self.server.get_names())
+        self.assertFalse(client.spool.has_pending())
+        self.assertEqual(0, self.spool_path.stat().st_size)
+
+    def test_spool_after_restart(self) -> None:
+        Spool(self.spool_path).append([{"name": "0", "message": "message"}])
+
+        self.server.start()
+        with NotifyClient(
+            self.server.url, attempts_timeouts=[0.05], spool_path=self.spool_path
+        ) as client:
+            for _ in range(100):
+                if not client.spool.has_pending():
+                    break
+                time.sleep(0.05)
+
+        self.assertEqual(["0"], self.server.get_names())
+
+    def test_send_spool(self) -> None:
+        # Файл-очередь скрипта, который больше не запускается
+        Spool(self.spool_path).append(
+            [{"name": str(i), "message": "message"} for i in range(3)]
+        )
+
+        with NotifyClient(
+            f"http://127.0.0.1:{self.port}", attempts_timeouts=[]
+        ) as client:
+            self.assertFalse(client.send_spool(self.spool_path))
+
+            self.server.start()
+            self.assertTrue(client.send_spool(self.spool_path))
+
+        self.assertEqual(["0", "1", "2"], self.server.get_names())
+
+
+class TestDbDataChangeWatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = str(Path(self.temp_dir.name) / "database.sqlite")
+
+        self.models = [
+            NotificationGroup,
+            Notification,
+            NotificationArchive,
+            NotificationStats,
+        ]
+        self.test_db = SqliteDatabase(self.db_path, pragmas={"journal_mode": "wal"})
+        self.test_db.bind(self.models, bind_refs=False, bind_backrefs=False)
+        self.test_db.connect()
+        self.test_db.create_tables(self.models)
+
+        HTML_CACHE.clear()
+
+    def tearDown(self) -> None:
+        self.test_db.close()
+        self.temp_dir.cleanup()
+
+    def test_wait(self) -> None:
+        watcher = DataChangeWatcher(Notification, interval=0.001)
+
+        with self.subTest("First call"):
+            self.assertTrue(watcher.wait(timeout=0))
+
+        with self.subTest("Without changes"):
+            self.assertFalse(watcher.wait(timeout=0.01))
+
+        with self.subTest("Changes from other connection"):
+            with sqlite3.connect(self.db_path) as connect:
+                connect.execute(
+                    "INSERT INTO notification (chat_id, name, message, type, "
+                    "has_delete_button, show_type, append_datetime, need_html_escape_content) "
+                    "VALUES (1, 'test', 'message', 'INFO', 0, 1, '2026-01-01 00:00:00', 1)"
+                )
+            connect.close()
+
+            self.assertTrue(watcher.wait(timeout=1))
+            self.assertEqual(1, len(Notification.get_unsent()))
+            self.assertFalse(watcher.wait(timeout=0.01))
+
+        with self.subTest("Notify"):
+            watcher.notify()
+            self.assertTrue(watcher.wait(timeout=0.01))
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter(self) -> None:
+        registry = Registry()
+        counter = Counter(
+            "test_total", "Test", label_names=("type",), registry=registry
+        )
+
+        # Каждый поток изменяет свои значения, при выводе они суммируются
+        def run() -> None:
+            for _ in range(1000):
+                counter.inc(labels=("a",))
+            counter.inc(2, labels=("b",))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(4000, counter.get(("a",)))
+        self.assertEqual(8, counter.get(("b",)))
+        self.assertEqual(
+            "# HELP test_total Test\n"
+            "# TYPE test_total counter\n"
+            'test_total{type="a"} 4000\n'
+            'test_total{type="b"} 8\n',
+            registry.render(),
+        )
+
+        with self.subTest("Duplicate"):
+            with self.assertRaises(Exception):
+                Counter("test_total", "Test", registry=registry)
+
+    def test_gauge(self) -> None:
+        registry = Registry()
+
+        gauge = Gauge("test_value", "Test", registry=registry)
+        gauge.set(1.5)
+        self.assertEqual(1.5, gauge.get())
+
+        Gauge("test_func", "Test", func=lambda: 3, registry=registry)
+
+        lines = registry.render().splitlines()
+        self.assertIn("test_value 1.5", lines)
+        self.assertIn("test_func 3", lines)
+
+    def test_histogram(self) -> None:
+        registry = Registry()
+        histogram = Histogram(
+            "test_seconds", "Test", buckets=(0.1, 1), registry=registry
+        )
+
+        for value in [0.05, 0.1, 0.5, 2]:
+            histogram.observe(value)
+
+        thread = threading.Thread(target=histogram.observe, args=(0.5,))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(
+            [
+                "# HELP test_seconds Test",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{le="0.1"} 2',
+                'test_seconds_bucket{le="1"} 4',
+                'test_seconds_bucket{le="+Inf"} 5',
+                "test_seconds_sum 3.15",
+                "test_seconds_count 5",
+            ],
+            registry.render().splitlines(),
+        )
+
+
+class TestProfiling(unittest.TestCase):
+    def test_timings(self) -> None:
+        timings = Timings(max_size=3)
+
+        with timings.span("a"):
+            time.sleep(0.01)
+
+        func = timings.wrap("b", lambda x: x * 2)
+        self.assertEqual(4, func(2))
+
+        with self.assertRaises(ZeroDivisionError):
+            with timings.span("c"):
+                1 / 0
+
+        self.assertEqual(["a", "b", "c"], [span.name for span in timings.spans])
+
+        stats = timings.get_stats()
+        self.assertEqual(1, stats["a"]["number"])
+        self.assertGreaterEqual(stats["a"]["total"], 0.01)
+
+        with self.subTest("Ring buffer"):
+            with timings.span("d"):
+                pass
+            self.assertEqual(["b", "c", "d"], [span.name for span in timings.spans])
+
+        with self.subTest("Last seconds"):
+            self.assertEqual(dict(), timings.get_stats(seconds=-1))
+            self.assertIn("d", timings.format_stats(seconds=60))
+
+    def test_sampling_profiler(self) -> None:
+        def busy_function_for_profiler(event: threading.Event) -> None:
+            while not event.is_set():
+                sum(range(1000))
+
+        event = threading.Event()
+        thread = threading.Thread(target=busy_function_for_profiler, args=(event,))
+        thread.start()
+
+        profiler = SamplingProfiler(interval=0.001, top_number=10)
+        results = []
+        try:
+            other = threading.Thread(target=lambda: results.append(profiler.run(0.3)))
+            other.start()
+            time.sleep(0.05)
+
+            # Одновременно выполняется только одно профилирование
+            self.assertIsNone(profiler.run(0.1))
+
+            other.join()
+        finally:
+            event.set()
+            thread.join()
+
+        self.assertIn("busy_function_for_profiler", results[0])
+
+
+class TestFakeBotApi(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = FakeBotApi()
+        self.server.start()
+
+        self.bot = Bot("123:fake", base_url=self.server.base_url)
+
+    def tearDown(self) -> None:
+        self.bot.request.stop()
+        self.server.stop()
+
+    def test_send_message(self) -> None:
+        self.assertEqual("fake_bot", self.bot.username)
+
+        message = self.bot.send_message(chat_id=1, text="Hello")
+        self.assertEqual(1, message.chat_id)
+        self.assertEqual("Hello", message.text)
+
+        requests = self.server.get_requests("sendMessage")
+        self.assertEqual(1, len(requests))
+        self.assertEqual("Hello", requests[0].params["text"])
+        self.assertEqual(200, requests[0].status)
+
+        with self.subTest("Document"):
+            message = self.bot.send_document(
+                chat_id=1, document=b"content", filename="report.txt"
+            )
+            self.assertEqual("report.txt", message.document.file_name)
+
+            requests = self.server.get_requests("sendDocument")
+            self.assertEqual(b"content", requests[0].params["document"]["content"])
+
+    def test_edit_message(self) -> None:
+        message = self.bot.send_message(chat_id=1, text="Hello")
+
+        self.bot.edit_message_text("World", chat_id=1, message_id=message.message_id)
+
+        with self.assertRaises(BadRequest) as cm:
+            self.bot.edit_message_text(
+                "World", chat_id=1, message_id=message.message_id
+            )
+        self.assertIn("Message is not modified", str(cm.exception))
+
+    def test_errors(self) -> None:
+        self.server.retry_after = 3
+        self.server.fail_next(ERROR_RETRY_AFTER, method="sendMessage")
+        with self.assertRaises(RetryAfter) as cm:
+            self.bot.send_message(chat_id=1, text="Hello")
+        self.assertEqual(3, cm.exception.retry_after)
+
+        self.server.fail_next(ERROR_SERVER)
+        with self.assertRaises(NetworkError):
+            self.bot.send_message(chat_id=1, text="Hello")
+
+        # Ошибки закончились
+        self.bot.send_message(chat_id=1, text="Hello")
+
+        statuses = [r.status for r in self.server.get_requests("sendMessage")]
+        self.assertEqual([429, 500, 200], statuses)
+
+    def test_get_updates(self) -> None:
+        update_id = self.server.put_update(
+            {
+                "message": {
+                    "message_id": 1,
+                    "date": 0,
+                    "chat": {"id": 1, "type": "private"},
+                    "text": "/start",
+                }
+            }
+        )
+
+        updates = self.bot.get_updates(timeout=1)
+        self.assertEqual([update_id], [u.update_id for u in updates])
+        self.assertEqual("/start", updates[0].message.text)
+
+        # Подтвержденные обновления больше не возвращаются
+        self.assertEqual([], self.bot.get_updates(offset=update_id + 1, timeout=0))
+
+
+class TestProfileCommand(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = FakeBotApi()
+        self.server.start()
+
+        self.admin_id = 1
+
+        with (
+            unittest.mock.patch.object(BotMain, "TOKEN", "123:fake"),
+            unittest.mock.patch.dict(BotMain.DATA),
+        ):
+            self.updater = BotMain.create_updater(base_url=self.server.base_url)
+
+        self.patchers = [
+            unittest.mock.patch(
+                "telegram_notifications_bot.config.USER_ID", self.admin_id
+            ),
+            unittest.mock.patch.object(
+                BotMain, "PROFILER", SamplingProfiler(interval=0.01, top_number=5)
+            ),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.updater.start_polling(poll_interval=0, timeout=1)
+
+    def tearDown(self) -> None:
+        self.updater.stop()
+        for patcher in self.patchers:
+            patcher.stop()
+        self.server.stop()
+
+    def send_command(self, user_id: int, text: str) -> None:
+        self.server.put_update(
+            {
+                "message": {
+                    "message_id": 1,
+                    "date": 0,
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+                    "text": text,
+                    "entities": [
+                        {
+                            "type": "bot_command",
+                            "offset": 0,
+                            "length": len(text.split()[0]),
+                        }
+                    ],
+                }
+            }
+        )
+
+    def test_access_denied(self) -> None:
+        self.send_command(self.admin_id + 1, "/profile 1")
+
+        requests = self.server.wait_requests("sendMessage", 1, timeout=10)
+        self.assertEqual(MESSAGE_ACCESS_DENIED, requests[0].params["text"])
+        self.assertEqual([], self.server.get_requests("sendDocument"))
+
+    def test_profile(self) -> None:
+        self.send_command(self.admin_id, "/profile 1")
+
+        requests = self.server.wait_requests("sendDocument", 1, timeout=10)
+        self.assertEqual(1, len(requests))
+
+        document = requests[0].params["document"]
+        self.assertTrue(document["file_name"].startswith("profile_"))
+
+        text = document["content"].decode("utf-8")
+        self.assertIn("Профилирование: ", text)
+        self.assertIn("Этапы за последние 1 сек.:", text)
+
+        messages = self.server.get_requests("sendMessage")
+        self.assertEqual("Профилирование 1 сек...", messages[0].params["text"])
+
+
 if __name__ == "__main__":
     unittest.main()